@@ -0,0 +1,127 @@
+import os
+import sys
+sys.path.insert(
+    0,
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(
+                os.path.abspath(__file__)),
+            '../')))
+
+import argparse
+import importlib
+import re
+from timeit import default_timer as timer
+
+from bench.common import write_result
+from syntellix_api.rag.utils.memory_utils import peak_rss, reset_peak_rss
+
+
+def dummy(prog=None, msg=""):
+    pass
+
+
+def count_pages(fnm, binary):
+    """
+    Pages of paged formats, None for the others.
+    """
+    if re.search(r"\.pdf$", fnm, re.IGNORECASE):
+        from io import BytesIO
+
+        from pypdf import PdfReader
+        return len(PdfReader(BytesIO(binary)).pages)
+    if re.search(r"\.pptx$", fnm, re.IGNORECASE):
+        from io import BytesIO
+
+        from pptx import Presentation
+        return len(Presentation(BytesIO(binary)).slides)
+    return None
+
+
+def list_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, f) for f in sorted(os.listdir(path))
+                         if os.path.isfile(os.path.join(path, f)))
+        else:
+            files.append(path)
+    return files
+
+
+def run_parser(args, name, files):
+    """
+    Chunk every file the parser supports, unsupported files are skipped.
+    """
+    parser = importlib.import_module(f"syntellix_api.rag.app.{name}")
+    res = {"files": 0, "skipped": 0, "failed": 0, "bytes": 0, "pages": 0, "paged_seconds": 0.0,
+           "chunks": 0, "seconds": 0.0, "peak_rss_mb": 0.0}
+    for fnm in files:
+        with open(fnm, "rb") as f:
+            binary = f.read()
+        reset_peak_rss()
+        st = timer()
+        try:
+            chunks = parser.chunk(os.path.basename(fnm), binary=binary, lang=args.lang,
+                                  parser_config={"chunk_token_num": args.chunk_token_num},
+                                  callback=dummy)
+        except NotImplementedError:
+            res["skipped"] += 1
+            continue
+        except Exception as e:
+            print(f"{name}: {fnm} failed: {e}", file=sys.stderr)
+            res["failed"] += 1
+            continue
+        elapsed = timer() - st
+        res["files"] += 1
+        res["bytes"] += len(binary)
+        res["chunks"] += len(chunks or [])
+        res["seconds"] += elapsed
+        res["peak_rss_mb"] = max(res["peak_rss_mb"], peak_rss() / 1024 / 1024)
+        pages = count_pages(fnm, binary)
+        if pages:
+            res["pages"] += pages
+            res["paged_seconds"] += elapsed
+
+    seconds, paged_seconds = res["seconds"], res.pop("paged_seconds")
+    res.update(
+        seconds=round(seconds, 2),
+        peak_rss_mb=round(res["peak_rss_mb"], 1),
+        chunks_per_s=round(res["chunks"] / seconds, 2) if seconds else None,
+        mb_per_s=round(res["bytes"] / 1024 / 1024 / seconds, 3) if seconds else None,
+        # only paged formats count for pages/s
+        pages_per_s=round(res["pages"] / paged_seconds, 2) if paged_seconds else None,
+    )
+    return res
+
+
+def main(args):
+    paths = args.files or [os.path.join(args.fixtures, "ingest")]
+    files = list_files(paths)
+    if not files:
+        sys.exit(f"No files in {', '.join(paths)}, generate them with bench/corpus.py --ingest_files")
+
+    results = {}
+    for name in args.parsers.split(","):
+        results[name] = run_parser(args, name, files)
+        print(f"{name}: {results[name]}", file=sys.stderr)
+
+    config = {name: value for name, value in vars(args).items() if name != "out"}
+    config["files"] = [os.path.relpath(fnm) for fnm in files]
+    write_result(args.out, "ingest", config, results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Ingest throughput of the rag/app parsers: chunks/s, MB/s and pages/s of paged formats.")
+    parser.add_argument('--files', help="Files or directories to ingest. Default: bench/fixtures/ingest",
+                        nargs="*", default=None)
+    parser.add_argument('--fixtures', help="Default: bench/fixtures",
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures"))
+    parser.add_argument('--out', help="JSON result file", default=None)
+    parser.add_argument('--parsers', help="Comma separated rag/app modules. Default: naive,one,book,laws,qa,table",
+                        default="naive,one,book,laws,qa,table")
+    parser.add_argument('--lang', help="Default: Chinese", default="Chinese")
+    parser.add_argument('--chunk_token_num', help="Default: 128", type=int, default=128)
+    args = parser.parse_args()
+    main(args)
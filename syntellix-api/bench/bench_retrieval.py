@@ -0,0 +1,235 @@
+import os
+import sys
+sys.path.insert(
+    0,
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(
+                os.path.abspath(__file__)),
+            '../')))
+
+import argparse
+from timeit import default_timer as timer
+
+from elasticsearch import Elasticsearch
+
+from bench.common import dedup, latency, load_jsonl, ndcg_at_k, recall_at_k, write_result
+from syntellix_api.rag.llm.embedding_model_local import EmbeddingModel
+from syntellix_api.rag.llm.rerank_model_local import RerankModel
+from syntellix_api.rag.vector_database.elasticsearch.elasticsearch_vector import (
+    ElasticSearchIndexConfig, ElasticSearchVector)
+from syntellix_api.rag.vector_database.vector_model import BaseNode
+
+KNOWLEDGE_BASE_ID = "bench"
+ES_FILTER = [{"terms": {"metadata.knowledge_base_id": [KNOWLEDGE_BASE_ID]}}]
+
+
+def build_index(args, es, corpus, embedding_model):
+    vector = ElasticSearchVector(
+        args.index,
+        None,
+        text_analysis=args.text_analysis,
+        index_config=ElasticSearchIndexConfig(
+            layout="shared",
+            number_of_replicas=0,
+            vector_index_type=args.vector_index_type,
+        ),
+        client=es,
+    )
+    if args.reuse_index and es.indices.exists(index=args.index):
+        return vector, None
+    es.indices.delete(index=args.index, ignore_unavailable=True)
+
+    st = timer()
+    texts = [doc["text"] for doc in corpus]
+    embeddings = embedding_model.encode(texts)
+    tokens = None
+    if args.text_analysis == "pretokenized":
+        from syntellix_api.rag.nlp import rag_tokenizer
+        tokens = rag_tokenizer.tokenize_batch(texts, fine_grained=True)
+    for i in range(0, len(corpus), args.index_batch_size):
+        nodes = []
+        for j in range(i, min(i + args.index_batch_size, len(corpus))):
+            node = BaseNode(
+                content=texts[j],
+                contextualized_content="",
+                embedding=embeddings[j].tolist(),
+                metadata={"knowledge_base_id": KNOWLEDGE_BASE_ID, "document_id": corpus[j]["id"]},
+            )
+            if tokens:
+                node.tokens = {"content_ltks": tokens[j][0], "content_sm_ltks": tokens[j][1]}
+            nodes.append(node)
+        vector.add(nodes)
+    es.indices.refresh(index=args.index)
+    return vector, timer() - st
+
+
+def num_candidates(args, index_size, recall_k):
+    # RAGService._num_candidates with the benchmark settings
+    return max(recall_k, min(
+        max(recall_k * args.num_candidates_factor, int(index_size * args.num_candidates_ratio)),
+        args.max_num_candidates,
+    ))
+
+
+def rerank(nodes, scores, k):
+    ranked = sorted(zip(scores, range(len(nodes)), nodes), key=lambda x: x[0], reverse=True)
+    return [node for _, _, node in ranked][:k]
+
+
+def run_queries(args, mode, vector, queries, embedding_model, rerank_model, index_size):
+    """
+    Every query on its own: embedding, first stage search and reranking, timed
+    stage by stage.
+    """
+    recall_k = args.recall_k if mode == "two_stage" else args.k
+    timings = {"embed": [], "search": [], "rerank": [], "total": []}
+    first_stage, final, timeouts = [], [], 0
+    for q in queries:
+        st = timer()
+        embedding = embedding_model.encode([q["query"]])[0].tolist()
+        timings["embed"].append(timer() - st)
+
+        query = {
+            "query_str": q["query"],
+            "query_embedding": embedding,
+            "similarity_top_k": args.k,
+            "timeout_ms": args.timeout_ms,
+        }
+        if mode == "two_stage":
+            query["recall_k"] = recall_k
+            query["num_candidates"] = num_candidates(args, index_size, recall_k)
+        stats = {}
+        st = timer()
+        nodes, _, _ = vector.query(query, ES_FILTER, stats=stats)
+        timings["search"].append(timer() - st)
+        timeouts += int(stats["timed_out"])
+
+        st = timer()
+        scores = rerank_model.similarity_pairs([(q["query"], node.content) for node in nodes])
+        reranked = rerank(nodes, scores, args.k)
+        timings["rerank"].append(timer() - st)
+        timings["total"].append(sum(timings[stage][-1] for stage in ("embed", "search", "rerank")))
+
+        first_stage.append(dedup(node.metadata["document_id"] for node in nodes))
+        final.append(dedup(node.metadata["document_id"] for node in reranked))
+
+    return {
+        "recall_k": recall_k,
+        "latency": {stage: latency(seconds) for stage, seconds in timings.items()},
+        "timeouts": timeouts,
+        "first_stage_recall": recall_at_k(first_stage, [q["relevant"] for q in queries], recall_k),
+        f"recall@{args.k}": recall_at_k(final, [q["relevant"] for q in queries], args.k),
+        f"ndcg@{args.k}": ndcg_at_k(final, [q["relevance"] for q in queries], args.k),
+    }
+
+
+def run_batch(args, vector, queries, embedding_model, rerank_model, index_size):
+    """
+    Two stage retrieval of all queries the way RAGService.retrieve_batch does
+    it, in batches of `batch_size` queries.
+    """
+    final = []
+    st = timer()
+    for i in range(0, len(queries), args.batch_size):
+        batch = queries[i:i + args.batch_size]
+        embeddings = embedding_model.encode([q["query"] for q in batch])
+        results = vector.query_batch([
+            {
+                "query_str": q["query"],
+                "query_embedding": embedding.tolist(),
+                "similarity_top_k": args.k,
+                "recall_k": args.recall_k,
+                "num_candidates": num_candidates(args, index_size, args.recall_k),
+                "timeout_ms": args.timeout_ms,
+            }
+            for q, embedding in zip(batch, embeddings)
+        ], ES_FILTER)
+        scores = rerank_model.similarity_pairs([
+            (q["query"], node.content) for q, (nodes, _, _) in zip(batch, results) for node in nodes
+        ])
+        offset = 0
+        for nodes, _, _ in results:
+            reranked = rerank(nodes, scores[offset:offset + len(nodes)], args.k)
+            offset += len(nodes)
+            final.append(dedup(node.metadata["document_id"] for node in reranked))
+    elapsed = timer() - st
+
+    return {
+        "recall_k": args.recall_k,
+        "seconds": round(elapsed, 2),
+        "queries_per_s": round(len(queries) / elapsed, 2),
+        f"recall@{args.k}": recall_at_k(final, [q["relevant"] for q in queries], args.k),
+        f"ndcg@{args.k}": ndcg_at_k(final, [q["relevance"] for q in queries], args.k),
+    }
+
+
+def main(args):
+    corpus = load_jsonl(os.path.join(args.fixtures, "corpus.jsonl"))
+    queries = load_jsonl(os.path.join(args.fixtures, "queries.jsonl"))[:args.max_queries or None]
+
+    es = Elasticsearch(
+        hosts=args.host,
+        basic_auth=(args.username, args.password) if args.username else None,
+        request_timeout=600,
+    )
+    embedding_model = EmbeddingModel(model_name=args.embedding_model, dimensions=args.dimensions)
+    rerank_model = RerankModel(model_name=args.rerank_model)
+    rerank_model.initialize_model()
+
+    vector, index_seconds = build_index(args, es, corpus, embedding_model)
+    index_size = vector.count()
+    results = {"index": {"docs": index_size, "seconds": index_seconds and round(index_seconds, 2)}}
+
+    # warm up the models and the index caches
+    run_queries(args, "single", vector, queries[:args.warmup], embedding_model, rerank_model, index_size)
+    for mode in args.modes.split(","):
+        if mode == "batch":
+            results[mode] = run_batch(args, vector, queries, embedding_model, rerank_model, index_size)
+        else:
+            results[mode] = run_queries(args, mode, vector, queries, embedding_model, rerank_model, index_size)
+
+    if not args.keep:
+        es.indices.delete(index=args.index)
+
+    config = {name: value for name, value in vars(args).items() if name not in ("password", "out")}
+    config.update(docs=len(corpus), queries=len(queries))
+    write_result(args.out, "retrieval", config, results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Latency per stage, recall@k and nDCG@k of single and two stage retrieval and of batch "
+                    "retrieval, on the corpus of bench/corpus.py.")
+    parser.add_argument('--fixtures', help="Directory of corpus.jsonl and queries.jsonl. Default: bench/fixtures",
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures"))
+    parser.add_argument('--out', help="JSON result file", default=None)
+    parser.add_argument('--modes', help="Comma separated modes of single, two_stage and batch. "
+                        "Default: single,two_stage,batch", default="single,two_stage,batch")
+    parser.add_argument('--embedding_model', help="Default: BAAI/bge-small-zh-v1.5", default="BAAI/bge-small-zh-v1.5")
+    parser.add_argument('--dimensions', help="Truncated embedding dimensions, 0 keeps them all. Default: 0",
+                        type=int, default=0)
+    parser.add_argument('--rerank_model', help="Default: BAAI/bge-reranker-base", default="BAAI/bge-reranker-base")
+    parser.add_argument('--host', help="Default: http://127.0.0.1:9200", default="http://127.0.0.1:9200")
+    parser.add_argument('--username', help="Default: elastic", default="elastic")
+    parser.add_argument('--password', help="Default: elastic", default="elastic")
+    parser.add_argument('--index', help="Default: bench_retrieval", default="bench_retrieval")
+    parser.add_argument('--reuse_index', help="Search the index of a previous run as is", action="store_true")
+    parser.add_argument('--keep', help="Keep the index", action="store_true")
+    parser.add_argument('--text_analysis', help="ik needs the IK plugin. Default: pretokenized",
+                        choices=["ik", "pretokenized"], default="pretokenized")
+    parser.add_argument('--vector_index_type', help="Default: int8_hnsw", default="int8_hnsw")
+    parser.add_argument('--k', help="top_n of the final results. Default: 5", type=int, default=5)
+    parser.add_argument('--recall_k', help="Default: 30", type=int, default=30)
+    parser.add_argument('--num_candidates_factor', help="Default: 4", type=int, default=4)
+    parser.add_argument('--num_candidates_ratio', help="Default: 0.01", type=float, default=0.01)
+    parser.add_argument('--max_num_candidates', help="Default: 2000", type=int, default=2000)
+    parser.add_argument('--timeout_ms', help="First stage budget, 0 for none. Default: 0", type=int, default=0)
+    parser.add_argument('--batch_size', help="Queries per batch of the batch mode. Default: 100",
+                        type=int, default=100)
+    parser.add_argument('--index_batch_size', help="Default: 500", type=int, default=500)
+    parser.add_argument('--max_queries', help="Only run the first queries, 0 for all. Default: 0",
+                        type=int, default=0)
+    parser.add_argument('--warmup', help="Queries run before measuring. Default: 5", type=int, default=5)
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,107 @@
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+import numpy as np
+
+
+def load_jsonl(fnm):
+    with open(fnm, encoding="utf-8") as f:
+        return [json.loads(l) for l in f if l.strip()]
+
+
+def write_jsonl(fnm, rows):
+    with open(fnm, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+def latency(seconds):
+    """
+    p50, p95 and mean of latencies in seconds, in milliseconds.
+    """
+    if not len(seconds):
+        return {"p50_ms": None, "p95_ms": None, "mean_ms": None}
+    ms = np.asarray(seconds) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(ms, 95)), 2),
+        "mean_ms": round(float(np.mean(ms)), 2),
+    }
+
+
+def recall_at_k(results, relevance, k):
+    """
+    Mean share of the relevant documents of every query found in its top `k`
+    results, over the queries with relevant documents. `relevance` maps the
+    relevant document ids of every query to their grade.
+    """
+    scores = [
+        len(set(res[:k]) & set(rel)) / min(k, len(rel))
+        for res, rel in zip(results, relevance) if rel
+    ]
+    return round(float(np.mean(scores)), 4) if scores else 0.0
+
+
+def ndcg_at_k(results, relevance, k):
+    """
+    Mean normalized discounted cumulative gain of the top `k` results, with
+    graded relevance. A document listed twice only counts once.
+    """
+    scores = []
+    for res, rel in zip(results, relevance):
+        if not rel:
+            continue
+        seen, dcg = set(), 0.0
+        for i, doc_id in enumerate(res[:k]):
+            if doc_id in seen:
+                continue
+            seen.add(doc_id)
+            dcg += (2 ** rel.get(doc_id, 0) - 1) / math.log2(i + 2)
+        ideal = sorted(rel.values(), reverse=True)[:k]
+        idcg = sum((2 ** g - 1) / math.log2(i + 2) for i, g in enumerate(ideal))
+        scores.append(dcg / idcg if idcg else 0.0)
+    return round(float(np.mean(scores)), 4) if scores else 0.0
+
+
+def dedup(ids):
+    # chunk hits of a document count once, at their best rank
+    return list(dict.fromkeys(ids))
+
+
+def _git(*args):
+    try:
+        return subprocess.check_output(
+            ["git", *args], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def metadata():
+    """
+    What a result was measured on, to compare results across commits.
+    """
+    return {
+        "commit": _git("rev-parse", "HEAD"),
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def write_result(fnm, bench, config, results):
+    result = {"bench": bench, "meta": metadata(), "config": config, "results": results}
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if fnm:
+        os.makedirs(os.path.dirname(os.path.abspath(fnm)), exist_ok=True)
+        with open(fnm, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+    return result
@@ -0,0 +1,80 @@
+import argparse
+import json
+import sys
+
+
+def direction(name):
+    """
+    1 when a higher value of the metric is better, -1 when lower is better,
+    None for values that are not compared.
+    """
+    if name.endswith("_ms") or name in ("seconds", "timeouts", "failed", "peak_rss_mb"):
+        return -1
+    if name.endswith("_per_s") or name.startswith(("recall", "ndcg", "first_stage_recall")):
+        return 1
+    return None
+
+
+def flatten(results, prefix=""):
+    for name, value in results.items():
+        if isinstance(value, dict):
+            yield from flatten(value, f"{prefix}{name}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f"{prefix}{name}", name, value
+
+
+def compare(baseline, current, tolerance, quality_tolerance):
+    """
+    The metrics of `current` worse than in `baseline` beyond the tolerances:
+    relative for latencies and throughputs, absolute for recall and nDCG.
+    """
+    base = {path: value for path, _, value in flatten(baseline["results"])}
+    rows, regressions = [], []
+    for path, name, value in flatten(current["results"]):
+        sign = direction(name)
+        if sign is None or base.get(path) is None:
+            continue
+        old = base[path]
+        if name.startswith(("recall", "ndcg", "first_stage_recall")):
+            worse = (old - value) * sign > quality_tolerance
+        else:
+            worse = (old - value) * sign > tolerance * abs(old)
+        change = f"{(value - old) / abs(old) * 100:+.1f}%" if old else "n/a"
+        rows.append((path, old, value, change, "REGRESSION" if worse else ""))
+        if worse:
+            regressions.append(path)
+    return rows, regressions
+
+
+def main(args):
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+    if baseline["bench"] != current["bench"]:
+        sys.exit(f"Cannot compare a {baseline['bench']} result with a {current['bench']} result")
+    if baseline["config"] != current["config"]:
+        changed = sorted(k for k in set(baseline["config"]) | set(current["config"])
+                         if baseline["config"].get(k) != current["config"].get(k))
+        print(f"warning: configs differ in {', '.join(changed)}")
+
+    print(f"baseline {baseline['meta'].get('commit')}, current {current['meta'].get('commit')}")
+    rows, regressions = compare(baseline, current, args.tolerance, args.quality_tolerance)
+    width = max((len(row[0]) for row in rows), default=0)
+    for path, old, new, change, flag in rows:
+        print(f"{path:<{width}}\t{old}\t{new}\t{change}\t{flag}")
+    if regressions:
+        print(f"{len(regressions)} regressions")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare two benchmark results, exits with 1 when a metric regressed.")
+    parser.add_argument('baseline', help="JSON result of the baseline commit")
+    parser.add_argument('current', help="JSON result to check")
+    parser.add_argument('--tolerance', help="Relative slowdown allowed. Default: 0.15", type=float, default=0.15)
+    parser.add_argument('--quality_tolerance', help="Absolute recall and nDCG drop allowed. Default: 0.01",
+                        type=float, default=0.01)
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,147 @@
+import os
+import sys
+sys.path.insert(
+    0,
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(
+                os.path.abspath(__file__)),
+            '../')))
+
+import argparse
+import csv
+import io
+import random
+
+from bench.common import write_jsonl
+
+# facts are stated as "the <attribute> of <subject> is <value>", queries ask
+# for the attribute of a subject, which other documents mention with other facts
+TEMPLATES = {
+    "zh": {
+        "fact": "{subject}的{attribute}是{value}。",
+        "query": "{subject}的{attribute}是什么？",
+        "attributes": ["负责人", "预算", "截止日期", "所在城市", "供应商", "版本号", "审批部门", "合同编号"],
+        "subject_prefixes": ["项目", "系统", "平台", "工厂", "实验室", "基金", "产品线", "仓库"],
+        "words": ["数据", "分析", "模型", "检索", "增强", "生成", "文档", "解析", "流程", "管理", "客户",
+                  "质量", "安全", "成本", "效率", "培训", "采购", "物流", "市场", "研发", "服务", "运营"],
+        "sentence_end": "。",
+        "joiner": "",
+    },
+    "en": {
+        "fact": "The {attribute} of {subject} is {value}.",
+        "query": "What is the {attribute} of {subject}?",
+        "attributes": ["owner", "budget", "deadline", "city", "supplier", "version", "approver", "contract number"],
+        "subject_prefixes": ["Project", "System", "Platform", "Plant", "Lab", "Fund", "Product line", "Warehouse"],
+        "words": ["data", "analysis", "model", "retrieval", "report", "document", "process", "management",
+                  "customer", "quality", "security", "cost", "efficiency", "training", "purchase", "logistics",
+                  "market", "research", "service", "operations", "review", "schedule"],
+        "sentence_end": ".",
+        "joiner": " ",
+    },
+}
+
+
+def filler(rnd, t, sentences):
+    return "".join(
+        t["joiner"].join(rnd.choices(t["words"], k=rnd.randint(6, 18))) + t["sentence_end"]
+        for _ in range(sentences)
+    )
+
+
+def value(rnd):
+    return f"{rnd.choice('ABCDEFGHJKLMNPQRSTUVWXYZ')}{rnd.randint(1000, 9999)}"
+
+
+def generate(docs, queries, lang="zh", seed=0, facts_per_subject=3):
+    """
+    A corpus of `docs` documents about synthetic subjects and `queries`
+    labelled queries. Every subject is described by `facts_per_subject`
+    documents stating different facts, so that a query has one document
+    answering it (grade 2) and hard negatives on the same subject (grade 1).
+    """
+    rnd = random.Random(seed)
+    t = TEMPLATES[lang]
+    corpus, facts = [], []
+    subjects = (docs + facts_per_subject - 1) // facts_per_subject
+    for s in range(subjects):
+        subject = f"{rnd.choice(t['subject_prefixes'])}{t['joiner']}{rnd.choice('ABCDEFGH')}-{s}"
+        attributes = rnd.sample(t["attributes"], facts_per_subject)
+        subject_facts = []
+        for attribute in attributes:
+            if len(corpus) == docs:
+                break
+            doc_id = str(len(corpus))
+            fact = t["fact"].format(subject=subject, attribute=attribute, value=value(rnd))
+            sentences = [filler(rnd, t, 1) for _ in range(rnd.randint(3, 8))]
+            sentences.insert(rnd.randint(0, len(sentences)), fact)
+            corpus.append({"id": doc_id, "title": subject, "text": t["joiner"].join(sentences)})
+            subject_facts.append((attribute, doc_id))
+        doc_ids = [doc_id for _, doc_id in subject_facts]
+        facts.extend((subject, attribute, doc_id, doc_ids) for attribute, doc_id in subject_facts)
+
+    labelled = []
+    for subject, attribute, doc_id, doc_ids in rnd.sample(facts, min(queries, len(facts))):
+        labelled.append({
+            "query": t["query"].format(subject=subject, attribute=attribute),
+            # relevant documents answer the query, for recall and the vector option benchmarks
+            "relevant": [doc_id],
+            "relevance": {i: 2 if i == doc_id else 1 for i in doc_ids},
+        })
+    return corpus, labelled
+
+
+def write_ingest_files(out_dir, corpus, docs_per_file=100):
+    """
+    The corpus as txt, markdown, html, csv and docx files, the inputs of the
+    ingestion benchmark.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    for n, i in enumerate(range(0, len(corpus), docs_per_file)):
+        part = corpus[i:i + docs_per_file]
+        with open(os.path.join(out_dir, f"corpus_{n}.txt"), "w", encoding="utf-8") as f:
+            f.write("\n\n".join(doc["text"] for doc in part))
+        with open(os.path.join(out_dir, f"corpus_{n}.md"), "w", encoding="utf-8") as f:
+            f.write("\n\n".join(f"## {doc['title']}\n\n{doc['text']}" for doc in part))
+        with open(os.path.join(out_dir, f"corpus_{n}.html"), "w", encoding="utf-8") as f:
+            f.write("<html><body>" + "".join(
+                f"<h2>{doc['title']}</h2><p>{doc['text']}</p>" for doc in part) + "</body></html>")
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(["id", "title", "text", "length"])
+        for doc in part:
+            writer.writerow([doc["id"], doc["title"], doc["text"], len(doc["text"])])
+        with open(os.path.join(out_dir, f"corpus_{n}.csv"), "w", encoding="utf-8") as f:
+            f.write(buf.getvalue())
+
+        from docx import Document
+        document = Document()
+        for doc in part:
+            document.add_heading(doc["title"], level=2)
+            document.add_paragraph(doc["text"])
+        document.save(os.path.join(out_dir, f"corpus_{n}.docx"))
+
+
+def main(args):
+    corpus, queries = generate(args.docs, args.queries, args.lang, args.seed)
+    os.makedirs(args.out, exist_ok=True)
+    write_jsonl(os.path.join(args.out, "corpus.jsonl"), corpus)
+    write_jsonl(os.path.join(args.out, "queries.jsonl"), queries)
+    if args.ingest_files:
+        write_ingest_files(os.path.join(args.out, "ingest"), corpus, args.docs_per_file)
+    print(f"{len(corpus)} docs, {len(queries)} queries in {args.out}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate the synthetic corpus and labelled queries of the benchmarks.")
+    parser.add_argument('--out', help="Default: bench/fixtures",
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures"))
+    parser.add_argument('--docs', help="Default: 3000", type=int, default=3000)
+    parser.add_argument('--queries', help="Default: 300", type=int, default=300)
+    parser.add_argument('--lang', help="Default: zh", choices=list(TEMPLATES), default="zh")
+    parser.add_argument('--seed', help="Default: 0", type=int, default=0)
+    parser.add_argument('--ingest_files', help="Also write the corpus as files to ingest", action="store_true")
+    parser.add_argument('--docs_per_file', help="Default: 100", type=int, default=100)
+    args = parser.parse_args()
+    main(args)
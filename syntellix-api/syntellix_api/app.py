@@ -8,6 +8,7 @@ from logging.handlers import RotatingFileHandler
 import syntellix_api.contexts as contexts
 from flask import Flask, Response, request
 from flask_cors import CORS
+from syntellix_api.commands import register_commands
 from syntellix_api.configs import syntellix_config
 from syntellix_api.extensions import (
     ext_celery,
@@ -81,6 +82,7 @@ def create_flask_app() -> Flask:
 
     initialize_extensions(app)
     register_blueprints(app)
+    register_commands(app)
 
     return app
 
@@ -0,0 +1,130 @@
+import click
+from flask import current_app
+from syntellix_api.models.account_model import Tenant
+from syntellix_api.rag.vector_database.elasticsearch.elasticsearch_vector import (
+    ElasticSearchVectorFactory,
+)
+from syntellix_api.services.artifact_cache_service import ArtifactCacheService
+from syntellix_api.services.ingestion_pipeline_service import IngestionPipeline
+from syntellix_api.services.retrieval_stats_service import RetrievalStatsService
+from syntellix_api.services.vector_gc_service import VectorGCService
+from syntellix_api.tasks.vector_gc import reconcile_vectors
+
+
+@click.command(
+    "migrate-vector-index-layout",
+    help="Reindex the chunks of tenants into the given Elasticsearch index layout.",
+)
+@click.option(
+    "--layout",
+    type=click.Choice(["auto", "routed", "per_knowledge_base"]),
+    default="auto",
+    help="Target layout, `auto` picks `per_knowledge_base` for tenants with at least"
+    " ELASTICSEARCH_PER_KNOWLEDGE_BASE_MIN_DOCS chunks and `routed` for the others.",
+)
+@click.option(
+    "--tenant-id",
+    "tenant_ids",
+    type=int,
+    multiple=True,
+    help="Tenant to migrate, every tenant when not given.",
+)
+@click.option("--dry-run", is_flag=True, help="Only print the layout of every tenant.")
+def migrate_vector_index_layout(layout, tenant_ids, dry_run):
+    if not tenant_ids:
+        tenant_ids = [tenant.id for tenant in Tenant.query.order_by(Tenant.id).all()]
+
+    migrated, failed = 0, 0
+    for tenant_id in tenant_ids:
+        vector = ElasticSearchVectorFactory().init_vector(tenant_id)
+        count = vector.count()
+        if not count:
+            click.echo(f"Tenant {tenant_id}: no chunks, skipped.")
+            continue
+        target = vector.choose_layout() if layout == "auto" else layout
+        click.echo(
+            f"Tenant {tenant_id}: {count} chunks, layout {vector.layout()} -> {target}"
+        )
+        if dry_run:
+            continue
+        try:
+            if vector.migrate_layout(target):
+                migrated += 1
+        except Exception as e:
+            failed += 1
+            current_app.logger.exception(f"Failed to migrate tenant {tenant_id}")
+            click.echo(click.style(f"Tenant {tenant_id}: {str(e)}", fg="red"))
+
+    click.echo(f"Migrated {migrated} tenants, {failed} failed.")
+
+
+@click.command(
+    "vector-gc",
+    help="Print the chunks and bytes reclaimed by the vector GC tasks.",
+)
+@click.option(
+    "--reconcile",
+    is_flag=True,
+    help="Reconcile the indexed chunks with the database first, enqueuing the delete jobs of orphans.",
+)
+@click.option("--tenant-id", type=int, help="Tenant to reconcile, every tenant when not given.")
+@click.option("--reset", is_flag=True, help="Reset the stats after printing them.")
+def vector_gc(reconcile, tenant_id, reset):
+    if reconcile:
+        reconcile_vectors(tenant_id)
+    for field, value in VectorGCService.get_stats().items():
+        click.echo(f"{field}: {value}")
+    if reset:
+        VectorGCService.reset_stats()
+
+
+@click.command(
+    "retrieval-stats",
+    help="Print the latency and hits of the retrieval stages by retrieval mode.",
+)
+@click.option("--reset", is_flag=True, help="Reset the stats after printing them.")
+def retrieval_stats(reset):
+    for mode, stats in RetrievalStatsService.get_stats().items():
+        click.echo(f"{mode}:")
+        for field, value in stats.items():
+            click.echo(f"  {field}: {value}")
+    if reset:
+        RetrievalStatsService.reset_stats()
+
+
+@click.command(
+    "ingestion-stats",
+    help="Print the chunks, busy time and queue wait of the ingestion stages by node.",
+)
+@click.option("--reset", is_flag=True, help="Reset the stats after printing them.")
+def ingestion_stats(reset):
+    for stage, nodes in IngestionPipeline.get_stats().items():
+        click.echo(f"{stage}:")
+        for node, stats in nodes.items():
+            click.echo(f"  {node}:")
+            for field, value in stats.items():
+                click.echo(f"    {field}: {value}")
+    if reset:
+        IngestionPipeline.reset_stats()
+
+
+@click.command(
+    "artifact-cache-stats",
+    help="Print the hits, misses and reused bytes of the artifact cache by stage.",
+)
+@click.option("--reset", is_flag=True, help="Reset the stats after printing them.")
+def artifact_cache_stats(reset):
+    for stage, stats in ArtifactCacheService.get_stats().items():
+        click.echo(f"{stage}:")
+        for field, value in stats.items():
+            click.echo(f"  {field}: {value}")
+    if reset:
+        ArtifactCacheService.reset_stats()
+
+
+def register_commands(app):
+    app.cli.add_command(migrate_vector_index_layout)
+    app.cli.add_command(vector_gc)
+    app.cli.add_command(retrieval_stats)
+    app.cli.add_command(ingestion_stats)
+    app.cli.add_command(artifact_cache_stats)
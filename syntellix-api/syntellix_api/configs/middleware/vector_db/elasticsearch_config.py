@@ -1,6 +1,6 @@
-from typing import Optional
+from typing import Literal, Optional
 
-from pydantic import Field, PositiveInt
+from pydantic import Field, NonNegativeInt, PositiveInt
 from pydantic_settings import BaseSettings
 
 
@@ -28,3 +28,71 @@ class ElasticsearchConfig(BaseSettings):
         description="Elasticsearch password",
         default="elastic",
     )
+
+    ELASTICSEARCH_TEXT_ANALYSIS: Literal["ik", "pretokenized"] = Field(
+        description="how chunk text is analyzed for full text search,"
+        " `ik` lets Elasticsearch analyze it with the IK plugin,"
+        " `pretokenized` indexes the tokens of the RAG tokenizer in whitespace analyzed fields"
+        " and weighs query terms with the same tokenizer",
+        default="ik",
+    )
+
+    ELASTICSEARCH_INDEX_LAYOUT: Literal["shared", "routed", "per_knowledge_base"] = Field(
+        description="layout of the index of a new tenant, available values are"
+        " `shared` one index without routing,"
+        " `routed` one index routed by knowledge base so that a query only searches the shards of its knowledge bases,"
+        " `per_knowledge_base` an index per knowledge base behind the tenant alias."
+        " Existing tenants keep their layout until migrated with `flask migrate-vector-index-layout`",
+        default="routed",
+    )
+
+    ELASTICSEARCH_PER_KNOWLEDGE_BASE_MIN_DOCS: PositiveInt = Field(
+        description="min number of chunks of a tenant migrated to the `per_knowledge_base` layout"
+        " by `flask migrate-vector-index-layout --layout auto`, smaller tenants are migrated to `routed`",
+        default=500000,
+    )
+
+    ELASTICSEARCH_NUMBER_OF_SHARDS: PositiveInt = Field(
+        description="number of primary shards of new `shared` and `per_knowledge_base` indices",
+        default=1,
+    )
+
+    ELASTICSEARCH_ROUTED_NUMBER_OF_SHARDS: PositiveInt = Field(
+        description="number of primary shards of new `routed` indices, knowledge bases are spread over them",
+        default=4,
+    )
+
+    ELASTICSEARCH_NUMBER_OF_REPLICAS: NonNegativeInt = Field(
+        description="number of replicas of every primary shard of new indices",
+        default=1,
+    )
+
+    ELASTICSEARCH_VECTOR_INDEX_TYPE: Literal[
+        "hnsw", "int8_hnsw", "int4_hnsw", "bbq_hnsw", "flat", "int8_flat", "int4_flat", "bbq_flat"
+    ] = Field(
+        description="dense_vector index type of new indices, `int8`, `int4` and `bbq` quantize the vectors"
+        " searched in memory to 1/4, 1/8 and 1/32 of their float size, `flat` indices are brute force",
+        default="int8_hnsw",
+    )
+
+    ELASTICSEARCH_VECTOR_IN_SOURCE: bool = Field(
+        description="keep the embeddings in the _source of new indices, without them the indices take less disk"
+        " but can not be reindexed by `flask migrate-vector-index-layout`",
+        default=True,
+    )
+
+    ELASTICSEARCH_HNSW_M: PositiveInt = Field(
+        description="max number of neighbors of a vector in the HNSW graph of new indices",
+        default=16,
+    )
+
+    ELASTICSEARCH_HNSW_EF_CONSTRUCTION: PositiveInt = Field(
+        description="number of candidates considered when inserting a vector in the HNSW graph of new indices",
+        default=100,
+    )
+
+    ELASTICSEARCH_GC_REQUESTS_PER_SECOND: NonNegativeInt = Field(
+        description="max chunks per second deleted by the background delete jobs of removed knowledge bases"
+        " and documents, 0 for no throttling",
+        default=1000,
+    )
@@ -1,7 +1,7 @@
-from typing import Annotated, Optional
+from typing import Annotated, Any, Literal, Optional
 
-from pydantic import (AliasChoices, Field, NonNegativeInt, PositiveInt,
-                      computed_field)
+from pydantic import (AliasChoices, Field, NonNegativeFloat, NonNegativeInt,
+                      PositiveInt, computed_field)
 from pydantic_settings import BaseSettings
 
 
@@ -283,6 +283,243 @@ class IndexingConfig(BaseSettings):
         default=1000,
     )
 
+    INDEXING_ARTIFACT_CACHE_ENABLED: bool = Field(
+        description="reuse the parsed chunks, contexts and embeddings of a file already processed"
+        " with the same parser, parser config and models",
+        default=True,
+    )
+
+    INDEXING_ARTIFACT_CACHE_VERSION: str = Field(
+        description="version mixed into parse artifact cache keys, change it to invalidate cached artifacts"
+        " after parser code changes",
+        default="1",
+    )
+
+    INDEXING_TOKENIZE_WORKERS: NonNegativeInt = Field(
+        description="number of worker processes tokenizing the chunks of large documents in parallel,"
+        " 0 or 1 tokenizes them in the calling process",
+        default=0,
+    )
+
+    INDEXING_TOKENIZE_LINES_PER_WORKER: PositiveInt = Field(
+        description="min number of chunks per tokenize worker, smaller batches are tokenized in the calling process",
+        default=2000,
+    )
+
+    INDEXING_TABLE_BATCH_ROWS: PositiveInt = Field(
+        description="number of spreadsheet or csv rows converted and tokenized at once by the table parser",
+        default=10000,
+    )
+
+    INDEXING_VECTOR_GC_RECONCILE_INTERVAL: NonNegativeInt = Field(
+        description="hours between two reconciliations of the indexed chunks against the documents in the database,"
+        " purging chunks and images of removed documents, 0 disables them",
+        default=24,
+    )
+
+    INDEXING_VECTOR_GC_POLL_INTERVAL: PositiveInt = Field(
+        description="seconds between two checks of a running background delete job",
+        default=30,
+    )
+
+    INDEXING_PROGRESS_PUBLISH_INTERVAL: NonNegativeFloat = Field(
+        description="min seconds between two progress updates of a document published to redis,"
+        " updates in between are coalesced into the next one",
+        default=0.5,
+    )
+
+    INDEXING_PROGRESS_TTL: PositiveInt = Field(
+        description="seconds the progress of a document is kept in redis after its last update",
+        default=86400,
+    )
+
+    INDEXING_PROGRESS_STREAM_TIMEOUT: PositiveInt = Field(
+        description="max seconds a document progress event stream stays open",
+        default=1800,
+    )
+
+    INDEXING_SCHEDULER_ENABLED: bool = Field(
+        description="queue documents by estimated cost and dispatch them fairly across tenants, workers must then"
+        " consume the `ingest_small`, `ingest_medium` and `ingest_large` queues and celery beat must run,"
+        " see README.md, when disabled documents go to the default queue in upload order",
+        default=False,
+    )
+
+    INDEXING_SCHEDULER_MEDIUM_COST: PositiveInt = Field(
+        description="min estimated cost, in pdf page equivalents, of a document of the medium queue",
+        default=20,
+    )
+
+    INDEXING_SCHEDULER_LARGE_COST: PositiveInt = Field(
+        description="min estimated cost, in pdf page equivalents, of a document of the large queue",
+        default=200,
+    )
+
+    INDEXING_SCHEDULER_QUEUE_SLOTS: dict[str, int] = Field(
+        description="max documents of each queue handed to the workers at once as JSON,"
+        " match the concurrency of the workers consuming each queue",
+        default={"small": 8, "medium": 4, "large": 2},
+    )
+
+    INDEXING_SCHEDULER_TENANT_CONCURRENCY: PositiveInt = Field(
+        description="max documents of a tenant processed at once across all queues",
+        default=4,
+    )
+
+    INDEXING_SCHEDULER_TENANT_WEIGHTS: dict[str, float] = Field(
+        description="share of the workers of tenants by tenant id as JSON, tenants not listed weigh 1,"
+        ' eg: {"1": 2.0}',
+        default={},
+    )
+
+    INDEXING_SCHEDULER_LEASE: PositiveInt = Field(
+        description="seconds without progress after which a dispatched document is considered lost"
+        " and its slot is given back",
+        default=1800,
+    )
+
+    INDEXING_SCHEDULER_HANDOFF_TIMEOUT: PositiveInt = Field(
+        description="seconds a document handed to the queue of its next pipeline stage may wait for it"
+        " before it is considered lost and its slot is given back",
+        default=21600,
+    )
+
+    INDEXING_SCHEDULER_DISPATCH_INTERVAL: PositiveInt = Field(
+        description="seconds between two periodic dispatches, which give back the slots of lost documents",
+        default=30,
+    )
+
+    INDEXING_PIPELINE_ENABLED: bool = Field(
+        description="process a document in chained tasks: parsing on the queue it was dispatched to,"
+        " contextualization on the contextualize queue and embedding and indexing on the embed queue,"
+        " each consumed by a worker pool of its own, see README.md, when disabled a document is processed"
+        " in one task",
+        default=False,
+    )
+
+    INDEXING_PIPELINE_CONTEXT_QUEUE: str = Field(
+        description="Celery queue of the contextualization tasks, for a gevent pool: LLM calls mostly wait",
+        default="ingest_context",
+    )
+
+    INDEXING_PIPELINE_EMBED_QUEUE: str = Field(
+        description="Celery queue of the embedding and indexing tasks, for workers keeping the embedding model loaded",
+        default="ingest_embed",
+    )
+
+    INDEXING_PIPELINE_CONTEXT_CONCURRENCY: PositiveInt = Field(
+        description="max contextualization requests to the LLM in flight at once for a document",
+        default=8,
+    )
+
+    INDEXING_PIPELINE_EMBED_BATCH_SIZE: PositiveInt = Field(
+        description="number of chunks embedded at once",
+        default=64,
+    )
+
+
+class DeepDocConfig(BaseSettings):
+    """
+    DeepDoc vision model configs
+    """
+
+    DEEPDOC_ORT_INTRA_OP_NUM_THREADS: NonNegativeInt = Field(
+        description="onnxruntime intra-op thread count for the deepdoc OCR models, 0 lets onnxruntime use all"
+        " physical cores, the layout and table structure models keep the onnxruntime defaults"
+        " unless given a profile in DEEPDOC_ORT_MODEL_PROFILES",
+        default=2,
+    )
+
+    DEEPDOC_ORT_INTER_OP_NUM_THREADS: NonNegativeInt = Field(
+        description="onnxruntime inter-op thread count for the deepdoc OCR models, 0 lets onnxruntime decide",
+        default=2,
+    )
+
+    DEEPDOC_ORT_EXECUTION_MODE: str = Field(
+        description="onnxruntime execution mode, available values are `sequential`, `parallel`",
+        default="sequential",
+    )
+
+    DEEPDOC_ORT_GRAPH_OPTIMIZATION_LEVEL: str = Field(
+        description="onnxruntime graph optimization level,"
+        " available values are `disable`, `basic`, `extended`, `all`",
+        default="all",
+    )
+
+    DEEPDOC_ORT_ENABLE_CPU_MEM_ARENA: bool = Field(
+        description="whether to enable the onnxruntime cpu memory arena for the deepdoc OCR models",
+        default=False,
+    )
+
+    DEEPDOC_ORT_PROVIDERS: str = Field(
+        description="comma separated onnxruntime execution providers in priority order,"
+        " providers not available on the host are skipped",
+        default="CPUExecutionProvider",
+    )
+
+    DEEPDOC_ORT_QUANTIZED_MODELS: str = Field(
+        description="comma separated deepdoc model names (det, rec, layout, tsr) to load"
+        " from their INT8 variant `<name>_int8.onnx` when it exists",
+        default="",
+    )
+
+    DEEPDOC_ORT_MODEL_PROFILES: dict[str, dict[str, Any]] = Field(
+        description="per-model overrides of the execution profile as JSON,"
+        ' eg: {"det": {"intra_op_num_threads": 8}, "layout": {"execution_mode": "parallel"}}',
+        default={},
+    )
+
+    DEEPDOC_OCR_REC_BATCH_SIZE: PositiveInt = Field(
+        description="number of text boxes recognized per onnxruntime run",
+        default=16,
+    )
+
+    DEEPDOC_PDF_PAGE_WORKERS: NonNegativeInt = Field(
+        description="number of worker processes rendering, OCRing and layout-detecting pdf pages in parallel,"
+        " 0 or 1 parses pages one after another in the calling process, which daemonic processes like"
+        " those of a Celery prefork pool always do, see README.md",
+        default=0,
+    )
+
+    DEEPDOC_PDF_PAGES_PER_TASK: PositiveInt = Field(
+        description="number of consecutive pdf pages handed to a page worker at once",
+        default=4,
+    )
+
+    DEEPDOC_PAGE_IMAGE_CACHE_SIZE: NonNegativeInt = Field(
+        description="max rendered pdf page images kept in memory per document, 0 keeps all pages in memory",
+        default=32,
+    )
+
+    DEEPDOC_PAGE_IMAGE_CACHE_DIR: Optional[str] = Field(
+        description="directory where evicted page images are spilled,"
+        " evicted pages are rendered again from the pdf when not set",
+        default=None,
+    )
+
+    DEEPDOC_PAGE_RESULT_CACHE_DIR: Optional[str] = Field(
+        description="directory caching the OCR and layout results of pdf pages, so that parsing a file again"
+        " with another parser type skips the vision models, disabled when not set",
+        default=None,
+    )
+
+    DEEPDOC_PAGE_RESULT_CACHE_SIZE_MB: NonNegativeInt = Field(
+        description="max size of the page result cache in MB, least recently used pages are evicted beyond it,"
+        " 0 never evicts",
+        default=1024,
+    )
+
+    DEEPDOC_PDF_TEXT_LAYER_FIRST: bool = Field(
+        description="build text boxes of born-digital pdf pages from their text layer and run OCR detection"
+        " only on embedded images and scanned pages",
+        default=True,
+    )
+
+    DEEPDOC_PDF_TEXT_LAYER_MIN_CHARS: NonNegativeInt = Field(
+        description="min characters a page's text layer needs to skip OCR detection",
+        default=20,
+    )
+
 
 class ImageFormatConfig(BaseSettings):
     MULTIMODAL_SEND_IMAGE_FORMAT: str = Field(
@@ -312,6 +549,12 @@ class EmbeddingConfig(BaseSettings):
         default="https://api.openai.com/v1",
     )
 
+    EMBEDDING_DIMENSIONS: NonNegativeInt = Field(
+        description="keep only the first dimensions of the embeddings, for Matryoshka models trained to be truncated,"
+        " 0 keeps them all. Changing it requires re-indexing into new indices",
+        default=0,
+    )
+
 class RerankConfig(BaseSettings):
     """
     Rerank configs
@@ -322,6 +565,59 @@ class RerankConfig(BaseSettings):
         default="",
     )
 
+
+class RetrievalConfig(BaseSettings):
+    """
+    Retrieval configs, agents override them in their advanced config with the
+    lower case names without the `RETRIEVAL_` prefix (`retrieval_mode` for the mode),
+    and may set a fixed `num_candidates`
+    """
+
+    RETRIEVAL_MODE: Literal["single", "two_stage"] = Field(
+        description="`single` searches `top_n` chunks and reranks them,"
+        " `two_stage` searches a wider recall set of `recall_k` chunks and reranks it down to `top_n`",
+        default="two_stage",
+    )
+
+    RETRIEVAL_RECALL_K: PositiveInt = Field(
+        description="number of chunks of the first stage of two stage retrieval",
+        default=30,
+    )
+
+    RETRIEVAL_NUM_CANDIDATES_FACTOR: PositiveInt = Field(
+        description="kNN candidates per shard of the first stage, as a multiple of `recall_k`",
+        default=4,
+    )
+
+    RETRIEVAL_NUM_CANDIDATES_RATIO: NonNegativeFloat = Field(
+        description="min kNN candidates per shard of the first stage, as a ratio of the chunks of the searched"
+        " knowledge bases, so that larger knowledge bases are searched deeper",
+        default=0.01,
+    )
+
+    RETRIEVAL_MAX_NUM_CANDIDATES: PositiveInt = Field(
+        description="max kNN candidates per shard of the first stage",
+        default=2000,
+    )
+
+    RETRIEVAL_RECALL_TIMEOUT_MS: NonNegativeInt = Field(
+        description="latency budget of the first stage search, partial results are reranked when it runs out,"
+        " 0 for no budget",
+        default=1000,
+    )
+
+    RETRIEVAL_RERANK_BUDGET_MS: NonNegativeInt = Field(
+        description="latency budget of reranking, the first stage is cut to the chunks the reranker can score"
+        " in it at its measured throughput, 0 for no budget",
+        default=1500,
+    )
+
+    RETRIEVAL_MAX_BATCH_QUERIES: PositiveInt = Field(
+        description="max queries of a batch retrieval request",
+        default=500,
+    )
+
+
 class LLMConfig(BaseSettings):
     """
     LLM configs
@@ -395,6 +691,7 @@ class SystemConfig(
     FileAccessConfig,
     FileUploadConfig,
     HttpConfig,
+    DeepDocConfig,
     ImageFormatConfig,
     IndexingConfig,
     LoggingConfig,
@@ -403,6 +700,7 @@ class SystemConfig(
     SecurityConfig,
     EmbeddingConfig,
     RerankConfig,
+    RetrievalConfig,
     LLMConfig,
 ):
     pass
@@ -101,3 +101,9 @@ class AgentNotFoundError(BaseHTTPException):
     error_code = "agent_not_found"
     description = "智能体不存在"
     code = 400
+
+
+class TooManyQueriesError(BaseHTTPException):
+    error_code = "too_many_queries"
+    description = "检索问题数量超出限制"
+    code = 400
@@ -6,6 +6,8 @@ from syntellix_api.controllers.api_errors import (
 from syntellix_api.controllers.api_errors import (
     KonwledgeBaseIdEmptyError as api_knowledge_base_id_empty_error,
 )
+from syntellix_api.controllers.api_errors import TooManyQueriesError
+from syntellix_api.configs import syntellix_config
 from syntellix_api.controllers.console import api
 from syntellix_api.libs.login import login_required
 from syntellix_api.response.agent_response import (
@@ -14,6 +16,7 @@ from syntellix_api.response.agent_response import (
     agent_list_fields,
 )
 from syntellix_api.services.agent_service import AgentService
+from syntellix_api.services.rag_service import RAGService
 from syntellix_api.services.errors.agent import (
     AgentNameDuplicateError,
     AgentNotBelongToUserError,
@@ -147,9 +150,45 @@ class AIGenerateConfigApi(Resource):
         return result, 200
 
 
+class AgentRetrieveApi(Resource):
+    @login_required
+    def post(self, agent_id):
+        parser = reqparse.RequestParser()
+        parser.add_argument("queries", type=list, required=True, location="json")
+        args = parser.parse_args()
+
+        queries = [str(query) for query in args["queries"]]
+        if len(queries) > syntellix_config.RETRIEVAL_MAX_BATCH_QUERIES:
+            raise TooManyQueriesError()
+        if not AgentService.get_agent_by_id(agent_id, current_user.current_tenant_id):
+            raise NotFound()
+
+        results = RAGService.retrieve_batch(
+            current_user.current_tenant_id, agent_id, queries
+        )
+        return {
+            "results": [
+                {
+                    "query": query,
+                    "chunks": [
+                        {
+                            "id": node.id_,
+                            "document_id": node.metadata.get("document_id"),
+                            "file_name": node.metadata.get("file_name"),
+                            "content": node.content,
+                        }
+                        for node in nodes
+                    ],
+                }
+                for query, (nodes, _) in zip(queries, results)
+            ]
+        }, 200
+
+
 api.add_resource(AgentListApi, "/agents/list")
 api.add_resource(AgentNameExistsApi, "/agents/name-exists")
 api.add_resource(AgentApi, "/agents")
 api.add_resource(AgentOperationApi, "/agents/<int:agent_id>")
 api.add_resource(RecentAgentsApi, "/agents/recent")
-api.add_resource(AIGenerateConfigApi, "/agents/configs/ai-generate")
\ No newline at end of file
+api.add_resource(AIGenerateConfigApi, "/agents/configs/ai-generate")
+api.add_resource(AgentRetrieveApi, "/agents/<int:agent_id>/retrieve")
\ No newline at end of file
@@ -1,7 +1,8 @@
 import datetime
 import json
+import logging
 
-from flask import request
+from flask import Response, request, stream_with_context
 from flask_login import current_user
 from flask_restful import Resource, fields, marshal, marshal_with, reqparse
 from sqlalchemy import asc, desc
@@ -10,6 +11,7 @@ from syntellix_api.libs.login import login_required
 from syntellix_api.models.dataset_model import Document
 from syntellix_api.response.document_response import document_fields
 from syntellix_api.services.dataset_service import DocumentService, KonwledgeBaseService
+from syntellix_api.services.document_progress_service import DocumentProgressService
 from syntellix_api.services.errors.account import NoPermissionError
 from werkzeug.exceptions import Forbidden, NotFound
 
@@ -137,6 +139,77 @@ class KnowledgeBaseDocumentProgressApi(Resource):
         return {"knowledge_base_id": knowledge_base_id, "documents": documents}, 200
 
 
+class KnowledgeBaseDocumentProgressStreamApi(Resource):
+    @login_required
+    def get(self, knowledge_base_id):
+        parser = reqparse.RequestParser()
+        parser.add_argument("file_ids", type=str, required=True, location="args")
+        args = parser.parse_args()
+
+        file_ids = json.loads(args["file_ids"])
+
+        knowledge_base = KonwledgeBaseService.get_knowledge_base(knowledge_base_id)
+        if not knowledge_base:
+            raise NotFound("Knowledge base not found.")
+
+        documents = DocumentService.get_documents_progress(knowledge_base_id, file_ids)
+
+        if not documents:
+            raise NotFound("No documents found for the given file IDs.")
+
+        def generate():
+            try:
+                yield from DocumentProgressService.stream(knowledge_base_id, documents)
+            except Exception as e:
+                logging.exception(f"Document progress stream failed: {str(e)}")
+                yield f"data: {json.dumps({'error': str(e)})}\n\n"
+            finally:
+                yield 'data: {"done": true}\n\n'
+
+        return Response(
+            stream_with_context(generate()),
+            mimetype="text/event-stream",
+            headers={
+                "Content-Type": "text/event-stream",
+                "Cache-Control": "no-cache",
+                "X-Accel-Buffering": "no",
+                "Connection": "keep-alive",
+            },
+        )
+
+
+class KnowledgeBaseDocumentCancelApi(Resource):
+    @login_required
+    def post(self, knowledge_base_id, document_id):
+        if not current_user.is_dataset_editor:
+            raise Forbidden()
+
+        document = DocumentService.get_pending_document(
+            knowledge_base_id, document_id, current_user.current_tenant_id
+        )
+        if not document:
+            raise NotFound("No queued or processing document found.")
+
+        DocumentService.cancel_document(document)
+
+        return {"result": "success"}, 200
+
+
+class KnowledgeBaseDocumentPrioritizeApi(Resource):
+    @login_required
+    def post(self, knowledge_base_id, document_id):
+        if not current_user.is_dataset_editor:
+            raise Forbidden()
+
+        document = DocumentService.get_pending_document(
+            knowledge_base_id, document_id, current_user.current_tenant_id
+        )
+        if not document or not DocumentService.prioritize_document(document):
+            raise NotFound("No queued document found.")
+
+        return {"result": "success"}, 200
+
+
 api.add_resource(
     KnowledgeBaseDocumentListApi,
     "/knowledge-bases/documents",
@@ -146,3 +219,15 @@ api.add_resource(
     KnowledgeBaseDocumentProgressApi,
     "/knowledge-bases/<int:knowledge_base_id>/documents/progress",
 )
+api.add_resource(
+    KnowledgeBaseDocumentProgressStreamApi,
+    "/knowledge-bases/<int:knowledge_base_id>/documents/progress/stream",
+)
+api.add_resource(
+    KnowledgeBaseDocumentCancelApi,
+    "/knowledge-bases/<int:knowledge_base_id>/documents/<int:document_id>/cancel",
+)
+api.add_resource(
+    KnowledgeBaseDocumentPrioritizeApi,
+    "/knowledge-bases/<int:knowledge_base_id>/documents/<int:document_id>/prioritize",
+)
@@ -1,5 +1,6 @@
 import logging
 import os
+from datetime import timedelta
 
 from celery import Celery, Task
 from flask import Flask
@@ -78,8 +79,29 @@ def init_app(app: Flask) -> Celery:
 
     celery_app.conf.update(
         # worker_max_tasks_per_child=1,  # 每个子进程处理一个任务后重启
-        # worker_prefetch_multiplier=1,  # 每个工作进程预取一个任务
+        # documents are long tasks, a prefetched one would wait behind the running one
+        # while the scheduler counts it as processing
+        worker_prefetch_multiplier=1,  # 每个工作进程预取一个任务
         worker_force_forksafe=True,  # 强制使用 forksafe 模式
     )
 
+    # the ingestion scheduler and pipeline need workers on their own queues, see README.md
+
+    beat_schedule = {}
+    reconcile_interval = app.config.get("INDEXING_VECTOR_GC_RECONCILE_INTERVAL")
+    if reconcile_interval:
+        beat_schedule["reconcile_vectors"] = {
+            "task": "syntellix_api.tasks.vector_gc.reconcile_vectors",
+            "schedule": timedelta(hours=reconcile_interval),
+        }
+    if app.config.get("INDEXING_SCHEDULER_ENABLED"):
+        beat_schedule["dispatch_ingestion"] = {
+            "task": "syntellix_api.tasks.ingestion_scheduler.dispatch_ingestion",
+            "schedule": timedelta(
+                seconds=app.config.get("INDEXING_SCHEDULER_DISPATCH_INTERVAL")
+            ),
+        }
+    if beat_schedule:
+        celery_app.conf.update(beat_schedule=beat_schedule)
+
     return celery_app
@@ -39,7 +39,7 @@ from syntellix_api.rag.nlp import (
     tokenize_chunks_docx,
     tokenize_table,
 )
-from syntellix_api.rag.utils.parser_utils import num_tokens_from_string
+from syntellix_api.rag.utils.parser_utils import num_tokens_from_strings
 from tika import parser
 
 logger = logging.getLogger(__name__)
@@ -187,13 +187,13 @@ class Markdown(MarkdownParser):
         remainder, tables = self.extract_tables_and_remainder(f"{txt}\n")
         sections = []
         tbls = []
-        for sec in remainder.split("\n"):
-            if num_tokens_from_string(sec) > 10 * self.chunk_token_num:
+        lines = remainder.split("\n")
+        for sec, tnum in zip(lines, num_tokens_from_strings(lines)):
+            if tnum > 10 * self.chunk_token_num:
                 sections.append((sec[: int(len(sec) / 2)], ""))
                 sections.append((sec[int(len(sec) / 2) :], ""))
             else:
                 sections.append((sec, ""))
-        print(tables)
         for table in tables:
             tbls.append(
                 ((None, markdown(table, extensions=["markdown.extensions.tables"])), "")
@@ -17,7 +17,7 @@ from timeit import default_timer as timer
 from nltk import word_tokenize
 from openpyxl import load_workbook
 from syntellix_api.rag.nlp import is_english, random_choices, find_codec, qbullets_category, add_positions, has_qbullet, docx_question_level
-from syntellix_api.rag.nlp import rag_tokenizer, tokenize_table, concat_img
+from syntellix_api.rag.nlp import rag_tokenizer, tokenize_table, tokenize_contents, concat_img
 from syntellix_api.rag.deepdoc.parser import PdfParser, ExcelParser, DocxParser
 from docx import Document
 from PIL import Image
@@ -253,8 +253,7 @@ def beAdocPdf(d, q, a, eng, image, poss):
     aprefix = "Answer: " if eng else "回答："
     d["content_with_weight"] = "\t".join(
         [qprefix + rmPrefix(q), aprefix + rmPrefix(a)])
-    d["content_ltks"] = rag_tokenizer.tokenize(q)
-    d["content_sm_ltks"] = rag_tokenizer.fine_grained_tokenize(d["content_ltks"])
+    d["question"] = q
     d["image"] = image
     add_positions(d, poss)
     return d
@@ -264,8 +263,7 @@ def beAdocDocx(d, q, a, eng, image):
     aprefix = "Answer: " if eng else "回答："
     d["content_with_weight"] = "\t".join(
         [qprefix + rmPrefix(q), aprefix + rmPrefix(a)])
-    d["content_ltks"] = rag_tokenizer.tokenize(q)
-    d["content_sm_ltks"] = rag_tokenizer.fine_grained_tokenize(d["content_ltks"])
+    d["question"] = q
     d["image"] = image
     return d
 
@@ -274,11 +272,16 @@ def beAdoc(d, q, a, eng):
     aprefix = "Answer: " if eng else "回答："
     d["content_with_weight"] = "\t".join(
         [qprefix + rmPrefix(q), aprefix + rmPrefix(a)])
-    d["content_ltks"] = rag_tokenizer.tokenize(q)
-    d["content_sm_ltks"] = rag_tokenizer.fine_grained_tokenize(d["content_ltks"])
+    d["question"] = q
     return d
 
 
+def tokenize_questions(docs):
+    # the question of every Q&A doc is tokenized as its content, all in one batch
+    tokenize_contents(docs, [d.pop("question") for d in docs])
+    return docs
+
+
 def mdQuestionLevel(s):
     match = re.match(r'#*', s)
     return (len(match.group(0)), s.lstrip('#').lstrip()) if match else (0, s)
@@ -306,7 +309,7 @@ def chunk(filename, binary=None, lang="Chinese", callback=None, **kwargs):
         excel_parser = Excel()
         for q, a in excel_parser(filename, binary, callback):
             res.append(beAdoc(deepcopy(doc), q, a, eng))
-        return res
+        return tokenize_questions(res)
     elif re.search(r"\.(txt|csv)$", filename, re.IGNORECASE):
         callback(0.1, "Start to parse.")
         txt = ""
@@ -349,7 +352,7 @@ def chunk(filename, binary=None, lang="Chinese", callback=None, **kwargs):
         callback(0.6, ("Extract Q&A: {}".format(len(res)) + (
             f"{len(fails)} failure, line: %s..." % (",".join(fails[:3])) if fails else "")))
 
-        return res
+        return tokenize_questions(res)
     elif re.search(r"\.pdf$", filename, re.IGNORECASE):
         callback(0.1, "Start to parse.")
         pdf_parser = Pdf()
@@ -359,7 +362,7 @@ def chunk(filename, binary=None, lang="Chinese", callback=None, **kwargs):
 
         for q, a, image, poss in qai_list:
             res.append(beAdocPdf(deepcopy(doc), q, a, eng, image, poss))
-        return res
+        return tokenize_questions(res)
     elif re.search(r"\.(md|markdown)$", filename, re.IGNORECASE):
         callback(0.1, "Start to parse.")
         txt = ""
@@ -404,14 +407,13 @@ def chunk(filename, binary=None, lang="Chinese", callback=None, **kwargs):
             sum_question = '\n'.join(question_stack)
             if sum_question:
                 res.append(beAdoc(deepcopy(doc), sum_question, markdown(last_answer, extensions=['markdown.extensions.tables']), eng))
-        return res
+        return tokenize_questions(res)
     elif re.search(r"\.docx$", filename, re.IGNORECASE):
         docx_parser = Docx()
         qai_list, tbls = docx_parser(filename, binary,
                                     from_page=0, to_page=10000, callback=callback)
         res = tokenize_table(tbls, doc, eng)
-        for q, a, image in qai_list:
-            res.append(beAdocDocx(deepcopy(doc), q, a, eng, image))
+        res.extend(tokenize_questions([beAdocDocx(deepcopy(doc), q, a, eng, image) for q, a, image in qai_list]))
         return res
 
     raise NotImplementedError(
@@ -10,57 +10,97 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 #
-import copy
 import re
-from io import BytesIO
+from collections import Counter
+from functools import lru_cache
+from itertools import islice
 
-import numpy as np
 import pandas as pd
 from dateutil.parser import parse as datetime_parse
-from openpyxl import load_workbook
+from syntellix_api.configs import syntellix_config
 from syntellix_api.rag.deepdoc.parser import ExcelParser
-from syntellix_api.rag.nlp import find_codec, is_english, rag_tokenizer, tokenize
+from syntellix_api.rag.nlp import find_codec, is_english, rag_tokenizer, tokenize_docs
 from xpinyin import Pinyin
 
 
+class Table:
+    """
+    The rows of a sheet or a csv file within a range of records, read from
+    the source again on every pass over `batches`, so that no more than a
+    batch of rows is held at once. `offset` is the number of records before
+    the table, for ranges spanning several sheets.
+    """
+
+    def __init__(self, headers, read_rows, offset=0, from_page=0, to_page=10000000000):
+        self.headers = headers
+        self.read_rows = read_rows
+        self.offset = offset
+        self.from_page = from_page
+        self.to_page = to_page
+        # records read and failed ones of the last complete pass
+        self.seen = 0
+        self.fails = []
+
+    def rows(self):
+        fails, n = [], 0
+        for i, row in enumerate(self.read_rows()):
+            n = i + 1
+            if self.offset + i < self.from_page:
+                continue
+            if self.offset + i >= self.to_page:
+                break
+            if len(row) != len(self.headers):
+                fails.append(str(i))
+                continue
+            yield row
+        self.seen, self.fails = n, fails
+
+    def batches(self, size):
+        rows = self.rows()
+        while True:
+            batch = list(islice(rows, size))
+            if not batch:
+                return
+            yield batch
+
+
 class Excel(ExcelParser):
     def __call__(
         self, fnm, binary=None, from_page=0, to_page=10000000000, callback=None
     ):
-        if not binary:
-            wb = load_workbook(fnm)
-        else:
-            wb = load_workbook(BytesIO(binary))
-        total = 0
-        for sheetname in wb.sheetnames:
-            total += len(list(wb[sheetname].rows))
-
-        res, fails, done = [], [], 0
-        rn = 0
-        for sheetname in wb.sheetnames:
-            ws = wb[sheetname]
-            rows = list(ws.rows)
-            if not rows:
+        """
+        Yield a `Table` per sheet with headers. A sheet is streamed from the
+        read-only workbook on every pass, and the records range continues
+        over the sheets, so the next sheet is only yielded once the rows of
+        the previous one were read.
+        """
+        src = binary or fnm
+        wb = self.open_workbook(src)
+        sheetnames = wb.sheetnames
+        wb.close()
+
+        fails, rn = [], 0
+        for sheetname in sheetnames:
+            header = next(self.sheet_rows(src, sheetname), None)
+            if header is None:
                 continue
-            headers = [cell.value for cell in rows[0]]
-            missed = set([i for i, h in enumerate(headers) if h is None])
-            headers = [cell.value for i, cell in enumerate(rows[0]) if i not in missed]
+            missed = set([i for i, h in enumerate(header) if h is None])
+            headers = [h for i, h in enumerate(header) if i not in missed]
             if not headers:
                 continue
-            data = []
-            for i, r in enumerate(rows[1:]):
-                rn += 1
-                if rn - 1 < from_page:
-                    continue
-                if rn - 1 >= to_page:
-                    break
-                row = [cell.value for ii, cell in enumerate(r) if ii not in missed]
-                if len(row) != len(headers):
-                    fails.append(str(i))
-                    continue
-                data.append(row)
-                done += 1
-            res.append(pd.DataFrame(np.array(data), columns=headers))
+
+            def read_rows(sheetname=sheetname, width=len(header), missed=missed):
+                rows = self.sheet_rows(src, sheetname)
+                next(rows, None)
+                for r in rows:
+                    # read-only rows stop at their last cell, the header sets the width
+                    r = list(r[:width]) + [None] * (width - len(r))
+                    yield [v for i, v in enumerate(r) if i not in missed]
+
+            table = Table(headers, read_rows, rn, from_page, to_page)
+            yield table
+            rn += table.seen
+            fails.extend(table.fails)
 
         callback(
             0.3,
@@ -75,7 +115,59 @@ class Excel(ExcelParser):
                 )
             ),
         )
-        return res
+
+    @staticmethod
+    def sheet_rows(src, sheetname):
+        sheets = ExcelParser.iter_sheets(src)
+        try:
+            for name, rows in sheets:
+                if name == sheetname:
+                    yield from rows
+                    return
+        finally:
+            sheets.close()
+
+
+def split_lines(txt, start=0):
+    """
+    `txt[start:].split("\n")` without the list.
+    """
+    while True:
+        e = txt.find("\n", start)
+        if e < 0:
+            yield txt[start:]
+            return
+        yield txt[start:e]
+        start = e + 1
+
+
+def csv_tables(txt, delimiter, from_page=0, to_page=10000000000, callback=None):
+    """
+    Yield the `Table` of a csv text, its first line being the headers.
+    """
+    lines = split_lines(txt)
+    headers = next(lines).split(delimiter)
+
+    def read_rows():
+        lines = split_lines(txt)
+        next(lines)
+        for line in lines:
+            yield line.split(delimiter)
+
+    table = Table(headers, read_rows, 0, from_page, to_page)
+    yield table
+
+    callback(
+        0.3,
+        (
+            "Extract records: {}~{}".format(from_page, min(txt.count("\n") + 1, to_page))
+            + (
+                f"{len(table.fails)} failure, line: %s..." % (",".join(table.fails[:3]))
+                if table.fails
+                else ""
+            )
+        ),
+    )
 
 
 def trans_datatime(s):
@@ -92,44 +184,65 @@ def trans_bool(s):
         return "no"
 
 
+COLUMN_TYPES = ["int", "float", "text", "datetime", "bool"]
+TRANS = {
+    "int": int,
+    "float": float,
+    "datetime": trans_datatime,
+    "bool": trans_bool,
+    "text": str,
+}
+
+
+@lru_cache(maxsize=1 << 14)
+def cell_data_type(s):
+    if re.match(r"[+-]?[0-9]+(\.0+)?$", s.replace("%%", "")):
+        return "int"
+    if re.match(r"[+-]?[0-9.]+$", s.replace("%%", "")):
+        return "float"
+    if re.match(r"(true|yes|是|\*|✓|✔|☑|✅|√|false|no|否|⍻|×)$", s, flags=re.IGNORECASE):
+        return "bool"
+    if trans_datatime(s):
+        return "datetime"
+    return "text"
+
+
+def count_data_types(counts, arr):
+    """
+    Add the type counts of the values of `arr` to `counts`, every distinct
+    value being classified once.
+    """
+    for a, n in Counter(str(a) for a in arr if a is not None).items():
+        counts[cell_data_type(a)] += n
+
+
+def dominant_data_type(counts):
+    # ties go to the first type of COLUMN_TYPES
+    return max(COLUMN_TYPES, key=lambda t: counts[t])
+
+
+@lru_cache(maxsize=1 << 14)
+def trans_cell_(ty, s):
+    try:
+        return TRANS[ty](s)
+    except Exception as e:
+        return None
+
+
+def trans_cell(ty, a):
+    if a is None:
+        return None
+    if ty == "text":
+        return str(a)
+    return trans_cell_(ty, str(a))
+
+
 def column_data_type(arr):
     arr = list(arr)
-    uni = len(set([a for a in arr if a is not None]))
-    counts = {"int": 0, "float": 0, "text": 0, "datetime": 0, "bool": 0}
-    trans = {
-        t: f
-        for f, t in [
-            (int, "int"),
-            (float, "float"),
-            (trans_datatime, "datetime"),
-            (trans_bool, "bool"),
-            (str, "text"),
-        ]
-    }
-    for a in arr:
-        if a is None:
-            continue
-        if re.match(r"[+-]?[0-9]+(\.0+)?$", str(a).replace("%%", "")):
-            counts["int"] += 1
-        elif re.match(r"[+-]?[0-9.]+$", str(a).replace("%%", "")):
-            counts["float"] += 1
-        elif re.match(
-            r"(true|yes|是|\*|✓|✔|☑|✅|√|false|no|否|⍻|×)$", str(a), flags=re.IGNORECASE
-        ):
-            counts["bool"] += 1
-        elif trans_datatime(str(a)):
-            counts["datetime"] += 1
-        else:
-            counts["text"] += 1
-    counts = sorted(counts.items(), key=lambda x: x[1] * -1)
-    ty = counts[0][0]
-    for i in range(len(arr)):
-        if arr[i] is None:
-            continue
-        try:
-            arr[i] = trans[ty](str(arr[i]))
-        except Exception as e:
-            arr[i] = None
+    counts = Counter()
+    count_data_types(counts, arr)
+    ty = dominant_data_type(counts)
+    arr = [trans_cell(ty, a) for a in arr]
     # if ty == "text":
     #    if len(arr) > 128 and uni / len(arr) < 0.1:
     #        ty = "keyword"
@@ -162,7 +275,7 @@ def chunk(
     if re.search(r"\.xlsx?$", filename, re.IGNORECASE):
         callback(0.1, "Start to parse.")
         excel_parser = Excel()
-        dfs = excel_parser(
+        tables = excel_parser(
             filename, binary, from_page=from_page, to_page=to_page, callback=callback
         )
     elif re.search(r"\.(txt|csv)$", filename, re.IGNORECASE):
@@ -173,40 +286,15 @@ def chunk(
             txt = binary.decode(encoding, errors="ignore")
         else:
             with open(filename, "r") as f:
-                while True:
-                    l = f.readline()
-                    if not l:
-                        break
-                    txt += l
-        lines = txt.split("\n")
-        fails = []
-        headers = lines[0].split(kwargs.get("delimiter", "\t"))
-        rows = []
-        for i, line in enumerate(lines[1:]):
-            if i < from_page:
-                continue
-            if i >= to_page:
-                break
-            row = [l for l in line.split(kwargs.get("delimiter", "\t"))]
-            if len(row) != len(headers):
-                fails.append(str(i))
-                continue
-            rows.append(row)
-
-        callback(
-            0.3,
-            (
-                "Extract records: {}~{}".format(from_page, min(len(lines), to_page))
-                + (
-                    f"{len(fails)} failure, line: %s..." % (",".join(fails[:3]))
-                    if fails
-                    else ""
-                )
-            ),
+                txt = f.read()
+        tables = csv_tables(
+            txt,
+            kwargs.get("delimiter", "\t"),
+            from_page=from_page,
+            to_page=to_page,
+            callback=callback,
         )
 
-        dfs = [pd.DataFrame(np.array(rows), columns=headers)]
-
     else:
         raise NotImplementedError(
             "file type not supported yet(excel, text, csv supported)"
@@ -222,25 +310,29 @@ def chunk(
         "datetime": "_dt",
         "bool": "_kwd",
     }
-    for df in dfs:
-        for n in ["id", "_id", "index", "idx"]:
-            if n in df.columns:
-                del df[n]
-        clmns = df.columns.values
-        txts = list(copy.deepcopy(clmns))
+    eng = lang.lower() == "english"  # is_english(txts)
+    title_tks = rag_tokenizer.tokenize(re.sub(r"\.[a-zA-Z]+$", "", filename))
+    batch_size = syntellix_config.INDEXING_TABLE_BATCH_ROWS
+    for table in tables:
+        idxs = [
+            j
+            for j, n in enumerate(table.headers)
+            if n not in ["id", "_id", "index", "idx"]
+        ]
+        clmns = [table.headers[j] for j in idxs]
         py_clmns = [
             PY.get_pinyins(re.sub(r"(/.*|（[^（）]+?）|\([^()]+?\))", "", str(n)), "_")[
                 0
             ]
             for n in clmns
         ]
-        clmn_tys = []
-        for j in range(len(clmns)):
-            cln, ty = column_data_type(df[clmns[j]])
-            clmn_tys.append(ty)
-            df[clmns[j]] = cln
-            if ty == "text":
-                txts.extend([str(c) for c in cln if c])
+
+        # a first pass over the rows infers the type of every column
+        counts = [Counter() for _ in clmns]
+        for batch in table.batches(batch_size):
+            for j, cln in zip(idxs, counts):
+                count_data_types(cln, [r[j] for r in batch])
+        clmn_tys = [dominant_data_type(cln) for cln in counts]
         clmns_map = [
             (
                 py_clmns[i].lower() + fieds_map[clmn_tys[i]],
@@ -249,33 +341,40 @@ def chunk(
             for i in range(len(clmns))
         ]
 
-        eng = lang.lower() == "english"  # is_english(txts)
-        for ii, row in df.iterrows():
-            d = {
-                "docnm_kwd": filename,
-                "title_tks": rag_tokenizer.tokenize(
-                    re.sub(r"\.[a-zA-Z]+$", "", filename)
-                ),
-            }
-            row_txt = []
-            for j in range(len(clmns)):
-                if row[clmns[j]] is None:
-                    continue
-                if not str(row[clmns[j]]):
+        # the second one converts and tokenizes them a batch at a time
+        for batch in table.batches(batch_size):
+            docs, row_txts, cells = [], [], []
+            for r in batch:
+                d = {
+                    "docnm_kwd": filename,
+                    "title_tks": title_tks,
+                }
+                row_txt = []
+                for i, j in enumerate(idxs):
+                    v = trans_cell(clmn_tys[i], r[j])
+                    if v is None:
+                        continue
+                    if not str(v):
+                        continue
+                    if pd.isna(v):
+                        continue
+                    fld = clmns_map[i][0]
+                    if clmn_tys[i] == "text":
+                        cells.append((d, fld, v))
+                    else:
+                        d[fld] = v
+                    row_txt.append("{}:{}".format(clmns[i], v))
+                if not row_txt:
                     continue
-                if pd.isna(row[clmns[j]]):
-                    continue
-                fld = clmns_map[j][0]
-                d[fld] = (
-                    row[clmns[j]]
-                    if clmn_tys[j] != "text"
-                    else rag_tokenizer.tokenize(row[clmns[j]])
-                )
-                row_txt.append("{}:{}".format(clmns[j], row[clmns[j]]))
-            if not row_txt:
-                continue
-            tokenize(d, "; ".join(row_txt), eng)
-            res.append(d)
+                docs.append(d)
+                row_txts.append("; ".join(row_txt))
+
+            tks = rag_tokenizer.tokenize_batch([txt for _, _, txt in cells])
+            for (d, fld, _), t in zip(cells, tks):
+                d[fld] = t
+            tokenize_docs(docs, row_txts, eng)
+            res.extend(docs)
+            callback(msg=f"Tokenized records: {len(res)}")
 
     callback(0.35, "")
 
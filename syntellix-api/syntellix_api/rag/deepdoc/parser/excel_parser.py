@@ -19,58 +19,71 @@ from syntellix_api.rag.nlp import find_codec
 
 
 class RAGFlowExcelParser:
-    def html(self, fnm, chunk_rows=256):
+    @staticmethod
+    def open_workbook(fnm):
+        # read-only workbooks stream rows from the file instead of loading every cell
         if isinstance(fnm, str):
-            wb = load_workbook(fnm)
-        else:
-            wb = load_workbook(BytesIO(fnm))
+            return load_workbook(fnm, read_only=True)
+        return load_workbook(BytesIO(fnm), read_only=True)
+
+    @staticmethod
+    def iter_sheets(fnm):
+        """
+        Yield (sheet name, row iterator) for every sheet, rows being tuples of
+        cell values. The workbook is closed once the generator is exhausted
+        or closed.
+        """
+        wb = RAGFlowExcelParser.open_workbook(fnm)
+        try:
+            for sheetname in wb.sheetnames:
+                ws = wb[sheetname]
+                # some writers save wrong sheet dimensions, read rows as they are
+                ws.reset_dimensions()
+                yield sheetname, ws.iter_rows(values_only=True)
+        finally:
+            wb.close()
 
+    def html(self, fnm, chunk_rows=256):
         tb_chunks = []
-        for sheetname in wb.sheetnames:
-            ws = wb[sheetname]
-            rows = list(ws.rows)
-            if not rows: continue
+        for sheetname, rows in self.iter_sheets(fnm):
+            header = next(rows, None)
+            if header is None: continue
 
             tb_rows_0 = "<tr>"
-            for t in list(rows[0]):
-                tb_rows_0 += f"<th>{t.value}</th>"
+            for t in header:
+                tb_rows_0 += f"<th>{t}</th>"
             tb_rows_0 += "</tr>"
 
-            for chunk_i in range((len(rows) - 1) // chunk_rows + 1):
-                tb = ""
-                tb += f"<table><caption>{sheetname}</caption>"
-                tb += tb_rows_0
-                for r in list(rows[1 + chunk_i * chunk_rows:1 + (chunk_i + 1) * chunk_rows]):
-                    tb += "<tr>"
-                    for i, c in enumerate(r):
-                        if c.value is None:
-                            tb += "<td></td>"
-                        else:
-                            tb += f"<td>{c.value}</td>"
-                    tb += "</tr>"
-                tb += "</table>\n"
-                tb_chunks.append(tb)
+            # rows are streamed into tables of `chunk_rows` rows, a sheet with
+            # only its header still gets one
+            tb_rows, n = [], 0
+            for r in rows:
+                r = list(r) + [None] * (len(header) - len(r))
+                tb_rows.append("<tr>" + "".join("<td></td>" if v is None else f"<td>{v}</td>" for v in r)
+                               + "</tr>")
+                if len(tb_rows) < chunk_rows:
+                    continue
+                tb_chunks.append(f"<table><caption>{sheetname}</caption>" + tb_rows_0 + "".join(tb_rows)
+                                 + "</table>\n")
+                tb_rows, n = [], n + 1
+            if tb_rows or not n:
+                tb_chunks.append(f"<table><caption>{sheetname}</caption>" + tb_rows_0 + "".join(tb_rows)
+                                 + "</table>\n")
 
         return tb_chunks
 
     def __call__(self, fnm):
-        if isinstance(fnm, str):
-            wb = load_workbook(fnm)
-        else:
-            wb = load_workbook(BytesIO(fnm))
         res = []
-        for sheetname in wb.sheetnames:
-            ws = wb[sheetname]
-            rows = list(ws.rows)
-            if not rows:continue
-            ti = list(rows[0])
-            for r in list(rows[1:]):
+        for sheetname, rows in self.iter_sheets(fnm):
+            ti = next(rows, None)
+            if ti is None:continue
+            for r in rows:
                 l = []
-                for i, c in enumerate(r):
-                    if not c.value:
+                for i, v in enumerate(r):
+                    if not v:
                         continue
-                    t = str(ti[i].value) if i < len(ti) else ""
-                    t += ("：" if t else "") + str(c.value)
+                    t = str(ti[i]) if i < len(ti) else ""
+                    t += ("：" if t else "") + str(v)
                     l.append(t)
                 l = "; ".join(l)
                 if sheetname.lower().find("sheet") < 0:
@@ -81,17 +94,15 @@ class RAGFlowExcelParser:
     @staticmethod
     def row_number(fnm, binary):
         if fnm.split(".")[-1].lower().find("xls") >= 0:
-            wb = load_workbook(BytesIO(binary))
             total = 0
-            for sheetname in wb.sheetnames:
-                ws = wb[sheetname]
-                total += len(list(ws.rows))
-                return total
+            for _, rows in RAGFlowExcelParser.iter_sheets(binary):
+                total += sum(1 for _ in rows)
+            return total
 
         if fnm.split(".")[-1].lower() in ["csv", "txt"]:
             encoding = find_codec(binary)
             txt = binary.decode(encoding, errors="ignore")
-            return len(txt.split("\n"))
+            return txt.count("\n") + 1
 
 
 if __name__ == "__main__":
@@ -0,0 +1,129 @@
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+from io import BytesIO
+
+import pdfplumber
+from PIL import Image
+
+
+class PageImageCache:
+    """
+    Rendered page images of a pdf, indexed like the list it replaces.
+
+    At most `capacity` images are kept in memory (0 keeps all of them).
+    Evicted pages are spilled to a temporary directory under `cache_dir`
+    if one is given, otherwise they are rendered again from the pdf the
+    next time they are needed.
+    """
+
+    def __init__(self, fnm, zoomin=3, page_from=0, capacity=0, cache_dir=None):
+        self.fnm = fnm
+        self.zoomin = zoomin
+        self.page_from = page_from
+        self.capacity = capacity
+        self.cache_dir = tempfile.mkdtemp(prefix="pages-", dir=cache_dir) if cache_dir else None
+        self.sizes = []
+        self.images = OrderedDict()
+        self.spilled = set()
+        self._pdf = None
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("page image index out of range")
+        if i in self.images:
+            self.images.move_to_end(i)
+            return self.images[i]
+        img = self._load(i)
+        self._put(i, img)
+        return img
+
+    def append(self, img):
+        self.sizes.append(img.size)
+        self._put(len(self.sizes) - 1, img)
+
+    def extend(self, imgs):
+        for img in imgs:
+            self.append(img)
+
+    def reserve(self, size):
+        """
+        Add the next page without rendering it, its image is rendered the
+        first time it is needed.
+        """
+        self.sizes.append(tuple(size))
+
+    def render_page(self, i):
+        assert i == len(self), "pages must be rendered in order"
+        img = self._render(i)
+        self.append(img)
+        return img
+
+    def _pdf_page(self, i):
+        if self._pdf is None:
+            self._pdf = pdfplumber.open(self.fnm) if isinstance(
+                self.fnm, str) else pdfplumber.open(BytesIO(self.fnm))
+        return self._pdf.pages[self.page_from + i]
+
+    def _render(self, i):
+        page = self._pdf_page(i)
+        img = page.to_image(resolution=72 * self.zoomin).annotated
+        # drop the layout objects pdfplumber caches on the page
+        page.close()
+        return img
+
+    def _path(self, i):
+        return os.path.join(self.cache_dir, f"{i}.png")
+
+    def _load(self, i):
+        if i not in self.spilled:
+            return self._render(i)
+        img = Image.open(self._path(i))
+        img.load()
+        return img
+
+    def _put(self, i, img):
+        self.images[i] = img
+        self.images.move_to_end(i)
+        while self.capacity and len(self.images) > self.capacity:
+            j, evicted = self.images.popitem(last=False)
+            if self.cache_dir and j not in self.spilled:
+                evicted.save(self._path(j), format="PNG", compress_level=1)
+                self.spilled.add(j)
+
+    def close(self):
+        self.images.clear()
+        if self._pdf is not None:
+            self._pdf.close()
+            self._pdf = None
+        if self.cache_dir:
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+            self.cache_dir = None
+
+    def __del__(self):
+        self.close()
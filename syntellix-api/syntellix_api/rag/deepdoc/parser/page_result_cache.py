@@ -0,0 +1,126 @@
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+
+from syntellix_api.configs import syntellix_config
+
+
+def file_digest(fnm):
+    if isinstance(fnm, str):
+        with open(fnm, "rb") as f:
+            fnm = f.read()
+    return hashlib.sha3_256(fnm).hexdigest()
+
+
+class PageResultCache:
+    """
+    OCR and layout results of single pdf pages on local disk, one file per
+    page and result, shared by every parser and process pointed at the same
+    directory.
+    Files are evicted least recently used first once they take more than
+    `max_bytes`.
+    """
+
+    # one cache per directory and process, see from_config
+    _instances = {}
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self.size = sum(size for _, _, size in self._entries())
+
+    @classmethod
+    def from_config(cls):
+        """
+        The cache of the configured directory, created by the first parse of
+        the process. Its size is then tracked by the puts and only recounted
+        by evictions.
+        """
+        if not syntellix_config.DEEPDOC_PAGE_RESULT_CACHE_DIR:
+            return None
+        key = (syntellix_config.DEEPDOC_PAGE_RESULT_CACHE_DIR,
+               syntellix_config.DEEPDOC_PAGE_RESULT_CACHE_SIZE_MB * 1024 * 1024)
+        if key not in cls._instances:
+            cls._instances[key] = cls(*key)
+        return cls._instances[key]
+
+    @staticmethod
+    def key(*parts):
+        return hashlib.sha3_256("\x00".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".pkl")
+
+    def _entries(self):
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".pkl"):
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield entry.path, st.st_atime, st.st_size
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                res = pickle.load(f)
+            # mark as recently used, atime alone is unreliable on relatime mounts
+            os.utime(path)
+            return res
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning(f"Drop unreadable page result {key}: {e}")
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            return None
+
+    def put(self, key, res):
+        data = pickle.dumps(res, protocol=pickle.HIGHEST_PROTOCOL)
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self._path(key))
+        except Exception as e:
+            logging.warning(f"Failed to cache page result {key}: {e}")
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            return
+        self.size += len(data)
+        if self.max_bytes and self.size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        # other processes share the directory, so recount before evicting
+        entries = sorted(self._entries(), key=lambda e: e[1])
+        self.size = sum(size for _, _, size in entries)
+        # leave some headroom so that every put doesn't rescan the directory
+        target = self.max_bytes * 0.9
+        for path, _, size in entries:
+            if self.size <= target:
+                break
+            try:
+                os.unlink(path)
+                self.size -= size
+            except FileNotFoundError:
+                continue
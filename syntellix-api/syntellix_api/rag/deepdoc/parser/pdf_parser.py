@@ -11,8 +11,11 @@
 #  limitations under the License.
 #
 
+import multiprocessing
 import os
 import random
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 
 import xgboost as xgb
 from io import BytesIO
@@ -25,8 +28,13 @@ import numpy as np
 from timeit import default_timer as timer
 from pypdf import PdfReader as pdf2_read
 
-from syntellix_api.rag.utils.file_utils import get_project_base_directory
+from syntellix_api.configs import syntellix_config
+from syntellix_api.rag.utils.file_utils import get_project_base_directory, resource_stamps
 from syntellix_api.rag.deepdoc.vision import OCR, Recognizer, LayoutRecognizer, TableStructureRecognizer
+from syntellix_api.rag.deepdoc.vision.ort_session import QUANTIZED_SUFFIX
+from syntellix_api.rag.deepdoc.vision.geometry import TOP, X0, BoxIndex, box_array, count_in_row, tolerant_order
+from syntellix_api.rag.deepdoc.parser.page_image_cache import PageImageCache
+from syntellix_api.rag.deepdoc.parser.page_result_cache import PageResultCache, file_digest
 from syntellix_api.rag.nlp import rag_tokenizer
 from copy import deepcopy
 from huggingface_hub import snapshot_download
@@ -34,7 +42,66 @@ from huggingface_hub import snapshot_download
 logging.getLogger("pdfminer").setLevel(logging.WARNING)
 
 
+_page_worker = None
+_page_worker_pools = {}
+_page_workers_refused = False
+
+
+def _model_files(*model_names):
+    # the plain and INT8 files of deepdoc models, relative to the project base directory
+    return tuple(f"rag/res/deepdoc/{nm}{suffix}.onnx" for nm in model_names for suffix in ("", QUANTIZED_SUFFIX))
+
+
+OCR_MODEL_FILES = _model_files("det", "rec") + ("rag/res/deepdoc/ocr.res",)
+
+
+def _init_page_worker(model_speciess):
+    global _page_worker
+    _page_worker = RAGFlowPdfParser.page_worker(model_speciess)
+
+
+def _parse_page_range(*args):
+    return _page_worker._parse_page_range(*args)
+
+
+def page_workers_allowed(workers):
+    """
+    Whether this process may start page worker processes: the processes of a
+    Celery prefork pool are daemonic, which may not have children, and parse
+    their pages themselves. Logged once per process.
+    """
+    global _page_workers_refused
+    if not multiprocessing.current_process().daemon:
+        return True
+    if not _page_workers_refused:
+        logging.warning(f"DEEPDOC_PDF_PAGE_WORKERS={workers} ignored in daemonic process "
+                        f"{multiprocessing.current_process().name}, pages are parsed one after another: "
+                        "run the Celery workers parsing documents with -P threads or -P solo")
+        _page_workers_refused = True
+    return False
+
+
+def get_page_worker_pool(workers, model_speciess=None):
+    """
+    Page worker pools live for the whole process so that every worker loads
+    the OCR and layout models once and reuses them across documents.
+    """
+    key = (workers, model_speciess)
+    if key not in _page_worker_pools:
+        _page_worker_pools[key] = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_page_worker,
+            initargs=(model_speciess,))
+    return _page_worker_pools[key]
+
+
 class RAGFlowPdfParser:
+    PAGE_WINDOW = 16
+    # bump when a change to the OCR or layout code invalidates cached page results
+    PAGE_RESULT_VERSION = 2
+    page_workers = None
+
     def __init__(self):
         self.ocr = OCR()
         if hasattr(self, "model_speciess"):
@@ -101,18 +168,25 @@ class RAGFlowPdfParser:
         ]
         return any([re.match(p, b["text"]) for p in proj_patt])
 
-    def _updown_concat_features(self, up, down):
+    def _updown_concat_features(self, up, down, tks_cache=None):
+        tks_cache = {} if tks_cache is None else tks_cache
+
+        def tokenize(txt):
+            if txt not in tks_cache:
+                tks_cache[txt] = rag_tokenizer.tokenize(txt).split(" ")
+            return tks_cache[txt]
+
         w = max(self.__char_width(up), self.__char_width(down))
         h = max(self.__height(up), self.__height(down))
         y_dis = self._y_dis(up, down)
         LEN = 6
-        tks_down = rag_tokenizer.tokenize(down["text"][:LEN]).split(" ")
-        tks_up = rag_tokenizer.tokenize(up["text"][-LEN:]).split(" ")
+        tks_down = tokenize(down["text"][:LEN])
+        tks_up = tokenize(up["text"][-LEN:])
         tks_all = up["text"][-LEN:].strip() \
                   + (" " if re.match(r"[a-zA-Z0-9]+",
                                      up["text"][-1] + down["text"][0]) else "") \
                   + down["text"][:LEN].strip()
-        tks_all = rag_tokenizer.tokenize(tks_all).split(" ")
+        tks_all = tokenize(tks_all)
         fea = [
             up.get("R", -1) == down.get("R", -1),
             y_dis / h,
@@ -160,18 +234,10 @@ class RAGFlowPdfParser:
 
     @staticmethod
     def sort_X_by_page(arr, threashold):
-        # sort using y1 first and then x1
-        arr = sorted(arr, key=lambda r: (r["page_number"], r["x0"], r["top"]))
-        for i in range(len(arr) - 1):
-            for j in range(i, -1, -1):
-                # restore the order using th
-                if abs(arr[j + 1]["x0"] - arr[j]["x0"]) < threashold \
-                        and arr[j + 1]["top"] < arr[j]["top"] \
-                        and arr[j + 1]["page_number"] == arr[j]["page_number"]:
-                    tmp = arr[j]
-                    arr[j] = arr[j + 1]
-                    arr[j + 1] = tmp
-        return arr
+        # sort using x1 first and then y1, page by page
+        xy = box_array(arr)
+        pages = np.array([b["page_number"] for b in arr])
+        return [arr[i] for i in tolerant_order(xy[:, X0], xy[:, TOP], threashold, pages)]
 
     def _has_color(self, o):
         if o.get("ncs", "") == "DeviceGray":
@@ -287,9 +353,10 @@ class RAGFlowPdfParser:
         )
         
         # merge chars in the same rect
+        index = BoxIndex(bxs)
         for c in Recognizer.sort_Y_firstly(
                 chars, self.mean_height[pagenum - 1] // 4):
-            ii = Recognizer.find_overlapped(c, bxs)
+            ii = index.find_overlapped(c) if bxs else None
             if ii is None:
                 self.lefted_chars.append(c)
                 continue
@@ -304,13 +371,18 @@ class RAGFlowPdfParser:
             else:
                 bxs[ii]["text"] += c["text"]
 
-        for b in bxs:
-            if not b["text"]:
+        # recognize every box without embedded chars in one batched pass
+        unresolved = [b for b in bxs if not b["text"]]
+        if unresolved:
+            boxes = []
+            for b in unresolved:
                 left, right, top, bott = b["x0"] * ZM, b["x1"] * \
                                          ZM, b["top"] * ZM, b["bottom"] * ZM
-                b["text"] = self.ocr.recognize(np.array(img),
-                                               np.array([[left, top], [right, top], [right, bott], [left, bott]],
-                                                        dtype=np.float32))
+                boxes.append(np.array([[left, top], [right, top], [right, bott], [left, bott]],
+                                      dtype=np.float32))
+            for b, text in zip(unresolved, self.ocr.recognize_batch(np.array(img), boxes)):
+                b["text"] = text
+        for b in bxs:
             del b["txt"]
         bxs = [b for b in bxs if b["text"]]
         if self.mean_height[-1] == 0:
@@ -318,10 +390,77 @@ class RAGFlowPdfParser:
                                               for b in bxs])
         self.boxes.append(bxs)
 
+    def __text_layer(self, pagenum, chars):
+        """
+        Text boxes of a born-digital page built from the char geometry of its
+        text layer: chars are grouped into lines and lines are split at gaps
+        wide enough to separate columns or table cells.
+        """
+        lines = []
+        for c in sorted(chars, key=lambda c: (c["top"], c["x0"])):
+            if lines and (c["top"] + c["bottom"]) / 2 <= lines[-1]["bottom"]:
+                lines[-1]["bottom"] = max(lines[-1]["bottom"], c["bottom"])
+                lines[-1]["chars"].append(c)
+                continue
+            lines.append({"bottom": c["bottom"], "chars": [c]})
+
+        gap = 3 * self.mean_width[pagenum - 1]
+        bxs = []
+        for line in lines:
+            b = None
+            for c in sorted(line["chars"], key=lambda c: c["x0"]):
+                if b is None or c["x0"] - b["x1"] > gap:
+                    if c["text"] == " ":
+                        continue
+                    b = {"x0": c["x0"], "x1": c["x1"], "top": c["top"], "text": "",
+                         "bottom": c["bottom"], "page_number": pagenum}
+                    bxs.append(b)
+                if c["text"] == " ":
+                    if b["text"] and re.match(r"[0-9a-zA-Zа-яА-Я,.?;:!%%]", b["text"][-1]):
+                        b["text"] += " "
+                    continue
+                b["text"] += c["text"]
+                b["x0"], b["x1"] = min(b["x0"], c["x0"]), max(b["x1"], c["x1"])
+                b["top"], b["bottom"] = min(b["top"], c["top"]), max(b["bottom"], c["bottom"])
+        return [b for b in bxs if b["text"].strip()]
+
+    def __ocr_regions(self, pagenum, img, regions, bxs, ZM=3):
+        """
+        Detect and recognize text inside the embedded images of a page whose
+        other text comes from the text layer, skipping anything the text
+        layer already covers.
+        """
+        page = np.array(img)
+        index = BoxIndex(bxs)
+        found, polys = [], []
+        for r in regions:
+            x0, top = int(r["x0"] * ZM), int(r["top"] * ZM)
+            crop = page[top:int(r["bottom"] * ZM), x0:int(r["x1"] * ZM)]
+            if crop.shape[0] < 8 or crop.shape[1] < 8:
+                continue
+            dt_boxes, _ = self.ocr.text_detector(crop)
+            if dt_boxes is None or not len(dt_boxes):
+                continue
+            for b in self.ocr.sorted_boxes(dt_boxes):
+                b = b + np.array([x0, top], dtype=np.float32)
+                if b[0][0] > b[1][0] or b[0][1] > b[-1][1]:
+                    continue
+                box = {"x0": b[0][0] / ZM, "x1": b[1][0] / ZM,
+                       "top": b[0][1] / ZM, "text": "",
+                       "bottom": b[-1][1] / ZM, "page_number": pagenum}
+                if len(index) and index.find_overlapped(box) is not None:
+                    continue
+                found.append(box)
+                polys.append(b)
+        for b, text in zip(found, self.ocr.recognize_batch(page, polys)):
+            b["text"] = text
+        return [b for b in found if b["text"]]
+
     def _layouts_rec(self, ZM, drop=True):
         assert len(self.page_images) == len(self.boxes)
         self.boxes, self.page_layout = self.layouter(
-            self.page_images, self.boxes, ZM, drop=drop)
+            self.page_images, self.boxes, ZM, drop=drop, layouts=self.page_detected_layouts,
+            page_sizes=self.page_images.sizes)
         # cumlative Y
         for i in range(len(self.boxes)):
             self.boxes[i]["top"] += \
@@ -436,25 +575,71 @@ class RAGFlowPdfParser:
             bxs.pop(i + 1)
         self.boxes = bxs
 
+    def _updown_concat_scores(self, feas):
+        return self.updown_cnt_mdl.inplace_predict(np.array(feas, dtype=np.float32))
+
+    def _may_concat_downward(self, up, down):
+        # pairs of boxes _concat_downward skips without asking the model
+        mw = self.mean_width[up["page_number"] - 1]
+        if up.get("R", "") != down.get(
+                "R", "") and up["text"][-1] != "，":
+            return False
+        if re.match(r"[0-9]{2,3}/[0-9]{3}$", up["text"]) \
+                or re.match(r"[0-9]{2,3}/[0-9]{3}$", down["text"]) \
+                or not down["text"].strip():
+            return False
+        if up["x1"] < down["x0"] - 10 * \
+                mw or up["x0"] > down["x1"] + 10 * mw:
+            return False
+        return True
+
+    def _prefetch_updown_scores(self, boxes, concat_between_pages=True, tks_cache=None):
+        """
+        Model scores of the pairs `_concat_downward` may ask for while no box
+        has been merged away yet, predicted in one batch and keyed by the ids
+        of the up and down boxes. Pairs only reachable once boxes in between
+        are merged are scored when they come up.
+        """
+        pairs, feas = [], []
+        for k, up in enumerate(boxes):
+            if not up["text"]:
+                continue
+            mh = self.mean_height[up["page_number"] - 1]
+            for i in range(k + 1, min(k + 13, len(boxes))):
+                down = boxes[i]
+                ydis = self._y_dis(up, down)
+                smpg = up["page_number"] == down["page_number"]
+                if (smpg and ydis > mh * 4) or (not smpg and ydis > mh * 16):
+                    break
+                if not concat_between_pages and down["page_number"] > up["page_number"]:
+                    break
+                # close text boxes are concatenated by layout, not by the model
+                if i - k - 1 < 5 and up.get("layout_type") == "text":
+                    continue
+                try:
+                    if not self._may_concat_downward(up, down):
+                        continue
+                    fea = self._updown_concat_features(up, down, tks_cache)
+                except Exception:
+                    # left to fail, if ever, where _concat_downward reaches the pair
+                    continue
+                pairs.append((id(up), id(down)))
+                feas.append(fea)
+        if not feas:
+            return {}
+        return dict(zip(pairs, self._updown_concat_scores(feas)))
+
     def _concat_downward(self, concat_between_pages=True):
         # count boxes in the same row as a feature
-        for i in range(len(self.boxes)):
-            mh = self.mean_height[self.boxes[i]["page_number"] - 1]
-            self.boxes[i]["in_row"] = 0
-            j = max(0, i - 12)
-            while j < min(i + 12, len(self.boxes)):
-                if j == i:
-                    j += 1
-                    continue
-                ydis = self._y_dis(self.boxes[i], self.boxes[j]) / mh
-                if abs(ydis) < 1:
-                    self.boxes[i]["in_row"] += 1
-                elif ydis > 0:
-                    break
-                j += 1
+        centers = np.array([(b["top"] + b["bottom"]) / 2 for b in self.boxes])
+        heights = np.array([self.mean_height[b["page_number"] - 1] for b in self.boxes])
+        for b, in_row in zip(self.boxes, count_in_row(centers, heights)):
+            b["in_row"] = int(in_row)
 
         # concat between rows
         boxes = deepcopy(self.boxes)
+        tks_cache = {}
+        scores = self._prefetch_updown_scores(boxes, concat_between_pages, tks_cache)
         blocks = []
         while boxes:
             chunks = []
@@ -466,7 +651,6 @@ class RAGFlowPdfParser:
                     ydis = self._y_dis(up, boxes[i])
                     smpg = up["page_number"] == boxes[i]["page_number"]
                     mh = self.mean_height[up["page_number"] - 1]
-                    mw = self.mean_width[up["page_number"] - 1]
                     if smpg and ydis > mh * 4:
                         break
                     if not smpg and ydis > mh * 16:
@@ -475,23 +659,7 @@ class RAGFlowPdfParser:
                     if not concat_between_pages and down["page_number"] > up["page_number"]:
                         break
 
-                    if up.get("R", "") != down.get(
-                            "R", "") and up["text"][-1] != "，":
-                        i += 1
-                        continue
-
-                    if re.match(r"[0-9]{2,3}/[0-9]{3}$", up["text"]) \
-                            or re.match(r"[0-9]{2,3}/[0-9]{3}$", down["text"]) \
-                            or not down["text"].strip():
-                        i += 1
-                        continue
-
-                    if not down["text"].strip():
-                        i += 1
-                        continue
-
-                    if up["x1"] < down["x0"] - 10 * \
-                            mw or up["x0"] > down["x1"] + 10 * mw:
+                    if not self._may_concat_downward(up, down):
                         i += 1
                         continue
 
@@ -504,9 +672,11 @@ class RAGFlowPdfParser:
                         i += 1
                         continue
 
-                    fea = self._updown_concat_features(up, down)
-                    if self.updown_cnt_mdl.predict(
-                            xgb.DMatrix([fea]))[0] <= 0.5:
+                    score = scores.get((id(up), id(down)))
+                    if score is None:
+                        score = self._updown_concat_scores(
+                            [self._updown_concat_features(up, down, tks_cache)])[0]
+                    if score <= 0.5:
                         i += 1
                         continue
                     dfs(down, i + 1)
@@ -844,8 +1014,8 @@ class RAGFlowPdfParser:
         bott = bx["bottom"] - self.page_cum_height[pn[0] - 1]
         page_images_cnt = len(self.page_images)
         if pn[-1] - 1 >= page_images_cnt: return ""
-        while bott * ZM > self.page_images[pn[-1] - 1].size[1]:
-            bott -= self.page_images[pn[-1] - 1].size[1] / ZM
+        while bott * ZM > self.page_images.sizes[pn[-1] - 1][1]:
+            bott -= self.page_images.sizes[pn[-1] - 1][1] / ZM
             pn.append(pn[-1] + 1)
             if pn[-1] - 1 >= page_images_cnt:
                 return ""
@@ -866,7 +1036,7 @@ class RAGFlowPdfParser:
             if b.get("layout_type"):
                 return True
             if width(
-                    b) > self.page_images[b["page_number"] - 1].size[0] / ZM / 3:
+                    b) > self.page_images.sizes[b["page_number"] - 1][0] / ZM / 3:
                 return True
             if b["bottom"] - b["top"] > self.mean_height[b["page_number"] - 1]:
                 return True
@@ -876,7 +1046,7 @@ class RAGFlowPdfParser:
         while boxes:
             lines = []
             widths = []
-            pw = self.page_images[boxes[0]["page_number"] - 1].size[0] / ZM
+            pw = self.page_images.sizes[boxes[0]["page_number"] - 1][0] / ZM
             mh = self.mean_height[boxes[0]["page_number"] - 1]
             mj = self.proj_match(
                 boxes[0]["text"]) or boxes[0].get(
@@ -936,6 +1106,171 @@ class RAGFlowPdfParser:
         except Exception as e:
             logging.error(str(e))
 
+    @staticmethod
+    def _image_regions(page):
+        regions = []
+        for im in page.images:
+            x0, top = max(im["x0"], 0), max(im["top"], 0)
+            x1, bottom = min(im["x1"], page.width), min(im["bottom"], page.height)
+            # rules, bullets and logos are too small to carry text worth OCRing
+            if x1 > x0 and bottom > top and (x1 - x0) * (bottom - top) >= page.width * page.height * 0.01:
+                regions.append({"x0": x0, "x1": x1, "top": top, "bottom": bottom})
+        return regions
+
+    def _extraction_mode(self, chars, regions, img, zoomin):
+        """
+        How the text of a page is extracted: "text" builds boxes from the text
+        layer alone, "hybrid" also OCRs the embedded images and "ocr" detects
+        and recognizes text on the whole page image.
+        """
+        if not syntellix_config.DEEPDOC_PDF_TEXT_LAYER_FIRST \
+                or len(chars) < syntellix_config.DEEPDOC_PDF_TEXT_LAYER_MIN_CHARS:
+            return "ocr"
+        # unmapped glyphs and rotated text read better from the image
+        garbled = [c for c in chars if not c.get("upright", True)
+                   or re.search(r"\(cid:[0-9]+\)|[\ufffd\ue000-\uf8ff]", c["text"])]
+        if len(garbled) > len(chars) * 0.1:
+            return "ocr"
+        # a scan with an invisible text layer on top of it
+        page_area = img.size[0] * img.size[1] / zoomin / zoomin
+        if sum((r["x1"] - r["x0"]) * (r["bottom"] - r["top"]) for r in regions) >= page_area * 0.8:
+            return "ocr"
+        return "hybrid" if regions else "text"
+
+    def __ocr_page(self, pagenum, img, chars, zoomin, mode="ocr", regions=None):
+        self.mean_height.append(
+            np.median(sorted([c["height"] for c in chars])) if chars else 0
+        )
+        self.mean_width.append(
+            np.median(sorted([c["width"] for c in chars])) if chars else 8
+        )
+        self.page_cum_height.append(img.size[1] / zoomin)
+        j = 0
+        while j + 1 < len(chars):
+            if chars[j]["text"] and chars[j + 1]["text"] \
+                    and re.match(r"[0-9a-zA-Z,.:;!%]+", chars[j]["text"] + chars[j + 1]["text"]) \
+                    and chars[j + 1]["x0"] - chars[j]["x1"] >= min(chars[j + 1]["width"],
+                                                                   chars[j]["width"]) / 2:
+                chars[j]["text"] += " "
+            j += 1
+
+        if mode == "ocr":
+            self.__ocr(pagenum, img, chars, zoomin)
+            return
+        bxs = self.__text_layer(pagenum, chars)
+        if mode == "hybrid":
+            bxs.extend(self.__ocr_regions(pagenum, img, regions, bxs, zoomin))
+        self.boxes.append(Recognizer.sort_Y_firstly(bxs, self.mean_height[-1] / 3))
+
+    def _parse_page(self, pagenum, img, chars, regions, zoomin):
+        mode = self._extraction_mode(chars, regions, img, zoomin)
+        if mode == "ocr" and self.is_english:
+            chars = []
+        self.__ocr_page(pagenum, img, chars, zoomin, mode, regions)
+
+    def __page_result_keys(self, fnm, zoomin, page_from):
+        # everything besides the page itself that changes its OCR result, and its layouts:
+        # a parser of another kind reuses the OCR of a page and only detects its layouts again
+        model_speciess = getattr(self, "model_speciess", None)
+        layout_model = "layout." + model_speciess if model_speciess else "layout"
+        quantized = syntellix_config.DEEPDOC_ORT_QUANTIZED_MODELS
+        ocr_version = (self.PAGE_RESULT_VERSION, "ocr", zoomin, self.is_english,
+                       syntellix_config.DEEPDOC_PDF_TEXT_LAYER_FIRST, syntellix_config.DEEPDOC_PDF_TEXT_LAYER_MIN_CHARS,
+                       quantized, resource_stamps(OCR_MODEL_FILES))
+        layout_version = (self.PAGE_RESULT_VERSION, layout_model, zoomin, quantized,
+                          resource_stamps(_model_files(layout_model)))
+        digest = file_digest(fnm)
+        pages = range(page_from, page_from + len(self.page_chars))
+        return ([PageResultCache.key(digest, pn, *ocr_version) for pn in pages],
+                [PageResultCache.key(digest, pn, *layout_version) for pn in pages])
+
+    def __load_page_result(self, pagenum, res, zoomin):
+        self.page_images.reserve(res["size"])
+        self.mean_height.append(res["mean_height"])
+        self.mean_width.append(res["mean_width"])
+        self.page_cum_height.append(res["size"][1] / zoomin)
+        for b in res["boxes"]:
+            b["page_number"] = pagenum
+        self.boxes.append(res["boxes"])
+        self.lefted_chars.extend(res["lefted_chars"])
+
+    @classmethod
+    def page_worker(cls, model_speciess=None):
+        """
+        A parser carrying only the models needed to render, OCR and
+        layout-detect pages, used by the processes of the page worker pool.
+        """
+        parser = cls.__new__(cls)
+        parser.ocr = OCR()
+        parser.layouter = LayoutRecognizer("layout." + model_speciess if model_speciess else "layout")
+        return parser
+
+    def _parse_page_range(self, fnm, zoomin, page_from, range_from, range_to, is_english):
+        self.lefted_chars = []
+        self.mean_height = []
+        self.mean_width = []
+        self.boxes = []
+        self.page_cum_height = [0]
+        with pdfplumber.open(fnm) as pdf:
+            pages = pdf.pages[range_from:range_to]
+            page_images = [p.to_image(resolution=72 * zoomin).annotated for p in pages]
+            page_chars = [[c for c in page.dedupe_chars().chars if self._has_color(c)] for page in pages]
+            page_regions = [self._image_regions(page) for page in pages]
+        self.is_english = is_english
+        for i, img in enumerate(page_images):
+            self._parse_page(i + 1, img, page_chars[i], page_regions[i], zoomin)
+
+        # page numbers are relative to page_from, the same as a sequential parse
+        for bxs in self.boxes:
+            for b in bxs:
+                b["page_number"] += range_from - page_from
+        return {
+            "page_images": page_images,
+            "boxes": self.boxes,
+            "mean_height": self.mean_height,
+            "mean_width": self.mean_width,
+            "page_heights": self.page_cum_height[1:],
+            "lefted_chars": self.lefted_chars,
+            "layouts": self.layouter.detect(page_images),
+        }
+
+    def __parallel_images(self, fnm, zoomin, page_from, page_to, workers, callback=None):
+        page_to = min(page_to, self.total_page)
+        step = syntellix_config.DEEPDOC_PDF_PAGES_PER_TASK
+        model_speciess = getattr(self, "model_speciess", None)
+        tmp = None
+        if not isinstance(fnm, str):
+            tmp = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+            tmp.write(fnm)
+            tmp.close()
+        try:
+            pool = get_page_worker_pool(workers, model_speciess)
+            futures = [pool.submit(_parse_page_range, tmp.name if tmp else fnm, zoomin, page_from, f,
+                                   min(f + step, page_to), self.is_english)
+                       for f in range(page_from, page_to, step)]
+            results = []
+            for future in futures:
+                results.append(future.result())
+                if callback:
+                    callback(prog=len(results) * 0.6 / len(futures), msg="")
+        except Exception:
+            _page_worker_pools.pop((workers, model_speciess), None)
+            raise
+        finally:
+            if tmp:
+                os.unlink(tmp.name)
+
+        # merge in page order so the output is identical to a sequential parse
+        self.page_detected_layouts = []
+        for res in results:
+            self.page_images.extend(res["page_images"])
+            self.boxes.extend(res["boxes"])
+            self.mean_height.extend(res["mean_height"])
+            self.mean_width.extend(res["mean_width"])
+            self.page_cum_height.extend(res["page_heights"])
+            self.lefted_chars.extend(res["lefted_chars"])
+            self.page_detected_layouts.extend(res["layouts"])
+
     def __images__(self, fnm, zoomin=3, page_from=0,
                    page_to=299, callback=None):
         self.lefted_chars = []
@@ -945,16 +1280,28 @@ class RAGFlowPdfParser:
         self.garbages = {}
         self.page_cum_height = [0]
         self.page_layout = []
+        self.page_detected_layouts = None
+        if isinstance(getattr(self, "page_images", None), PageImageCache):
+            self.page_images.close()
+        self.page_images = PageImageCache(fnm, zoomin, page_from,
+                                          syntellix_config.DEEPDOC_PAGE_IMAGE_CACHE_SIZE,
+                                          syntellix_config.DEEPDOC_PAGE_IMAGE_CACHE_DIR)
+        self.page_chars = []
+        self.page_image_regions = []
         self.page_from = page_from
+        workers = self.page_workers or syntellix_config.DEEPDOC_PDF_PAGE_WORKERS
+        parallel = False
         st = timer()
         try:
             self.pdf = pdfplumber.open(fnm) if isinstance(
                 fnm, str) else pdfplumber.open(BytesIO(fnm))
-            self.page_images = [p.to_image(resolution=72 * zoomin).annotated for i, p in
-                                enumerate(self.pdf.pages[page_from:page_to])]
+            pages = self.pdf.pages[page_from:page_to]
             self.page_chars = [[{**c, 'top': c['top'], 'bottom': c['bottom']} for c in page.dedupe_chars().chars if self._has_color(c)] for page in
-                               self.pdf.pages[page_from:page_to]]
+                               pages]
+            self.page_image_regions = [self._image_regions(page) for page in pages]
             self.total_page = len(self.pdf.pages)
+            parallel = workers > 1 and len(self.page_chars) > syntellix_config.DEEPDOC_PDF_PAGES_PER_TASK \
+                and page_workers_allowed(workers)
         except Exception as e:
             logging.error(str(e))
 
@@ -977,37 +1324,60 @@ class RAGFlowPdfParser:
             logging.warning(f"Miss outlines")
 
         logging.info("Images converted.")
+        # the chars are sampled the same way on every parse, is_english is part of the page result keys
         self.is_english = [re.search(r"[a-zA-Z0-9,/¸;:'\[\]\(\)!@#$%^&*\"?<>._-]{30,}", "".join(
-            random.choices([c["text"] for c in self.page_chars[i]], k=min(100, len(self.page_chars[i]))))) for i in
+            random.Random(page_from + i).choices([c["text"] for c in self.page_chars[i]],
+                                                 k=min(100, len(self.page_chars[i]))))) for i in
                            range(len(self.page_chars))]
         if sum([1 if e else 0 for e in self.is_english]) > len(
-                self.page_images) / 2:
+                self.page_chars) / 2:
             self.is_english = True
         else:
             self.is_english = False
 
         st = timer()
-        for i, img in enumerate(self.page_images):
-            chars = self.page_chars[i] if not self.is_english else []
-            self.mean_height.append(
-                np.median(sorted([c["height"] for c in chars])) if chars else 0
-            )
-            self.mean_width.append(
-                np.median(sorted([c["width"] for c in chars])) if chars else 8
-            )
-            self.page_cum_height.append(img.size[1] / zoomin)
-            j = 0
-            while j + 1 < len(chars):
-                if chars[j]["text"] and chars[j + 1]["text"] \
-                        and re.match(r"[0-9a-zA-Z,.:;!%]+", chars[j]["text"] + chars[j + 1]["text"]) \
-                        and chars[j + 1]["x0"] - chars[j]["x1"] >= min(chars[j + 1]["width"],
-                                                                       chars[j]["width"]) / 2:
-                    chars[j]["text"] += " "
-                j += 1
-
-            self.__ocr(i + 1, img, chars, zoomin)
-            if callback and i % 6 == 5:
-                callback(prog=(i + 1) * 0.6 / len(self.page_images), msg="")
+        if parallel:
+            try:
+                self.__parallel_images(fnm, zoomin, page_from, page_to, workers, callback)
+            except Exception as e:
+                logging.warning(f"Page workers failed, parse pages sequentially: {e}")
+                parallel = False
+        if not parallel:
+            # render, OCR and release pages one window at a time; with a bounded
+            # page image cache layouts are detected while the window is in memory
+            page_cache = PageResultCache.from_config()
+            ocr_keys, layout_keys = self.__page_result_keys(fnm, zoomin, page_from) if page_cache else (None, None)
+            detect = self.page_images.capacity or page_cache
+            layouts, window, pending = [], [], []
+            for i in range(len(self.page_chars)):
+                cached = page_cache.get(ocr_keys[i]) if page_cache else None
+                img = None
+                if cached:
+                    self.__load_page_result(i + 1, cached, zoomin)
+                else:
+                    img = self.page_images.render_page(i)
+                    regions = self.page_image_regions[i] if i < len(self.page_image_regions) else []
+                    lefted = len(self.lefted_chars)
+                    self._parse_page(i + 1, img, self.page_chars[i], regions, zoomin)
+                    if page_cache:
+                        page_cache.put(ocr_keys[i], {"size": img.size, "boxes": self.boxes[-1],
+                                                     "mean_height": self.mean_height[-1],
+                                                     "mean_width": self.mean_width[-1],
+                                                     "lefted_chars": self.lefted_chars[lefted:]})
+                layouts.append(page_cache.get(layout_keys[i]) if page_cache else None)
+                if detect and layouts[-1] is None:
+                    window.append(img if img is not None else self.page_images[i])
+                    pending.append(i)
+                if window and (len(window) == self.PAGE_WINDOW or i + 1 == len(self.page_chars)):
+                    for j, lts in zip(pending, self.layouter.detect(window)):
+                        layouts[j] = lts
+                        if page_cache:
+                            page_cache.put(layout_keys[j], lts)
+                    window, pending = [], []
+                if callback and i % 6 == 5:
+                    callback(prog=(i + 1) * 0.6 / len(self.page_chars), msg="")
+            if detect:
+                self.page_detected_layouts = layouts
         # print("OCR:", timer()-st)
 
         if not self.is_english and not any(
@@ -1059,38 +1429,38 @@ class RAGFlowPdfParser:
         poss.insert(0, ([pos[0][0]], pos[1], pos[2], max(
             0, pos[3] - 120), max(pos[3] - GAP, 0)))
         pos = poss[-1]
-        poss.append(([pos[0][-1]], pos[1], pos[2], min(self.page_images[pos[0][-1]].size[1] / ZM, pos[4] + GAP),
-                     min(self.page_images[pos[0][-1]].size[1] / ZM, pos[4] + 120)))
+        poss.append(([pos[0][-1]], pos[1], pos[2], min(self.page_images.sizes[pos[0][-1]][1] / ZM, pos[4] + GAP),
+                     min(self.page_images.sizes[pos[0][-1]][1] / ZM, pos[4] + 120)))
 
         positions = []
         for ii, (pns, left, right, top, bottom) in enumerate(poss):
             right = left + max_width
             bottom *= ZM
             for pn in pns[1:]:
-                bottom += self.page_images[pn - 1].size[1]
+                bottom += self.page_images.sizes[pn - 1][1]
             imgs.append(
                 self.page_images[pns[0]].crop((left * ZM, top * ZM,
                                                right *
                                                ZM, min(
-                    bottom, self.page_images[pns[0]].size[1])
+                    bottom, self.page_images.sizes[pns[0]][1])
                                                ))
             )
             if 0 < ii < len(poss) - 1:
                 positions.append((pns[0] + self.page_from, left, right, top, min(
-                    bottom, self.page_images[pns[0]].size[1]) / ZM))
-            bottom -= self.page_images[pns[0]].size[1]
+                    bottom, self.page_images.sizes[pns[0]][1]) / ZM))
+            bottom -= self.page_images.sizes[pns[0]][1]
             for pn in pns[1:]:
                 imgs.append(
                     self.page_images[pn].crop((left * ZM, 0,
                                                right * ZM,
                                                min(bottom,
-                                                   self.page_images[pn].size[1])
+                                                   self.page_images.sizes[pn][1])
                                                ))
                 )
                 if 0 < ii < len(poss) - 1:
                     positions.append((pn + self.page_from, left, right, 0, min(
-                        bottom, self.page_images[pn].size[1]) / ZM))
-                bottom -= self.page_images[pn].size[1]
+                        bottom, self.page_images.sizes[pn][1]) / ZM))
+                bottom -= self.page_images.sizes[pn][1]
 
         if not imgs:
             if need_position:
@@ -1124,13 +1494,13 @@ class RAGFlowPdfParser:
         top = bx["top"] - self.page_cum_height[pn - 1]
         bott = bx["bottom"] - self.page_cum_height[pn - 1]
         poss.append((pn, bx["x0"], bx["x1"], top, min(
-            bott, self.page_images[pn - 1].size[1] / ZM)))
-        while bott * ZM > self.page_images[pn - 1].size[1]:
-            bott -= self.page_images[pn - 1].size[1] / ZM
+            bott, self.page_images.sizes[pn - 1][1] / ZM)))
+        while bott * ZM > self.page_images.sizes[pn - 1][1]:
+            bott -= self.page_images.sizes[pn - 1][1] / ZM
             top = 0
             pn += 1
             poss.append((pn, bx["x0"], bx["x1"], top, min(
-                bott, self.page_images[pn - 1].size[1] / ZM)))
+                bott, self.page_images.sizes[pn - 1][1] / ZM)))
         return poss
 
 
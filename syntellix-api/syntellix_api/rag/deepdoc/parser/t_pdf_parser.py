@@ -0,0 +1,58 @@
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import os
+import sys
+sys.path.insert(
+    0,
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(
+                os.path.abspath(__file__)),
+            '../../')))
+
+import argparse
+from timeit import default_timer as timer
+
+from syntellix_api.rag.deepdoc.parser import PdfParser
+from syntellix_api.rag.utils.memory_utils import peak_rss, reset_peak_rss
+
+
+def parse(parser, fnm, workers):
+    parser.page_workers = workers
+    # the first document of a pool pays for loading the models in every worker
+    parser(fnm, need_image=False)
+    reset_peak_rss()
+    st = timer()
+    res = parser(fnm, need_image=False)
+    return res, timer() - st, peak_rss()
+
+
+def main(args):
+    parser = PdfParser()
+    baseline = None
+    for workers in [int(w) for w in args.workers.split(",")]:
+        res, elapsed, rss = parse(parser, args.inputs, workers)
+        pages = len(parser.page_images)
+        baseline = baseline or res
+        print(f"workers={workers}\tpages={pages}\t{elapsed:.2f}s\t{pages / elapsed:.2f} pages/s"
+              f"\tpeak RSS: {rss / 1024 / 1024:.1f} MB\tsame output: {res[0] == baseline[0]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--inputs', help="The PDF file to parse", required=True)
+    parser.add_argument('--workers', help="Comma separated page worker counts to compare. Default: 1,2,4,8",
+                        default="1,2,4,8")
+    args = parser.parse_args()
+    main(args)
@@ -11,8 +11,7 @@
 #  limitations under the License.
 #
 
-from syntellix_api.rag.nlp import find_codec
-from syntellix_api.rag.utils.parser_utils import num_tokens_from_string
+from syntellix_api.rag.nlp import ChunkBuilder, find_codec
 import re
 
 class RAGFlowTxtParser:
@@ -23,41 +22,30 @@ class RAGFlowTxtParser:
             txt = binary.decode(encoding, errors="ignore")
         else:
             with open(fnm, "r") as f:
-                while True:
-                    l = f.readline()
-                    if not l:
-                        break
-                    txt += l
+                txt = f.read()
         return self.parser_txt(txt, chunk_token_num, delimiter)
 
     @classmethod
     def parser_txt(cls, txt, chunk_token_num=128, delimiter="\n!?;。；！？"):
         if type(txt) != str:
             raise TypeError("txt type should be str!")
-        cks = [""]
-        tk_nums = [0]
+        builder = ChunkBuilder(chunk_token_num)
+        builder.extend((t, "") for t in cls.split_txt(txt, delimiter))
+        return [[c, ""] for c in builder.finish()]
 
-        def add_chunk(t):
-            nonlocal cks, tk_nums, delimiter
-            tnum = num_tokens_from_string(t)
-            if tnum < 8:
-                pos = ""
-            if tk_nums[-1] > chunk_token_num:
-                cks.append(t)
-                tk_nums.append(tnum)
-            else:
-                cks[-1] += t
-                tk_nums[-1] += tnum
-
-        s, e = 0, 1
-        while e < len(txt):
-            if txt[e] in delimiter:
-                add_chunk(txt[s: e + 1])
-                s = e + 1
-                e = s + 1
-            else:
-                e += 1
-        if s < e:
-            add_chunk(txt[s: e + 1])
-
-        return [[c,""] for c in cks]
\ No newline at end of file
+    @staticmethod
+    def split_txt(txt, delimiter):
+        """
+        Pieces of `txt` ending right after a delimiter. A piece is at least
+        its first char, which never ends it, and an empty piece follows the
+        last delimiter.
+        """
+        if not delimiter:
+            yield txt
+            return
+        delims = "".join(re.escape(c) for c in delimiter)
+        last = None
+        for last in re.finditer(r"(.[^%s]*)([%s]?)" % (delims, delims), txt, re.S):
+            yield last.group(0)
+        if last is None or last.group(2):
+            yield ""
@@ -0,0 +1,172 @@
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import numpy as np
+
+X0, X1, TOP, BOTTOM = range(4)
+
+
+def box_array(boxes):
+    """
+    The x0, x1, top and bottom of dict boxes as a (n, 4) float array.
+    """
+    return np.array([[b["x0"], b["x1"], b["top"], b["bottom"]] for b in boxes],
+                    dtype=np.float64).reshape(-1, 4)
+
+
+def tolerant_order(primary, secondary, threshold, groups=None):
+    """
+    Indices sorting boxes by `primary` then `secondary` the way the pairwise
+    tolerant sort of the parsers does: boxes are sorted by `primary`, then
+    neighbours whose primary values differ by less than `threshold` are
+    swapped while out of `secondary` order, e.g. the boxes of one text line
+    end up left to right. Boxes of different `groups` are never swapped.
+
+    Runs of boxes within `threshold` of each other are sorted by `secondary`
+    at once; only runs spanning more than `threshold`, like a staircase of
+    tops, go through the pairwise swaps.
+    """
+    keys = (secondary, primary) if groups is None else (secondary, primary, groups)
+    order = np.lexsort(keys)
+    n = len(order)
+    if n < 2:
+        return order
+    p = primary[order]
+    close = np.diff(p) < threshold
+    if groups is not None:
+        close &= np.diff(groups[order]) == 0
+    starts = np.flatnonzero(np.concatenate(([True], ~close)))
+    ends = np.concatenate((starts[1:], [n])) - 1
+    band = np.concatenate(([0], np.cumsum(~close)))
+    res = order[np.lexsort((secondary[order], band))]
+    # no pair of boxes of different runs is ever swapped
+    for s, e in zip(starts, ends):
+        if p[e] - p[s] >= threshold:
+            res[s:e + 1] = _pairwise_order(order[s:e + 1], primary, secondary, threshold, n - 1 - e)
+    return res
+
+
+def _pairwise_order(idx, primary, secondary, threshold, extra_passes):
+    """
+    The swaps of the pairwise tolerant sort within one run of `idx`, which
+    gets one pass per box of the run and `extra_passes` more for the boxes
+    after it, the ones that change nothing left out.
+    """
+    idx = list(idx)
+    p = [float(primary[i]) for i in idx]
+    q = [float(secondary[i]) for i in idx]
+
+    def one_pass(top):
+        swapped = False
+        for j in range(top, -1, -1):
+            if abs(p[j + 1] - p[j]) < threshold and q[j + 1] < q[j]:
+                p[j], p[j + 1] = p[j + 1], p[j]
+                q[j], q[j + 1] = q[j + 1], q[j]
+                idx[j], idx[j + 1] = idx[j + 1], idx[j]
+                swapped = True
+        return swapped
+
+    for i in range(len(idx) - 1):
+        one_pass(i)
+    for _ in range(extra_passes):
+        if not one_pass(len(idx) - 2):
+            break
+    return idx
+
+
+def overlap_areas(a, b, ratio=True):
+    """
+    Pairwise overlapped area of the (n, 4) boxes `a` with the (m, 4) boxes
+    `b`, as a fraction of the area of the box of `a` when `ratio`.
+    """
+    w = np.minimum(a[:, None, X1], b[None, :, X1]) - np.maximum(a[:, None, X0], b[None, :, X0])
+    h = np.minimum(a[:, None, BOTTOM], b[None, :, BOTTOM]) - np.maximum(a[:, None, TOP], b[None, :, TOP])
+    ov = np.clip(w, 0, None) * np.clip(h, 0, None)
+    if not ratio:
+        return ov
+    area = ((a[:, X1] - a[:, X0]) * (a[:, BOTTOM] - a[:, TOP]))[:, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(area != 0, ov / area, 0)
+
+
+def best_overlapped(ov, rev_ov, thr):
+    """
+    Index of the box with the largest (ov, rev_ov) pair with ov at least
+    `thr`, the last one on ties, None if there is none.
+    """
+    cand = np.flatnonzero(ov >= thr)
+    if not len(cand):
+        return None
+    cand = cand[ov[cand] == ov[cand].max()]
+    cand = cand[rev_ov[cand] == rev_ov[cand].max()]
+    return int(cand[-1])
+
+
+def count_in_row(centers, heights, window=12):
+    """
+    For every box, the number of its `window` neighbours on either side in
+    reading order whose vertical center is less than one `heights` away.
+    Neighbours are scanned from the furthest one above and the scan stops at
+    the first neighbour a whole height below.
+    """
+    n = len(centers)
+    if not n:
+        return np.zeros(0, dtype=int)
+    offsets = np.arange(-window, window)
+    j = np.arange(n)[:, None] + offsets[None, :]
+    valid = (j >= 0) & (j < n) & (offsets != 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ydis = (centers[np.clip(j, 0, n - 1)] - centers[:, None]) / heights[:, None]
+    stopped = np.cumsum(valid & (ydis >= 1), axis=1) > 0
+    return (valid & ~stopped & (np.abs(ydis) < 1)).sum(axis=1)
+
+
+class BoxIndex:
+    """
+    Boxes indexed by their vertical extent, answering which of them overlap
+    a query box without scanning all of them. The dict boxes may be mutated
+    as long as their geometry doesn't change.
+    """
+
+    def __init__(self, boxes):
+        self.arr = box_array(boxes)
+        self.order = np.argsort(self.arr[:, TOP], kind="stable")
+        self.tops = self.arr[self.order, TOP]
+        heights = self.arr[:, BOTTOM] - self.arr[:, TOP]
+        self.max_height = max(float(heights.max()), 0) if len(heights) else 0
+
+    def __len__(self):
+        return len(self.arr)
+
+    def candidates(self, top, bottom):
+        """
+        Indices of the boxes vertically overlapping [top, bottom].
+        """
+        lo = np.searchsorted(self.tops, top - self.max_height, "left")
+        hi = np.searchsorted(self.tops, bottom, "right")
+        idx = self.order[lo:hi]
+        return idx[self.arr[idx, BOTTOM] >= top]
+
+    def find_overlapped(self, box):
+        """
+        Index of the box covering the largest fraction of its own area with
+        `box`, the first one on ties, None if none overlaps.
+        """
+        idx = self.candidates(box["top"], box["bottom"])
+        if not len(idx):
+            return None
+        ov = overlap_areas(self.arr[idx], box_array([box]))[:, 0]
+        best = ov.max()
+        if best <= 0:
+            return None
+        return int(idx[ov == best].min())
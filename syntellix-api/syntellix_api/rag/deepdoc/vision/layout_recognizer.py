@@ -50,8 +50,11 @@ class LayoutRecognizer(Recognizer):
 
         self.garbage_layouts = ["footer", "header", "reference"]
 
+    def detect(self, image_list, thr=0.2, batch_size=16):
+        return super().__call__(image_list, thr, batch_size)
+
     def __call__(self, image_list, ocr_res, scale_factor=3,
-                 thr=0.2, batch_size=16, drop=True):
+                 thr=0.2, batch_size=16, drop=True, layouts=None, page_sizes=None):
         def __is_garbage(b):
             patt = [r"^•+$", r"(版权归©|免责条款|地址[:：])", r"\.{3,}", "^[0-9]{1,2} / ?[0-9]{1,2}$",
                     r"^[0-9]{1,2} of [0-9]{1,2}$", "^http://[^ ]{12,}",
@@ -60,7 +63,10 @@ class LayoutRecognizer(Recognizer):
                     ]
             return any([re.search(p, b["text"]) for p in patt])
 
-        layouts = super().__call__(image_list, thr, batch_size)
+        if layouts is None:
+            layouts = self.detect(image_list, thr, batch_size)
+        if page_sizes is None:
+            page_sizes = [img.size for img in image_list]
         # save_results(image_list, layouts, self.labels, output_dir='output/', threshold=0.7)
         assert len(image_list) == len(ocr_res)
         # Tag layout type
@@ -103,9 +109,9 @@ class LayoutRecognizer(Recognizer):
                     lts_[ii]["visited"] = True
                     keep_feats = [
                         lts_[
-                            ii]["type"] == "footer" and bxs[i]["bottom"] < image_list[pn].size[1] * 0.9 / scale_factor,
+                            ii]["type"] == "footer" and bxs[i]["bottom"] < page_sizes[pn][1] * 0.9 / scale_factor,
                         lts_[
-                            ii]["type"] == "header" and bxs[i]["top"] > image_list[pn].size[1] * 0.1 / scale_factor,
+                            ii]["type"] == "header" and bxs[i]["top"] > page_sizes[pn][1] * 0.1 / scale_factor,
                     ]
                     if drop and lts_[
                             ii]["type"] in self.garbage_layouts and not any(keep_feats):
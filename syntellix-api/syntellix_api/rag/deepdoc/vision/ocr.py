@@ -17,11 +17,12 @@ import os
 
 from huggingface_hub import snapshot_download
 
+from syntellix_api.configs import syntellix_config
 from syntellix_api.rag.utils.file_utils import get_project_base_directory
 from .operators import *
 import numpy as np
-import onnxruntime as ort
 
+from .ort_session import load_session
 from .postprocess import build_post_process
 
 
@@ -59,33 +60,14 @@ def create_operators(op_param_list, global_config=None):
 
 
 def load_model(model_dir, nm):
-    model_file_path = os.path.join(model_dir, nm + ".onnx")
-    if not os.path.exists(model_file_path):
-        raise ValueError("not find model file path {}".format(
-            model_file_path))
-
-    options = ort.SessionOptions()
-    options.enable_cpu_mem_arena = False
-    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
-    options.intra_op_num_threads = 2
-    options.inter_op_num_threads = 2
-    if False and ort.get_device() == "GPU":
-        sess = ort.InferenceSession(
-            model_file_path,
-            options=options,
-            providers=['CUDAExecutionProvider'])
-    else:
-        sess = ort.InferenceSession(
-            model_file_path,
-            options=options,
-            providers=['CPUExecutionProvider'])
+    sess = load_session(model_dir, nm)
     return sess, sess.get_inputs()[0]
 
 
 class TextRecognizer(object):
     def __init__(self, model_dir):
         self.rec_image_shape = [int(v) for v in "3, 48, 320".split(",")]
-        self.rec_batch_num = 16
+        self.rec_batch_num = syntellix_config.DEEPDOC_OCR_REC_BATCH_SIZE
         postprocess_params = {
             'name': 'CTCLabelDecode',
             "character_dict_path": os.path.join(model_dir, "ocr.res"),
@@ -578,6 +560,17 @@ class OCR(object):
             return ""
         return text
 
+    def recognize_batch(self, ori_im, boxes):
+        """
+        Recognize many boxes of the same image, cropping them all first and
+        running the recognizer on width-sorted batches instead of one by one.
+        """
+        if not boxes:
+            return []
+        img_crop_list = [self.get_rotate_crop_image(ori_im, box) for box in boxes]
+        rec_res, elapse = self.text_recognizer(img_crop_list)
+        return [text if score >= self.drop_score else "" for text, score in rec_res]
+
     def __call__(self, img, cls=True):
         time_dict = {'det': 0, 'rec': 0, 'cls': 0, 'all': 0}
 
@@ -0,0 +1,119 @@
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import logging
+import os
+
+import onnxruntime as ort
+
+from syntellix_api.configs import syntellix_config
+
+EXECUTION_MODES = {
+    "sequential": ort.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": ort.ExecutionMode.ORT_PARALLEL,
+}
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+QUANTIZED_SUFFIX = "_int8"
+
+# the layout and table structure models run with the onnxruntime defaults, all
+# cores and the memory arena, the DEEPDOC_ORT_* thread and arena settings are
+# those of the OCR models; DEEPDOC_ORT_MODEL_PROFILES overrides both
+DEFAULT_MODEL_PROFILES = {
+    family: {"intra_op_num_threads": 0, "inter_op_num_threads": 0, "enable_cpu_mem_arena": True}
+    for family in ("layout", "tsr")
+}
+
+
+def _split(value):
+    return [v.strip() for v in (value or "").split(",") if v.strip()]
+
+
+def model_family(model_name):
+    """
+    `layout.paper`, `layout.manual` ... share the profile of `layout`.
+    """
+    return model_name.split(".")[0]
+
+
+def get_execution_profile(model_name):
+    profile = {
+        "intra_op_num_threads": syntellix_config.DEEPDOC_ORT_INTRA_OP_NUM_THREADS,
+        "inter_op_num_threads": syntellix_config.DEEPDOC_ORT_INTER_OP_NUM_THREADS,
+        "execution_mode": syntellix_config.DEEPDOC_ORT_EXECUTION_MODE,
+        "graph_optimization_level": syntellix_config.DEEPDOC_ORT_GRAPH_OPTIMIZATION_LEVEL,
+        "enable_cpu_mem_arena": syntellix_config.DEEPDOC_ORT_ENABLE_CPU_MEM_ARENA,
+        "providers": _split(syntellix_config.DEEPDOC_ORT_PROVIDERS),
+        "quantized": model_family(model_name) in _split(syntellix_config.DEEPDOC_ORT_QUANTIZED_MODELS),
+    }
+    profile.update(DEFAULT_MODEL_PROFILES.get(model_family(model_name), {}))
+    overrides = syntellix_config.DEEPDOC_ORT_MODEL_PROFILES
+    for name in dict.fromkeys([model_family(model_name), model_name]):
+        profile.update(overrides.get(name, {}))
+    if isinstance(profile["providers"], str):
+        profile["providers"] = _split(profile["providers"])
+    return profile
+
+
+def build_session_options(profile):
+    options = ort.SessionOptions()
+    options.enable_cpu_mem_arena = bool(profile["enable_cpu_mem_arena"])
+    options.execution_mode = EXECUTION_MODES[profile["execution_mode"].lower()]
+    options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[profile["graph_optimization_level"].lower()]
+    options.intra_op_num_threads = int(profile["intra_op_num_threads"])
+    options.inter_op_num_threads = int(profile["inter_op_num_threads"])
+    return options
+
+
+def resolve_providers(providers):
+    available = ort.get_available_providers()
+    resolved = [p for p in providers if p in available]
+    skipped = [p for p in providers if p not in available]
+    if skipped:
+        logging.warning(f"onnxruntime providers not available, skipped: {skipped}")
+    if "CPUExecutionProvider" not in resolved:
+        resolved.append("CPUExecutionProvider")
+    return resolved
+
+
+def resolve_model_path(model_dir, model_name, quantized=False):
+    model_file_path = os.path.join(model_dir, model_name + ".onnx")
+    if quantized:
+        quantized_path = os.path.join(model_dir, model_name + QUANTIZED_SUFFIX + ".onnx")
+        if os.path.exists(quantized_path):
+            return quantized_path
+        logging.warning(f"INT8 model not found, fall back to {model_file_path}")
+    return model_file_path
+
+
+def create_session(model_file_path, profile):
+    return ort.InferenceSession(
+        model_file_path,
+        sess_options=build_session_options(profile),
+        providers=resolve_providers(profile["providers"]))
+
+
+def load_session(model_dir, model_name, profile=None):
+    profile = profile or get_execution_profile(model_name)
+    model_file_path = resolve_model_path(model_dir, model_name, profile.get("quantized"))
+    if not os.path.exists(model_file_path):
+        raise ValueError("not find model file path {}".format(
+            model_file_path))
+    logging.info(f"Load {model_file_path} with profile {profile}")
+    return create_session(model_file_path, profile)
@@ -12,13 +12,14 @@
 #
 
 import os
-from copy import deepcopy
 
-import onnxruntime as ort
 from huggingface_hub import snapshot_download
 
 from syntellix_api.rag.utils.file_utils import get_project_base_directory
+from .geometry import (TOP, X0, BoxIndex, best_overlapped, box_array,
+                       overlap_areas, tolerant_order)
 from .operators import *
+from .ort_session import load_session
 
 
 class Recognizer(object):
@@ -43,51 +44,29 @@ class Recognizer(object):
                 model_dir = snapshot_download(repo_id="InfiniFlow/deepdoc",
                                               local_dir=os.path.join(get_project_base_directory(), "rag/res/deepdoc"),
                                               local_dir_use_symlinks=False)
-                model_file_path = os.path.join(model_dir, task_name + ".onnx")
-        else:
-            model_file_path = os.path.join(model_dir, task_name + ".onnx")
 
-        if not os.path.exists(model_file_path):
-            raise ValueError("not find model file path {}".format(
-                model_file_path))
-        if False and ort.get_device() == "GPU":
-            options = ort.SessionOptions()
-            options.enable_cpu_mem_arena = False
-            self.ort_sess = ort.InferenceSession(model_file_path, options=options, providers=[('CUDAExecutionProvider')])
-        else:
-            self.ort_sess = ort.InferenceSession(model_file_path, providers=['CPUExecutionProvider'])
+        self.ort_sess = load_session(model_dir, task_name)
         self.input_names = [node.name for node in self.ort_sess.get_inputs()]
         self.output_names = [node.name for node in self.ort_sess.get_outputs()]
         self.input_shape = self.ort_sess.get_inputs()[0].shape[2:4]
         self.label_list = label_list
+        # several images go through one run only when the batch axis is dynamic,
+        # detection models also need `bbox_num` to split their output per image
+        batch_dim = self.ort_sess.get_inputs()[0].shape[0]
+        self.batchable = not (isinstance(batch_dim, int) and batch_dim > 0) \
+            and ("scale_factor" not in self.input_names or len(self.output_names) > 1)
 
     @staticmethod
     def sort_Y_firstly(arr, threashold):
-        # sort using y1 first and then x1
-        arr = sorted(arr, key=lambda r: (r["top"], r["x0"]))
-        for i in range(len(arr) - 1):
-            for j in range(i, -1, -1):
-                # restore the order using th
-                if abs(arr[j + 1]["top"] - arr[j]["top"]) < threashold \
-                        and arr[j + 1]["x0"] < arr[j]["x0"]:
-                    tmp = deepcopy(arr[j])
-                    arr[j] = deepcopy(arr[j + 1])
-                    arr[j + 1] = deepcopy(tmp)
-        return arr
+        # sort using y1 first and then x1, boxes with tops closer than threashold share a row
+        xy = box_array(arr)
+        return [arr[i] for i in tolerant_order(xy[:, TOP], xy[:, X0], threashold)]
 
     @staticmethod
-    def sort_X_firstly(arr, threashold, copy=True):
-        # sort using y1 first and then x1
-        arr = sorted(arr, key=lambda r: (r["x0"], r["top"]))
-        for i in range(len(arr) - 1):
-            for j in range(i, -1, -1):
-                # restore the order using th
-                if abs(arr[j + 1]["x0"] - arr[j]["x0"]) < threashold \
-                        and arr[j + 1]["top"] < arr[j]["top"]:
-                    tmp = deepcopy(arr[j]) if copy else arr[j]
-                    arr[j] = deepcopy(arr[j + 1]) if copy else arr[j + 1]
-                    arr[j + 1] = deepcopy(tmp) if copy else tmp
-        return arr
+    def sort_X_firstly(arr, threashold):
+        # sort using x1 first and then y1, boxes with x0 closer than threashold share a column
+        xy = box_array(arr)
+        return [arr[i] for i in tolerant_order(xy[:, X0], xy[:, TOP], threashold)]
 
     @staticmethod
     def sort_C_firstly(arr, thr=0):
@@ -159,6 +138,7 @@ class Recognizer(object):
                         a["bottom"] < b["top"],
                         a["top"] > b["bottom"]])
 
+        boxes_xy = None
         i = 0
         while i + 1 < len(layouts):
             j = i + 1
@@ -181,12 +161,9 @@ class Recognizer(object):
                     layouts.pop(i)
                 continue
 
-            area_i, area_i_1 = 0, 0
-            for b in boxes:
-                if not notOverlapped(b, layouts[i]):
-                    area_i += Recognizer.overlapped_area(b, layouts[i], False)
-                if not notOverlapped(b, layouts[j]):
-                    area_i_1 += Recognizer.overlapped_area(b, layouts[j], False)
+            if boxes_xy is None:
+                boxes_xy = box_array(boxes)
+            area_i, area_i_1 = overlap_areas(boxes_xy, box_array([layouts[i], layouts[j]]), False).sum(axis=0)
 
             if area_i > area_i_1:
                 layouts.pop(j)
@@ -237,38 +214,14 @@ class Recognizer(object):
 
     @staticmethod
     def find_overlapped(box, boxes_sorted_by_y, naive=False):
+        """
+        Index of the box overlapping the largest fraction of itself with `box`.
+        Looking up many boxes against the same list is faster through a
+        `BoxIndex` built once.
+        """
         if not boxes_sorted_by_y:
             return
-        bxs = boxes_sorted_by_y
-        s, e, ii = 0, len(bxs), 0
-        while s < e and not naive:
-            ii = (e + s) // 2
-            pv = bxs[ii]
-            if box["bottom"] < pv["top"]:
-                e = ii
-                continue
-            if box["top"] > pv["bottom"]:
-                s = ii + 1
-                continue
-            break
-        while s < ii:
-            if box["top"] > bxs[s]["bottom"]:
-                s += 1
-            break
-        while e - 1 > ii:
-            if box["bottom"] < bxs[e - 1]["top"]:
-                e -= 1
-            break
-
-        max_overlaped_i, max_overlaped = None, 0
-        for i in range(s, e):
-            ov = Recognizer.overlapped_area(bxs[i], box)
-            if ov <= max_overlaped:
-                continue
-            max_overlaped_i = i
-            max_overlaped = ov
-
-        return max_overlaped_i
+        return BoxIndex(boxes_sorted_by_y).find_overlapped(box)
 
     @staticmethod
     def find_horizontally_tightest_fit(box, boxes):
@@ -287,18 +240,8 @@ class Recognizer(object):
     def find_overlapped_with_threashold(box, boxes, thr=0.3):
         if not boxes:
             return
-        max_overlapped_i, max_overlapped, _max_overlapped = None, thr, 0
-        s, e = 0, len(boxes)
-        for i in range(s, e):
-            ov = Recognizer.overlapped_area(box, boxes[i])
-            _ov = Recognizer.overlapped_area(boxes[i], box)
-            if (ov, _ov) < (max_overlapped, _max_overlapped):
-                continue
-            max_overlapped_i = i
-            max_overlapped = ov
-            _max_overlapped = _ov
-
-        return max_overlapped_i
+        a, bxs = box_array([box]), box_array(boxes)
+        return best_overlapped(overlap_areas(a, bxs)[0], overlap_areas(bxs, a)[:, 0], thr)
 
     def preprocess(self, image_list):
         inputs = []
@@ -356,46 +299,6 @@ class Recognizer(object):
             y[:, 3] = x[:, 1] + x[:, 3] / 2
             return y
 
-        def compute_iou(box, boxes):
-            # Compute xmin, ymin, xmax, ymax for both boxes
-            xmin = np.maximum(box[0], boxes[:, 0])
-            ymin = np.maximum(box[1], boxes[:, 1])
-            xmax = np.minimum(box[2], boxes[:, 2])
-            ymax = np.minimum(box[3], boxes[:, 3])
-
-            # Compute intersection area
-            intersection_area = np.maximum(0, xmax - xmin) * np.maximum(0, ymax - ymin)
-
-            # Compute union area
-            box_area = (box[2] - box[0]) * (box[3] - box[1])
-            boxes_area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
-            union_area = box_area + boxes_area - intersection_area
-
-            # Compute IoU
-            iou = intersection_area / union_area
-
-            return iou
-
-        def iou_filter(boxes, scores, iou_threshold):
-            sorted_indices = np.argsort(scores)[::-1]
-
-            keep_boxes = []
-            while sorted_indices.size > 0:
-                # Pick the last box
-                box_id = sorted_indices[0]
-                keep_boxes.append(box_id)
-
-                # Compute IoU of the picked box with the rest
-                ious = compute_iou(boxes[box_id, :], boxes[sorted_indices[1:], :])
-
-                # Remove boxes with IoU over the threshold
-                keep_indices = np.where(ious < iou_threshold)[0]
-
-                # print(keep_indices.shape, sorted_indices.shape)
-                sorted_indices = sorted_indices[keep_indices + 1]
-
-            return keep_boxes
-
         boxes = np.squeeze(boxes).T
         # Filter out object confidence scores below threshold
         scores = np.max(boxes[:, 4:], axis=1)
@@ -410,14 +313,7 @@ class Recognizer(object):
         boxes = np.multiply(boxes, input_shape, dtype=np.float32)
         boxes = xywh2xyxy(boxes)
 
-        unique_class_ids = np.unique(class_ids)
-        indices = []
-        for class_id in unique_class_ids:
-            class_indices = np.where(class_ids == class_id)[0]
-            class_boxes = boxes[class_indices, :]
-            class_scores = scores[class_indices]
-            class_keep_boxes = iou_filter(class_boxes, class_scores, 0.2)
-            indices.extend(class_indices[class_keep_boxes])
+        indices = self.nms(boxes, scores, class_ids, 0.2)
 
         return [{
             "type": self.label_list[class_ids[i]].lower(),
@@ -425,6 +321,54 @@ class Recognizer(object):
             "score": float(scores[i])
         } for i in indices]
 
+    @staticmethod
+    def nms(boxes, scores, class_ids, iou_threshold):
+        """
+        Per-class non-maximum suppression over one IoU matrix. Boxes are shifted
+        by class so boxes of different classes never overlap. Kept indices are
+        grouped by class id and sorted by descending score within a class.
+        """
+        offsets = class_ids[:, np.newaxis] * (boxes.max() - boxes.min() + 1)
+        order = np.argsort(scores)[::-1]
+        shifted = (boxes + offsets)[order]
+        x0, y0, x1, y1 = shifted[:, 0], shifted[:, 1], shifted[:, 2], shifted[:, 3]
+        areas = (x1 - x0) * (y1 - y0)
+        inter = np.maximum(0, np.minimum(x1[:, None], x1[None, :]) - np.maximum(x0[:, None], x0[None, :])) \
+            * np.maximum(0, np.minimum(y1[:, None], y1[None, :]) - np.maximum(y0[:, None], y0[None, :]))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ious = inter / (areas[:, None] + areas[None, :] - inter)
+
+        keep = np.ones(len(order), dtype=bool)
+        for i in range(len(order)):
+            if keep[i]:
+                keep[i + 1:] &= ious[i, i + 1:] < iou_threshold
+        kept = order[keep]
+        return kept[np.lexsort((-scores[kept], class_ids[kept]))]
+
+    def split_outputs(self, outputs, batch_size):
+        if "scale_factor" in self.input_names:
+            # detections of all images are concatenated, `bbox_num` tells how many belong to each
+            ends = np.cumsum(outputs[1])
+            return [outputs[0][e - n:e] for n, e in zip(outputs[1], ends)]
+        return [outputs[0][i:i + 1] for i in range(batch_size)]
+
+    def run_batch(self, inputs, thr):
+        if not self.batchable:
+            return [self.postprocess(self.ort_sess.run(None, {k: v for k, v in ins.items() if k in self.input_names})[0], ins, thr)
+                    for ins in inputs]
+
+        # images of the same preprocessed size go through one run, so nothing needs padding
+        buckets = {}
+        for i, ins in enumerate(inputs):
+            buckets.setdefault(ins[self.input_names[0]].shape, []).append(i)
+        res = [None] * len(inputs)
+        for idx in buckets.values():
+            feeds = {k: np.concatenate([inputs[i][k] for i in idx]) for k in self.input_names if k in inputs[idx[0]]}
+            outputs = self.ort_sess.run(None, feeds)
+            for i, out in zip(idx, self.split_outputs(outputs, len(idx))):
+                res[i] = self.postprocess(out, inputs[i], thr)
+        return res
+
     def __call__(self, image_list, thr=0.7, batch_size=16):
         res = []
         imgs = []
@@ -439,14 +383,8 @@ class Recognizer(object):
             end_index = min((i + 1) * batch_size, len(imgs))
             batch_image_list = imgs[start_index:end_index]
             inputs = self.preprocess(batch_image_list)
-            print("preprocess")
-            for ins in inputs:
-                bb = self.postprocess(self.ort_sess.run(None, {k:v for k,v in ins.items() if k in self.input_names})[0], ins, thr)
-                res.append(bb)
+            res.extend(self.run_batch(inputs, thr))
 
         #seeit.save_results(image_list, res, self.label_list, threshold=thr)
 
         return res
-
-
-
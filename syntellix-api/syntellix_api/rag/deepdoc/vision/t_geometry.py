@@ -0,0 +1,161 @@
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import os
+import sys
+sys.path.insert(
+    0,
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(
+                os.path.abspath(__file__)),
+            '../../')))
+
+import argparse
+import random
+from timeit import default_timer as timer
+
+from syntellix_api.rag.deepdoc.parser.pdf_parser import RAGFlowPdfParser
+from syntellix_api.rag.deepdoc.vision import Recognizer
+from syntellix_api.rag.deepdoc.vision.geometry import BoxIndex
+
+
+def dense_page(lines, columns, jitter=1.0):
+    """
+    Boxes laid out like a dense page of small text, e.g. a large table, in
+    random order and with tops slightly off their line.
+    """
+    boxes = []
+    for line in range(lines):
+        for col in range(columns):
+            top = line * 14 + random.uniform(-jitter, jitter)
+            x0 = col * 40 + random.uniform(0, 4)
+            boxes.append({"x0": x0, "x1": x0 + 34, "top": top, "bottom": top + 11,
+                          "text": "", "page_number": 1})
+    random.shuffle(boxes)
+    return boxes
+
+
+def staircase_page(steps, step=3, width=50):
+    """
+    Boxes whose tops go down by less than the sort threshold while their x0
+    go left, so that neighbouring boxes share a line but the first and last
+    ones do not.
+    """
+    boxes = []
+    for i in range(steps):
+        top, x0 = i * step, (steps - i) * width
+        boxes.append({"x0": x0, "x1": x0 + 34, "top": top, "bottom": top + 11,
+                      "text": "", "page_number": 1})
+    random.shuffle(boxes)
+    return boxes
+
+
+def jittered_page(n, height=800, width=600):
+    """
+    Boxes at random positions, half of them snapped to a coarse grid so that
+    tops and x0 often tie or differ by about the sort threshold.
+    """
+    boxes = []
+    for _ in range(n):
+        top = random.choice([random.uniform(0, height), random.randint(0, height // 3) * 3])
+        x0 = random.choice([random.uniform(0, width), random.randint(0, width // 5) * 5])
+        boxes.append({"x0": x0, "x1": x0 + 20, "top": top, "bottom": top + 11,
+                      "text": "", "page_number": random.randint(1, 3)})
+    return boxes
+
+
+def legacy_sort_X_by_page(arr, threashold):
+    # the insertion pass RAGFlowPdfParser.sort_X_by_page used before it was vectorized
+    arr = sorted(arr, key=lambda r: (r["page_number"], r["x0"], r["top"]))
+    for i in range(len(arr) - 1):
+        for j in range(i, -1, -1):
+            if abs(arr[j + 1]["x0"] - arr[j]["x0"]) < threashold \
+                    and arr[j + 1]["top"] < arr[j]["top"] \
+                    and arr[j + 1]["page_number"] == arr[j]["page_number"]:
+                arr[j], arr[j + 1] = arr[j + 1], arr[j]
+    return arr
+
+
+def legacy_sort_Y_firstly(arr, threashold):
+    # the insertion pass sort_Y_firstly used before it was vectorized
+    arr = sorted(arr, key=lambda r: (r["top"], r["x0"]))
+    for i in range(len(arr) - 1):
+        for j in range(i, -1, -1):
+            if abs(arr[j + 1]["top"] - arr[j]["top"]) < threashold \
+                    and arr[j + 1]["x0"] < arr[j]["x0"]:
+                arr[j], arr[j + 1] = arr[j + 1], arr[j]
+    return arr
+
+
+def legacy_find_overlapped(box, boxes):
+    max_overlaped_i, max_overlaped = None, 0
+    for i in range(len(boxes)):
+        ov = Recognizer.overlapped_area(boxes[i], box)
+        if ov <= max_overlaped:
+            continue
+        max_overlaped_i = i
+        max_overlaped = ov
+    return max_overlaped_i
+
+
+def bench(name, legacy, vectorized):
+    st = timer()
+    expected = legacy()
+    legacy_elapsed = timer() - st
+    st = timer()
+    res = vectorized()
+    elapsed = timer() - st
+    print(f"{name}\tlegacy: {legacy_elapsed:.3f}s\tvectorized: {elapsed:.3f}s"
+          f"\tspeedup: {legacy_elapsed / elapsed:.1f}x\tsame result: {res == expected}")
+
+
+def main(args):
+    random.seed(args.seed)
+    boxes = dense_page(args.lines, args.columns)
+    print(f"{len(boxes)} boxes")
+    bench("sort_Y_firstly", lambda: legacy_sort_Y_firstly(boxes, 4),
+          lambda: Recognizer.sort_Y_firstly(boxes, 4))
+
+    staircase = staircase_page(args.lines)
+    bench("sort_Y_firstly staircase", lambda: legacy_sort_Y_firstly(staircase, 4),
+          lambda: Recognizer.sort_Y_firstly(staircase, 4))
+
+    pages = [jittered_page(random.randint(1, 200)) for _ in range(args.pages)]
+    diff_y = sum(legacy_sort_Y_firstly(page, 4) != Recognizer.sort_Y_firstly(page, 4) for page in pages)
+    diff_x = sum(legacy_sort_X_by_page(page, 6) != RAGFlowPdfParser.sort_X_by_page(page, 6) for page in pages)
+    print(f"{len(pages)} jittered pages\tsort_Y_firstly differs on: {diff_y}"
+          f"\tsort_X_by_page differs on: {diff_x}")
+
+    rows = Recognizer.sort_Y_firstly(boxes, 4)
+    chars = dense_page(args.lines, args.columns * 4, jitter=0)[:args.queries]
+    for c in chars:
+        c["x1"] = c["x0"] + 8
+
+    def indexed():
+        index = BoxIndex(rows)
+        return [index.find_overlapped(c) for c in chars]
+
+    bench("find_overlapped", lambda: [legacy_find_overlapped(c, rows) for c in chars], indexed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lines', help="Text lines of the synthetic page. Default: 120", type=int, default=120)
+    parser.add_argument('--columns', help="Boxes per line. Default: 20", type=int, default=20)
+    parser.add_argument('--queries', help="Chars looked up against the boxes. Default: 2000", type=int, default=2000)
+    parser.add_argument('--pages', help="Jittered pages checked against the legacy sorts. Default: 2000",
+                        type=int, default=2000)
+    parser.add_argument('--seed', help="Random seed. Default: 0", type=int, default=0)
+    args = parser.parse_args()
+    main(args)
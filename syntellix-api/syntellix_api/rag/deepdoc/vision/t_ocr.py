@@ -25,11 +25,47 @@ from syntellix_api.rag.deepdoc.vision.seeit import draw_box
 from syntellix_api.rag.deepdoc.vision import OCR, init_in_out
 import argparse
 import numpy as np
+from timeit import default_timer as timer
+
+
+def bench(ocr, images):
+    """
+    Text recognition throughput of detected boxes, one box per run vs batched.
+    """
+    boxes = []
+    for img in images:
+        img = np.array(img)
+        detected = ocr.detect(img)
+        # pages without text come back as (None, None, time_dict)
+        if isinstance(detected, tuple) and detected[0] is None:
+            detected = []
+        boxes.append((img, [b for b, _ in detected]))
+    total = sum([len(bxs) for _, bxs in boxes])
+    if not total:
+        print("no text detected")
+        return
+
+    st = timer()
+    single = [[ocr.recognize(img, b) for b in bxs] for img, bxs in boxes]
+    single_elapsed = timer() - st
+
+    st = timer()
+    batched = [ocr.recognize_batch(img, bxs) for img, bxs in boxes]
+    batched_elapsed = timer() - st
+
+    same = sum([a == b for s, t in zip(single, batched) for a, b in zip(s, t)])
+    print(f"boxes: {total}")
+    print(f"one by one: {single_elapsed:.2f}s, {total / single_elapsed:.1f} boxes/s")
+    print(f"batched: {batched_elapsed:.2f}s, {total / batched_elapsed:.1f} boxes/s")
+    print(f"identical texts: {same}/{total}")
 
 
 def main(args):
     ocr = OCR()
     images, outputs = init_in_out(args)
+    if args.bench:
+        bench(ocr, images)
+        return
 
     for i, img in enumerate(images):
         bxs = ocr(np.array(img))
@@ -52,5 +88,7 @@ if __name__ == "__main__":
                         required=True)
     parser.add_argument('--output_dir', help="Directory where to store the output images. Default: './ocr_outputs'",
                         default="./ocr_outputs")
+    parser.add_argument('--bench', help="Benchmark one-by-one against batched text recognition",
+                        action="store_true")
     args = parser.parse_args()
     main(args)
@@ -0,0 +1,131 @@
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import os
+import sys
+sys.path.insert(
+    0,
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(
+                os.path.abspath(__file__)),
+            '../../')))
+
+import argparse
+import json
+from concurrent.futures import ThreadPoolExecutor
+from timeit import default_timer as timer
+
+import numpy as np
+
+from syntellix_api.rag.deepdoc.vision.ort_session import (QUANTIZED_SUFFIX, create_session,
+                                                          get_execution_profile, resolve_model_path)
+from syntellix_api.rag.utils.file_utils import get_project_base_directory
+
+DEFAULT_HW = {"det": (960, 960), "rec": (48, 320), "layout": (640, 640), "tsr": (640, 640)}
+
+
+def dummy_inputs(sess, model_name):
+    h, w = DEFAULT_HW.get(model_name.split(".")[0], (640, 640))
+    feeds = {}
+    for node in sess.get_inputs():
+        shape = [d if isinstance(d, int) and d > 0 else None for d in node.shape]
+        if len(shape) == 4:
+            shape = [1, shape[1] or 3, shape[2] or h, shape[3] or w]
+            h, w = shape[2], shape[3]
+            feeds[node.name] = np.random.rand(*shape).astype(np.float32)
+        elif node.name == "im_shape":
+            feeds[node.name] = np.array([[h, w]], dtype=np.float32)
+        else:
+            feeds[node.name] = np.ones([d or 1 for d in shape] or [1, 2], dtype=np.float32)
+    return feeds
+
+
+def candidate_profiles(base, cores):
+    threads = sorted(set([1, 2, 4, 8, 16, cores]) & set(range(1, cores + 1)))
+    for intra in threads:
+        for mode in ["sequential", "parallel"]:
+            for arena in [False, True]:
+                yield {**base,
+                       "intra_op_num_threads": intra,
+                       "inter_op_num_threads": 1 if mode == "sequential" else 2,
+                       "execution_mode": mode,
+                       "enable_cpu_mem_arena": arena}
+
+
+def bench_profile(model_file_path, model_name, profile, cores, runs):
+    """
+    Aggregate throughput of `cores // intra_op_num_threads` concurrent callers,
+    which is how ingest workers share a host.
+    """
+    sess = create_session(model_file_path, profile)
+    feeds = dummy_inputs(sess, model_name)
+    sess.run(None, feeds)
+    concurrency = max(1, cores // profile["intra_op_num_threads"])
+
+    def worker(_):
+        for _ in range(runs):
+            sess.run(None, feeds)
+
+    st = timer()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    elapsed = timer() - st
+    return concurrency * runs / elapsed, elapsed / runs
+
+
+def quantize(model_dir, model_name):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    src = os.path.join(model_dir, model_name + ".onnx")
+    dst = os.path.join(model_dir, model_name + QUANTIZED_SUFFIX + ".onnx")
+    quantize_dynamic(src, dst, weight_type=QuantType.QInt8)
+    print(f"save INT8 model to: {dst}")
+
+
+def main(args):
+    cores = args.cores or os.cpu_count()
+    best = {}
+    for model_name in args.models.split(","):
+        if args.quantize:
+            quantize(args.model_dir, model_name)
+        base = get_execution_profile(model_name)
+        for quantized in ([False, True] if args.quantize else [base["quantized"]]):
+            base["quantized"] = quantized
+            model_file_path = resolve_model_path(args.model_dir, model_name, quantized)
+            for profile in candidate_profiles(base, cores):
+                ips, latency = bench_profile(model_file_path, model_name, profile, cores, args.runs)
+                print(f"{model_name}\tint8={quantized}\tintra={profile['intra_op_num_threads']}"
+                      f"\tmode={profile['execution_mode']}\tarena={profile['enable_cpu_mem_arena']}"
+                      f"\t{ips:.2f} inferences/s\t{latency * 1000:.1f} ms/worker-run")
+                if ips > best.get(model_name, (0, None))[0]:
+                    best[model_name] = (ips, dict(profile))
+
+    profiles = {}
+    for model_name, (ips, profile) in best.items():
+        profile.pop("providers", None)
+        profiles[model_name] = profile
+        print(f"best for {model_name} on {cores} cores: {ips:.2f} inferences/s")
+    print("DEEPDOC_ORT_MODEL_PROFILES=" + json.dumps(profiles))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--models', help="Comma separated deepdoc models to benchmark", default="det,rec,layout,tsr")
+    parser.add_argument('--model_dir', help="Directory of the deepdoc onnx models",
+                        default=os.path.join(get_project_base_directory(), "rag/res/deepdoc"))
+    parser.add_argument('--cores', help="Cores to size the profiles for. Default: all cores of the host",
+                        type=int, default=0)
+    parser.add_argument('--runs', help="Inferences per concurrent worker", type=int, default=5)
+    parser.add_argument('--quantize', help="Build INT8 variants and benchmark them as well", action="store_true")
+    args = parser.parse_args()
+    main(args)
@@ -24,6 +24,7 @@ from syntellix_api.rag.deepdoc.vision import Recognizer, LayoutRecognizer, Table
 from syntellix_api.rag.utils.file_utils import get_project_base_directory
 import argparse
 import re
+from timeit import default_timer as timer
 import numpy as np
 
 
@@ -42,6 +43,10 @@ def main(args):
         detr = TableStructureRecognizer()
         ocr = OCR()
 
+    if args.bench:
+        bench(detr, images, float(args.threshold))
+        return
+
     layouts = detr(images, float(args.threshold))
     for i, lyt in enumerate(layouts):
         if args.mode.lower() == "tsr":
@@ -59,6 +64,19 @@ def main(args):
         print("save result to: " + outputs[i])
 
 
+def bench(detr, images, thr):
+    # warm up so neither run pays for the first session call
+    detr(images[:1], thr)
+    batchable = detr.batchable
+    for batched in sorted({False, batchable}):
+        detr.batchable = batched
+        st = timer()
+        detr(images, thr)
+        elapsed = timer() - st
+        print(f"batched={batched}\timages={len(images)}\t{elapsed:.2f}s\t{len(images) / elapsed:.2f} images/s")
+    detr.batchable = batchable
+
+
 def get_table_html(img, tb_cpns, ocr):
     boxes = ocr(np.array(img))
     boxes = Recognizer.sort_Y_firstly(
@@ -183,5 +201,7 @@ if __name__ == "__main__":
         default=0.5)
     parser.add_argument('--mode', help="Task mode: layout recognition or table structure recognition", choices=["layout", "tsr"],
                         default="layout")
+    parser.add_argument('--bench', help="Compare per-image and batched inference throughput instead of saving results",
+                        action="store_true")
     args = parser.parse_args()
     main(args)
@@ -1,14 +1,34 @@
-from typing import List, cast
+from typing import List, Optional, cast
 
+import numpy as np
 from sentence_transformers import SentenceTransformer
 from syntellix_api.configs import syntellix_config
 
 
+def truncate_embeddings(embeddings, dimensions: int, normalize_embeddings: bool = True):
+    """
+    The first `dimensions` of every embedding, normalized again to unit length
+    when the full embeddings were.
+    """
+    embeddings = np.asarray(embeddings)
+    if not dimensions or dimensions >= embeddings.shape[-1]:
+        return embeddings
+    embeddings = embeddings[..., :dimensions]
+    if normalize_embeddings:
+        norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+        embeddings = embeddings / np.where(norms == 0, 1, norms)
+    return embeddings
+
+
 class EmbeddingModel:
-    def __init__(self, model_name: str):
+    def __init__(self, model_name: str, dimensions: Optional[int] = None):
         # Initialize the model in the main process
         self.model_name = model_name
         self.model = None
+        # indexed and query embeddings must be truncated alike, both follow the config by default
+        self.dimensions = (
+            syntellix_config.EMBEDDING_DIMENSIONS if dimensions is None else dimensions
+        )
 
     def initialize_model(self):
         # Initialize the model when needed
@@ -17,13 +37,14 @@ class EmbeddingModel:
 
     def encode(self, sentences: list[str], normalize_embeddings: bool = True):
         self.initialize_model()
+        embeddings = self.model.encode(
+            sentences,
+            normalize_embeddings=normalize_embeddings,
+            show_progress_bar=True,
+        )
         return cast(
             List[float],
-            self.model.encode(
-                sentences,
-                normalize_embeddings=normalize_embeddings,
-                show_progress_bar=True,
-            ),
+            truncate_embeddings(embeddings, self.dimensions, normalize_embeddings),
         )
 
 
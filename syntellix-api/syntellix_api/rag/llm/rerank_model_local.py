@@ -37,9 +37,19 @@ class RerankModel:
         return np.array(res), token_count
 
     def similarity_batch(self, query: str, texts: list):
+        return self.similarity_pairs([(query, t) for t in texts])
+
+    def similarity_pairs(self, pairs: list, batch_size: int = 256) -> list:
+        """
+        Normalized scores of (query, text) pairs, of one or many queries,
+        computed together in batches of `batch_size` pairs.
+        """
         self.initialize_model()
-        pairs = [(query, t) for t in texts]
-        return self.model.compute_score(pairs, normalize=True)
+        if not pairs:
+            return []
+        scores = self.model.compute_score(pairs, batch_size=batch_size, normalize=True)
+        # a single pair gets a bare score
+        return [scores] if isinstance(scores, float) else list(scores)
 
 
 if __name__ == "__main__":
@@ -17,7 +17,7 @@
 import random
 from collections import Counter
 
-from syntellix_api.rag.utils.parser_utils import num_tokens_from_string
+from syntellix_api.rag.utils.parser_utils import num_tokens_from_string, num_tokens_from_strings
 from syntellix_api.rag.nlp import rag_tokenizer
 import re
 import copy
@@ -221,20 +221,38 @@ def is_english(texts):
     return False
 
 
+TABLE_TAG = r"</?(table|td|caption|tr|th)( [^<>]{0,12})?>"
+
+
 def tokenize(d, t, eng):
     d["content_with_weight"] = t
-    t = re.sub(r"</?(table|td|caption|tr|th)( [^<>]{0,12})?>", " ", t)
+    t = re.sub(TABLE_TAG, " ", t)
     d["content_ltks"] = rag_tokenizer.tokenize(t)
     d["content_sm_ltks"] = rag_tokenizer.fine_grained_tokenize(d["content_ltks"])
 
 
+def tokenize_docs(docs, texts, eng):
+    """
+    `tokenize` of every doc with its text, all texts tokenized in one batch.
+    """
+    for d, t in zip(docs, texts):
+        d["content_with_weight"] = t
+    tokenize_contents(docs, [re.sub(TABLE_TAG, " ", t) for t in texts])
+
+
+def tokenize_contents(docs, texts):
+    for d, (ltks, sm_ltks) in zip(docs, rag_tokenizer.tokenize_batch(texts, fine_grained=True)):
+        d["content_ltks"] = ltks
+        d["content_sm_ltks"] = sm_ltks
+
+
 def tokenize_chunks(chunks, doc, eng, pdf_parser=None):
-    res = []
+    res, texts = [], []
     # wrap up as es documents
     for ck in chunks:
         if len(ck.strip()) == 0:continue
-        print("--", ck)
-        d = copy.deepcopy(doc)
+        # the template only holds strings, a shallow copy per chunk is enough
+        d = copy.copy(doc)
         if pdf_parser:
             try:
                 d["image"], poss = pdf_parser.crop(ck, need_position=True)
@@ -242,46 +260,47 @@ def tokenize_chunks(chunks, doc, eng, pdf_parser=None):
                 ck = pdf_parser.remove_tag(ck)
             except NotImplementedError as e:
                 pass
-        tokenize(d, ck, eng)
         res.append(d)
+        texts.append(ck)
+    tokenize_docs(res, texts, eng)
     return res
 
 
 def tokenize_chunks_docx(chunks, doc, eng, images):
-    res = []
+    res, texts = [], []
     # wrap up as es documents
     for ck, image in zip(chunks, images):
         if len(ck.strip()) == 0:continue
-        print("--", ck)
-        d = copy.deepcopy(doc)
+        d = copy.copy(doc)
         d["image"] = image
-        tokenize(d, ck, eng)
         res.append(d)
+        texts.append(ck)
+    tokenize_docs(res, texts, eng)
     return res
 
 
 def tokenize_table(tbls, doc, eng, batch_size=10):
-    res = []
+    res, texts = [], []
     # add tables
     for (img, rows), poss in tbls:
         if not rows:
             continue
         if isinstance(rows, str):
-            d = copy.deepcopy(doc)
-            tokenize(d, rows, eng)
-            d["content_with_weight"] = rows
+            d = copy.copy(doc)
             if img: d["image"] = img
             if poss: add_positions(d, poss)
             res.append(d)
+            texts.append(rows)
             continue
         de = "; " if eng else "； "
         for i in range(0, len(rows), batch_size):
-            d = copy.deepcopy(doc)
+            d = copy.copy(doc)
             r = de.join(rows[i:i + batch_size])
-            tokenize(d, r, eng)
             d["image"] = img
             add_positions(d, poss)
             res.append(d)
+            texts.append(r)
+    tokenize_docs(res, texts, eng)
     return res
 
 
@@ -470,48 +489,76 @@ def hierarchical_merge(bull, sections, depth):
     return res
 
 
+class ChunkBuilder:
+    """
+    Merges consecutive sections into chunks: a chunk takes sections until it
+    holds more than `chunk_token_num` tokens. Token counts are encoded in
+    batches and summed as sections come, and the parts of a chunk are joined
+    once it is closed, so merging is linear in the size of the input.
+    """
+    BATCH_SIZE = 1024
+
+    def __init__(self, chunk_token_num=128, with_images=False):
+        self.chunk_token_num = chunk_token_num
+        self.with_images = with_images
+        self.chunks, self.images = [], []
+        self.parts, self.positions, self.part_images, self.tk_num = [], set(), [], 0
+
+    def add(self, t, tnum, pos="", image=None):
+        if not pos or tnum < 8:
+            pos = ""
+        if self.tk_num > self.chunk_token_num:
+            self.close()
+            if pos and pos not in t:
+                t += pos
+        elif pos and pos not in self.positions:
+            # positions are tracked by tag instead of searching the chunk text for them
+            t += pos
+        if pos:
+            self.positions.add(pos)
+        self.parts.append(t)
+        self.part_images.append(image)
+        self.tk_num += tnum
+
+    def extend(self, sections):
+        """
+        Add (text, position tag) or, `with_images`, (text, image) sections.
+        """
+        batch = []
+        for sec in sections:
+            batch.append(sec)
+            if len(batch) >= self.BATCH_SIZE:
+                self.add_batch(batch)
+                batch = []
+        self.add_batch(batch)
+
+    def add_batch(self, sections):
+        tnums = num_tokens_from_strings([t for t, _ in sections])
+        for (t, extra), tnum in zip(sections, tnums):
+            if self.with_images:
+                self.add(t, tnum, image=extra)
+            else:
+                self.add(t, tnum, extra)
+
+    def close(self):
+        self.chunks.append("".join(self.parts))
+        if self.with_images:
+            self.images.append(concat_imgs(self.part_images))
+        self.parts, self.positions, self.part_images, self.tk_num = [], set(), [], 0
+
+    def finish(self):
+        self.close()
+        return self.chunks
+
+
 def naive_merge(sections, chunk_token_num=128, delimiter="\n。；！？"):
     if not sections:
         return []
     if isinstance(sections[0], type("")):
         sections = [(s, "") for s in sections]
-    cks = [""]
-    tk_nums = [0]
-
-    def add_chunk(t, pos):
-        nonlocal cks, tk_nums, delimiter
-        tnum = num_tokens_from_string(t)
-        if not pos: pos = ""
-        if tnum < 8:
-            pos = ""
-        # Ensure that the length of the merged chunk does not exceed chunk_token_num  
-        if tk_nums[-1] > chunk_token_num:
-
-            if t.find(pos) < 0:
-                t += pos
-            cks.append(t)
-            tk_nums.append(tnum)
-        else:
-            if cks[-1].find(pos) < 0:
-                t += pos
-            cks[-1] += t
-            tk_nums[-1] += tnum
-
-    for sec, pos in sections:
-        add_chunk(sec, pos)
-        continue
-        s, e = 0, 1
-        while e < len(sec):
-            if sec[e] in delimiter:
-                add_chunk(sec[s: e + 1], pos)
-                s = e + 1
-                e = s + 1
-            else:
-                e += 1
-        if s < e:
-            add_chunk(sec[s: e], pos)
-
-    return cks
+    builder = ChunkBuilder(chunk_token_num)
+    builder.extend(sections)
+    return builder.finish()
 
 
 def docx_question_level(p, bull = -1):
@@ -547,36 +594,29 @@ def concat_img(img1, img2):
     return new_image
 
 
+def concat_imgs(imgs):
+    """
+    The images stacked from top to bottom at once, same as folding them with
+    `concat_img`.
+    """
+    imgs = [img for img in imgs if img]
+    if len(imgs) < 2:
+        return imgs[0] if imgs else None
+    new_image = Image.new('RGB', (max(img.size[0] for img in imgs), sum(img.size[1] for img in imgs)))
+    top = 0
+    for img in imgs:
+        new_image.paste(img, (0, top))
+        top += img.size[1]
+    return new_image
+
+
 def naive_merge_docx(sections, chunk_token_num=128, delimiter="\n。；！？"):
     if not sections:
         return [], []
 
-    cks = [""]
-    images = [None]
-    tk_nums = [0]
-
-    def add_chunk(t, image, pos=""):
-        nonlocal cks, tk_nums, delimiter
-        tnum = num_tokens_from_string(t)
-        if tnum < 8:
-            pos = ""
-        if tk_nums[-1] > chunk_token_num:
-            if t.find(pos) < 0:
-                t += pos
-            cks.append(t)
-            images.append(image)
-            tk_nums.append(tnum)
-        else:
-            if cks[-1].find(pos) < 0:
-                t += pos
-            cks[-1] += t
-            images[-1] = concat_img(images[-1], image)
-            tk_nums[-1] += tnum
-
-    for sec, image in sections:
-        add_chunk(sec, image, '')
-
-    return cks, images
+    builder = ChunkBuilder(chunk_token_num, with_images=True)
+    builder.extend(sections)
+    return builder.finish(), builder.images
 
 
 def keyword_extraction(chat_mdl, content):
@@ -0,0 +1,186 @@
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import argparse
+import json
+import logging
+import mmap
+import os
+import shutil
+import sys
+import tempfile
+from array import array
+from collections.abc import Mapping
+
+import marisa_trie
+from syntellix_api.rag.utils.file_utils import get_project_base_directory
+
+# bump when the on-disk layout or the way a source is compiled changes
+DICT_FORMAT_VERSION = 2
+
+
+def compiled_dir(name):
+    return os.path.join(get_project_base_directory(), "rag/res/compiled", name)
+
+
+def _map(fnm, fmt):
+    with open(fnm, "rb") as f:
+        if not os.fstat(f.fileno()).st_size:
+            return memoryview(b"").cast(fmt)
+        return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)).cast(fmt)
+
+
+class CompiledDict(Mapping):
+    """
+    A read-only str -> value dictionary compiled by `compile_dict`: a marisa
+    trie of the keys, giving every key an id, and the values by key id, both
+    memory-mapped. The pages are shared by every process mapping the same
+    files, and only the ones a lookup touches are read.
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.table = [tuple(v) if isinstance(v, list) else v for v in self.meta["values"]]
+        self.trie = marisa_trie.Trie()
+        self.trie.mmap(os.path.join(path, "keys.marisa"))
+        self.values = _map(os.path.join(path, "values.bin"), "i")
+
+    def __getitem__(self, key):
+        return self.table[self.values[self.trie[key]]]
+
+    def get(self, key, default=None):
+        i = self.trie.get(key)
+        return default if i is None else self.table[self.values[i]]
+
+    def __contains__(self, key):
+        return key in self.trie
+
+    def __iter__(self):
+        return iter(self.trie)
+
+    def __len__(self):
+        return len(self.trie)
+
+    def has_keys_with_prefix(self, prefix):
+        for _ in self.trie.iterkeys(prefix):
+            return True
+        return False
+
+
+def _source_stamp(source):
+    st = os.stat(source)
+    return {"source": os.path.abspath(source), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def compile_dict(entries, path, source=None):
+    """
+    Write the (key, value) `entries` to `path` as a `CompiledDict`. Values
+    must be JSON serializable, tuples are restored as tuples. The directory
+    is replaced at once so that readers never see a partial dictionary.
+    """
+    entries = dict(entries)
+    trie = marisa_trie.Trie(entries)
+    table, index = [], {}
+    parent = os.path.dirname(path)
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=parent, suffix=".tmp")
+    try:
+        trie.save(os.path.join(tmp, "keys.marisa"))
+        # values in key id order
+        values = array("i", bytes(4 * len(trie)))
+        for k, v in entries.items():
+            hv = json.dumps(v)
+            if hv not in index:
+                index[hv] = len(table)
+                table.append(v)
+            values[trie[k]] = index[hv]
+        with open(os.path.join(tmp, "values.bin"), "wb") as f:
+            f.write(values.tobytes())
+        meta = {
+            "version": DICT_FORMAT_VERSION,
+            "byteorder": sys.byteorder,
+            "count": len(entries),
+            "values": table,
+        }
+        if source:
+            meta.update(_source_stamp(source))
+        with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.rename(tmp, path)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+def is_current(path, source=None):
+    try:
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if meta.get("version") != DICT_FORMAT_VERSION or meta.get("byteorder") != sys.byteorder:
+        return False
+    # a dictionary shipped without its source is current as long as it is readable
+    if not source or not os.path.exists(source):
+        return True
+    stamp = _source_stamp(source)
+    return meta.get("size") == stamp["size"] and meta.get("mtime_ns") == stamp["mtime_ns"]
+
+
+def load_dict(name_or_path, source, entries):
+    """
+    The compiled dictionary of `source`, compiled first from
+    `entries(source)` when it is missing or stale. None when there is
+    neither a compiled dictionary nor a source to compile.
+    """
+    path = name_or_path if os.path.isabs(name_or_path) else compiled_dir(name_or_path)
+    path = f"{path}.v{DICT_FORMAT_VERSION}"
+    if not is_current(path, source):
+        if not source or not os.path.exists(source):
+            return None
+        logging.info(f"Compile dictionary {source} into {path}")
+        try:
+            compile_dict(entries(source), path, source)
+        except OSError as e:
+            # another process may have compiled it meanwhile, else the install is
+            # read-only and the dictionary goes to a private temporary directory
+            if not is_current(path, source):
+                logging.warning(f"Failed to save compiled dictionary {path}: {e}")
+                path = os.path.join(tempfile.mkdtemp(suffix=".dict"), os.path.basename(path))
+                compile_dict(entries(source), path, source)
+    return CompiledDict(path)
+
+
+def main(args):
+    from syntellix_api.rag.nlp import rag_tokenizer, term_weight
+
+    if args.force:
+        shutil.rmtree(os.path.dirname(compiled_dir("_")), ignore_errors=True)
+    tknzr = rag_tokenizer.tokenizer
+    print("huqie:", len(tknzr.trie_), "keys")
+    dealer = term_weight.Dealer()
+    print("ner:", len(dealer.ne), "keys")
+    print("term.freq:", len(dealer.df), "keys")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compile the tokenizer and term weight dictionaries ahead of time, "
+                    "so that workers only map them at first use.")
+    parser.add_argument('--force', help="Recompile even if the compiled dictionaries are current",
+                        action="store_true")
+    args = parser.parse_args()
+    main(args)
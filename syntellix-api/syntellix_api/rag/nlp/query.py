@@ -0,0 +1,63 @@
+#
+#  Copyright 2024 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import re
+
+from syntellix_api.rag.nlp import rag_tokenizer, term_weight
+
+
+class FulltextQueryer:
+    """
+    Full text queries over fields holding the tokens of `rag_tokenizer`,
+    indexed with a whitespace analyzer. Query terms come from the same
+    tokenizer and are weighed by `term_weight.Dealer`, so that the index and
+    the query agree on tokens without any Elasticsearch analysis plugin.
+    """
+
+    def __init__(self):
+        self.tw = term_weight.Dealer()
+
+    @staticmethod
+    def normalize(txt):
+        txt = rag_tokenizer.tradi2simp(rag_tokenizer.strQ2B(txt.lower()))
+        return re.sub(r"[ :\r\n\t,，。？?/`!！&\^%%]+", " ", txt).strip()
+
+    def terms(self, txt):
+        """
+        The weighted terms of `txt` as (term, weight) pairs, weights summing
+        to one.
+        """
+        tks = [t for t in self.tw.split(self.normalize(txt)) if t]
+        if not tks:
+            return []
+        return [(tk, float(w)) for tk, w in self.tw.weights(tks) if tk]
+
+    def question(self, txt, fields, sm_field=None, boost=1.0):
+        """
+        A bool query with a clause per weighted term of `txt` over `fields`,
+        and its fine grained tokens over `sm_field`. None when `txt` has no
+        term left.
+        """
+        should = []
+        for tk, w in self.terms(txt):
+            # terms merged from several tokens must match as a phrase
+            should.append({"multi_match": {"query": tk, "type": "phrase", "fields": fields, "boost": w}})
+            sm = rag_tokenizer.fine_grained_tokenize(tk)
+            if sm_field and sm != tk:
+                should.append({"match": {sm_field: {"query": sm, "boost": w * 0.5}}})
+        if not should:
+            return None
+        return {"bool": {"should": should, "minimum_should_match": 1, "boost": boost}}
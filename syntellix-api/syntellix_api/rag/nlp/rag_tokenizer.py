@@ -16,19 +16,51 @@
 
 import copy
 import datrie
+import logging
 import math
+import multiprocessing
 import os
 import re
 import string
 import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from fractions import Fraction
+from functools import lru_cache
 from hanziconv import HanziConv
 from huggingface_hub import snapshot_download
 from nltk import word_tokenize
 from nltk.stem import PorterStemmer, WordNetLemmatizer
+from syntellix_api.configs import syntellix_config
+from syntellix_api.rag.nlp import compiled_dict
 from syntellix_api.rag.utils.file_utils import get_project_base_directory
 
+_tokenize_pools = {}
+
+
+def _tokenize_batch_worker(lines, fine_grained):
+    return tokenizer.tokenize_batch(lines, fine_grained=fine_grained, workers=0)
+
+
+def get_tokenize_pool(workers):
+    """
+    Tokenize worker pools live for the whole process so that every worker
+    loads the dictionary once.
+    """
+    if workers not in _tokenize_pools:
+        _tokenize_pools[workers] = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"))
+    return _tokenize_pools[workers]
+
 
 class RagTokenizer:
+    MAX_SEGMENT_LEN = 256
+    # bound of each per-process memo of trie lookups and english word normalization
+    CACHE_SIZE = 1 << 18
+    # full width forms to their half width counterparts
+    Q2B_TABLE = {0x3000: 0x0020, **{c: c - 0xfee0 for c in range(0xff00, 0xff5f)}}
+
     def key_(self, line):
         return str(line.lower().encode("utf-8"))[2:-1]
 
@@ -37,6 +69,12 @@ class RagTokenizer:
 
     def loadDict_(self, fnm):
         print("[HUQIE]:Build trie", fnm, file=sys.stderr)
+        if not isinstance(self.trie_, datrie.Trie):
+            # compiled dictionaries are read-only, copy the entries to extend them
+            trie = datrie.Trie(string.printable)
+            for k, v in self.trie_.items():
+                trie[k] = v
+            self.trie_ = trie
         try:
             of = open(fnm, "r", encoding='utf-8')
             while True:
@@ -54,51 +92,84 @@ class RagTokenizer:
             of.close()
         except Exception as e:
             print("[HUQIE]:Faild to build trie, ", fnm, e, file=sys.stderr)
+        self.clear_cache_()
+
+    def dictEntries_(self, fnm):
+        res = {}
+        with open(fnm, "r", encoding='utf-8') as of:
+            for line in of:
+                line = re.sub(r"[\r\n]+", "", line)
+                line = re.split(r"[ \t]", line)
+                k = self.key_(line[0])
+                F = int(math.log(float(line[1]) / self.DENOMINATOR) + .5)
+                if k not in res or res[k][0] < F:
+                    res[k] = (F, line[2])
+                res[self.rkey_(line[0])] = 1
+        return res
+
+    def loadTrie_(self, name, fnm):
+        try:
+            trie = compiled_dict.load_dict(name, fnm, self.dictEntries_)
+            if trie is not None:
+                return trie
+            print("[HUQIE]:No dictionary", fnm, file=sys.stderr)
+        except Exception as e:
+            print("[HUQIE]:Faild to build trie, ", fnm, e, file=sys.stderr)
+        return datrie.Trie(string.printable)
+
+    @property
+    def trie_(self):
+        # the dictionary is mapped at first use, not when the module is imported
+        if self._trie is None:
+            with self._trie_lock:
+                if self._trie is None:
+                    self._trie = self.loadTrie_("huqie", self.DIR_ + ".txt")
+        return self._trie
+
+    @trie_.setter
+    def trie_(self, trie):
+        self._trie = trie
+
+    def clear_cache_(self):
+        # the memos answer for the current trie, rebuild them whenever it changes
+        self.has_prefix_ = lru_cache(maxsize=self.CACHE_SIZE)(
+            lambda t: self.trie_.has_keys_with_prefix(self.key_(t)))
+        self.has_rprefix_ = lru_cache(maxsize=self.CACHE_SIZE)(
+            lambda t: self.trie_.has_keys_with_prefix(self.rkey_(t)))
+        self.lookup_ = lru_cache(maxsize=self.CACHE_SIZE)(self.lookupTrie_)
+
+    def lookupTrie_(self, t):
+        k = self.key_(t)
+        return self.trie_[k] if k in self.trie_ else None
 
     def __init__(self, debug=False):
         self.DEBUG = debug
+        self.user_dict_ = False
         self.DENOMINATOR = 1000000
-        self.trie_ = datrie.Trie(string.printable)
+        self._trie = None
+        self._trie_lock = threading.Lock()
         self.DIR_ = os.path.join(get_project_base_directory(), "rag/res", "huqie")
 
         self.stemmer = PorterStemmer()
         self.lemmatizer = WordNetLemmatizer()
+        self.normalize_word_ = lru_cache(maxsize=self.CACHE_SIZE)(
+            lambda t: self.stemmer.stem(self.lemmatizer.lemmatize(t)))
+        self.clear_cache_()
 
         self.SPLIT_CHAR = r"([ ,\.<>/?;'\[\]\\`!@#$%^&*\(\)\{\}\|_+=《》，。？、；‘’：“”【】~！￥%……（）——-]+|[a-z\.-]+|[0-9,\.-]+)"
-        try:
-            self.trie_ = datrie.Trie.load(self.DIR_ + ".txt.trie")
-            return
-        except Exception as e:
-            print("[HUQIE]:Build default trie", file=sys.stderr)
-            self.trie_ = datrie.Trie(string.printable)
-
-        self.loadDict_(self.DIR_ + ".txt")
 
     def loadUserDict(self, fnm):
-        try:
-            self.trie_ = datrie.Trie.load(fnm + ".trie")
-            return
-        except Exception as e:
-            self.trie_ = datrie.Trie(string.printable)
-        self.loadDict_(fnm)
+        self.user_dict_ = True
+        self.trie_ = self.loadTrie_(os.path.abspath(fnm) + ".compiled", fnm)
+        self.clear_cache_()
 
     def addUserDict(self, fnm):
+        self.user_dict_ = True
         self.loadDict_(fnm)
 
     def _strQ2B(self, ustring):
         """把字符串全角转半角"""
-        rstring = ""
-        for uchar in ustring:
-            inside_code = ord(uchar)
-            if inside_code == 0x3000:
-                inside_code = 0x0020
-            else:
-                inside_code -= 0xfee0
-            if inside_code < 0x0020 or inside_code > 0x7e:  # 转完之后不是半角字符返回原来的字符
-                rstring += uchar
-            else:
-                rstring += chr(inside_code)
-        return rstring
+        return ustring.translate(self.Q2B_TABLE)
 
     def _tradi2simp(self, line):
         return HanziConv.toSimplified(line)
@@ -152,17 +223,84 @@ class RagTokenizer:
 
         return self.dfs_(chars, s + 1, preTks, tkslist)
 
+    def nextTks_(self, chars, s, after_singles):
+        # the tokens dfs_ tries at s as (end, weight), after_singles when the
+        # three tokens before s are single chars
+        S = s + 1
+        if s + 2 <= len(chars):
+            t1, t2 = chars[s:s + 1], chars[s:s + 2]
+            if self.has_prefix_(t1) and not self.has_prefix_(t2):
+                S = s + 2
+        if after_singles and self.has_prefix_(chars[s - 1:s + 1]):
+            S = s + 2
+
+        res = []
+        for e in range(S, len(chars) + 1):
+            t = chars[s:e]
+            if e > s + 1 and not self.has_prefix_(t):
+                break
+            v = self.lookup_(t)
+            if v is not None:
+                res.append((e, v[0] + (0 if e - s < 2 else 1)))
+        if res:
+            return res
+        v = self.lookup_(chars[s:s + 1])
+        return [(s + 1, v[0] if v is not None else -12)]
+
+    def segment_(self, chars, topk=1):
+        """
+        The `topk` best segmentations of `chars` among the ones `dfs_` would
+        enumerate, ranked as `sortTks_` ranks them, without enumerating them.
+
+        `score_` is (30 + sum of token weights) / token count, so for every
+        token count only the heaviest paths can win. The search keeps the
+        `topk` heaviest paths per (position, trailing single chars, token
+        count), ties broken by token end positions as dfs_ orders its paths.
+        """
+        if len(chars) > self.MAX_SEGMENT_LEN:
+            # cap the search effort on pathological runs, pieces are segmented independently
+            tks = []
+            for i in range(0, len(chars), self.MAX_SEGMENT_LEN):
+                tks.extend(self.segment_(chars[i:i + self.MAX_SEGMENT_LEN])[0])
+            return [tks]
+
+        if not chars:
+            return [[]]
+
+        # paths[s][singles][n] are the best (weight, token ends) of n tokens reaching s
+        paths = [[{} for _ in range(4)] for _ in range(len(chars) + 1)]
+        paths[0][0][0] = [(0, ())]
+        nexts = {}
+        for s in range(len(chars)):
+            for singles in range(4):
+                if not paths[s][singles]:
+                    continue
+                if (s, singles == 3) not in nexts:
+                    nexts[(s, singles == 3)] = self.nextTks_(chars, s, singles == 3)
+                for e, w in nexts[(s, singles == 3)]:
+                    nxt = paths[e][min(singles + 1, 3) if e - s == 1 else 0]
+                    for n, pths in paths[s][singles].items():
+                        best = nxt.setdefault(n + 1, [])
+                        for W, ends in pths:
+                            best.append((W + w, ends + (e,)))
+                        best.sort(key=lambda p: (-p[0], p[1]))
+                        del best[topk:]
+
+        res = [(W, ends, n) for pths in paths[-1] for n, best in pths.items() for W, ends in best]
+        res = sorted(res, key=lambda p: (-Fraction(30 + p[0], p[2]), p[1]))[:topk]
+        return [[chars[s:e] for s, e in zip((0,) + ends, ends)] for _, ends, _ in res]
+
     def freq(self, tk):
-        k = self.key_(tk)
-        if k not in self.trie_:
+        v = self.lookup_(tk)
+        if v is None:
             return 0
-        return int(math.exp(self.trie_[k][0]) * self.DENOMINATOR + 0.5)
+        return int(math.exp(v[0]) * self.DENOMINATOR + 0.5)
 
     def tag(self, tk):
-        k = self.key_(tk)
-        if k not in self.trie_:
+        v = self.lookup_(tk)
+        if v is None:
             return ""
-        return self.trie_[k][1]
+        return v[1]
 
     def score_(self, tfts):
         B = 30
@@ -214,19 +352,16 @@ class RagTokenizer:
         while s < len(line):
             e = s + 1
             t = line[s:e]
-            while e < len(line) and self.trie_.has_keys_with_prefix(
-                    self.key_(t)):
+            while e < len(line) and self.has_prefix_(t):
                 e += 1
                 t = line[s:e]
 
-            while e - 1 > s and self.key_(t) not in self.trie_:
+            while e - 1 > s and self.lookup_(t) is None:
                 e -= 1
                 t = line[s:e]
 
-            if self.key_(t) in self.trie_:
-                res.append((t, self.trie_[self.key_(t)]))
-            else:
-                res.append((t, (0, '')))
+            v = self.lookup_(t)
+            res.append((t, v if v is not None else (0, '')))
 
             s = e
 
@@ -238,32 +373,36 @@ class RagTokenizer:
         while s >= 0:
             e = s + 1
             t = line[s:e]
-            while s > 0 and self.trie_.has_keys_with_prefix(self.rkey_(t)):
+            while s > 0 and self.has_rprefix_(t):
                 s -= 1
                 t = line[s:e]
 
-            while s + 1 < e and self.key_(t) not in self.trie_:
+            while s + 1 < e and self.lookup_(t) is None:
                 s += 1
                 t = line[s:e]
 
-            if self.key_(t) in self.trie_:
-                res.append((t, self.trie_[self.key_(t)]))
-            else:
-                res.append((t, (0, '')))
+            v = self.lookup_(t)
+            res.append((t, v if v is not None else (0, '')))
 
             s -= 1
 
         return self.score_(res[::-1])
 
     def english_normalize_(self, tks):
-        return [self.stemmer.stem(self.lemmatizer.lemmatize(t)) if re.match(r"[a-zA-Z_-]+$", t) else t for t in tks]
+        return [self.normalize_word_(t) if re.match(r"[a-zA-Z_-]+$", t) else t for t in tks]
 
-    def tokenize(self, line):
+    def normalize_(self, line):
         line = self._strQ2B(line).lower()
-        line = self._tradi2simp(line)
+        return self._tradi2simp(line)
+
+    def tokenize(self, line):
+        return self.tokenize_(self.normalize_(line))
+
+    def tokenize_(self, line):
+        # tokenize a line that went through normalize_ already
         zh_num = len([1 for c in line if is_chinese(c)])
         if zh_num == 0:
-            return " ".join([self.stemmer.stem(self.lemmatizer.lemmatize(t)) for t in word_tokenize(line)])
+            return " ".join([self.normalize_word_(t) for t in word_tokenize(line)])
 
         arr = re.split(self.SPLIT_CHAR, line)
         res = []
@@ -304,9 +443,7 @@ class RagTokenizer:
                 while e < len(tks) and e - s < 5 and diff[e] == 1:
                     e += 1
 
-                tkslist = []
-                self.dfs_("".join(tks[s:e + 1]), 0, [], tkslist)
-                res.append(" ".join(self.sortTks_(tkslist)[0][0]))
+                res.append(" ".join(self.segment_("".join(tks[s:e + 1]))[0]))
 
                 i = e + 1
 
@@ -329,15 +466,11 @@ class RagTokenizer:
             if len(tk) < 3 or re.match(r"[0-9,\.-]+$", tk):
                 res.append(tk)
                 continue
-            tkslist = []
-            if len(tk) > 10:
-                tkslist.append(tk)
-            else:
-                self.dfs_(tk, 0, [], tkslist)
+            tkslist = [tk] if len(tk) > 10 else self.segment_(tk, topk=2)
             if len(tkslist) < 2:
                 res.append(tk)
                 continue
-            stk = self.sortTks_(tkslist)[1][0]
+            stk = tkslist[1]
             if len(stk) == len(tk):
                 stk = tk
             else:
@@ -355,6 +488,52 @@ class RagTokenizer:
 
         return " ".join(self.english_normalize_(res))
 
+    def tokenize_batch(self, lines, fine_grained=False, workers=None):
+        """
+        `tokenize` of every line, as (tokens, fine grained tokens) pairs when
+        `fine_grained`. Lines are normalized in bulk, and batches of at least
+        INDEXING_TOKENIZE_LINES_PER_WORKER lines per worker are split across
+        `workers` processes, INDEXING_TOKENIZE_WORKERS by default.
+        """
+        if workers is None:
+            workers = syntellix_config.INDEXING_TOKENIZE_WORKERS
+        lines = list(lines)
+        per_worker = syntellix_config.INDEXING_TOKENIZE_LINES_PER_WORKER
+        workers = min(workers, len(lines) // per_worker)
+        # workers load the default dictionary only
+        if workers > 1 and self is tokenizer and not self.user_dict_:
+            try:
+                return self.tokenize_batch_parallel_(lines, fine_grained, workers)
+            except Exception as e:
+                logging.warning(f"Tokenize workers failed, tokenize in process: {e}")
+
+        res = []
+        for line in self.normalize_batch_(lines):
+            tks = self.tokenize_(line)
+            res.append((tks, self.fine_grained_tokenize(tks)) if fine_grained else tks)
+        return res
+
+    def tokenize_batch_parallel_(self, lines, fine_grained, workers):
+        size = (len(lines) + workers - 1) // workers
+        pool = get_tokenize_pool(workers)
+        futures = [pool.submit(_tokenize_batch_worker, lines[i:i + size], fine_grained)
+                   for i in range(0, len(lines), size)]
+        res = []
+        for f in futures:
+            res.extend(f.result())
+        return res
+
+    def normalize_batch_(self, lines):
+        # full width and traditional chinese conversions work char by char,
+        # so convert all lines at once when a separator is free to split them back
+        sep = "\x00"
+        if len(lines) < 2 or any(sep in line for line in lines):
+            return [self.normalize_(line) for line in lines]
+        res = self.normalize_(sep.join(lines)).split(sep)
+        if len(res) != len(lines):
+            return [self.normalize_(line) for line in lines]
+        return res
+
 
 def is_chinese(s):
     if s >= u'\u4e00' and s <= u'\u9fa5':
@@ -390,6 +569,7 @@ def naiveQie(txt):
 
 tokenizer = RagTokenizer()
 tokenize = tokenizer.tokenize
+tokenize_batch = tokenizer.tokenize_batch
 fine_grained_tokenize = tokenizer.fine_grained_tokenize
 tag = tokenizer.tag
 freq = tokenizer.freq
@@ -0,0 +1,137 @@
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import os
+import sys
+sys.path.insert(
+    0,
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(
+                os.path.abspath(__file__)),
+            '../../../')))
+
+import argparse
+import random
+from timeit import default_timer as timer
+
+from syntellix_api.rag.deepdoc.parser import TxtParser
+from syntellix_api.rag.nlp import naive_merge
+from syntellix_api.rag.utils.memory_utils import peak_rss, reset_peak_rss
+from syntellix_api.rag.utils.parser_utils import num_tokens_from_string
+
+
+def legacy_parser_txt(txt, chunk_token_num=128, delimiter="\n!?;。；！？"):
+    # TxtParser.parser_txt before the chunk builder
+    cks = [""]
+    tk_nums = [0]
+
+    def add_chunk(t):
+        tnum = num_tokens_from_string(t)
+        if tk_nums[-1] > chunk_token_num:
+            cks.append(t)
+            tk_nums.append(tnum)
+        else:
+            cks[-1] += t
+            tk_nums[-1] += tnum
+
+    s, e = 0, 1
+    while e < len(txt):
+        if txt[e] in delimiter:
+            add_chunk(txt[s: e + 1])
+            s = e + 1
+            e = s + 1
+        else:
+            e += 1
+    if s < e:
+        add_chunk(txt[s: e + 1])
+    return [[c, ""] for c in cks]
+
+
+def legacy_naive_merge(sections, chunk_token_num=128):
+    # naive_merge before the chunk builder
+    cks = [""]
+    tk_nums = [0]
+
+    def add_chunk(t, pos):
+        tnum = num_tokens_from_string(t)
+        if not pos: pos = ""
+        if tnum < 8:
+            pos = ""
+        if tk_nums[-1] > chunk_token_num:
+            if t.find(pos) < 0:
+                t += pos
+            cks.append(t)
+            tk_nums.append(tnum)
+        else:
+            if cks[-1].find(pos) < 0:
+                t += pos
+            cks[-1] += t
+            tk_nums[-1] += tnum
+
+    for sec, pos in sections:
+        add_chunk(sec, pos)
+    return cks
+
+
+def synthetic_text(size):
+    """
+    About `size` chars of mixed chinese and english sentences and lines.
+    """
+    words = ["数据", "分析", "模型", "检索", "增强", "生成", "文档", "解析",
+             "data", "model", "retrieval", "chunk", "token", "index"]
+    parts, n = [], 0
+    while n < size:
+        sentence = " ".join(random.choices(words, k=random.randint(3, 30)))
+        sentence += random.choice(["。", "！", "？", "；", ".", "\n", "\n\n"])
+        parts.append(sentence)
+        n += len(sentence)
+    return "".join(parts)
+
+
+def run(name, fn):
+    reset_peak_rss()
+    st = timer()
+    res = fn()
+    elapsed = timer() - st
+    print(f"{name}\t{elapsed:.2f}s\tpeak RSS: {peak_rss() / 1024 / 1024:.0f} MB")
+    return res, elapsed
+
+
+def main(args):
+    random.seed(args.seed)
+    txt = synthetic_text(int(args.legacy_mb * 1024 * 1024))
+    print(f"{len(txt)} chars")
+    legacy, legacy_elapsed = run("legacy", lambda: legacy_naive_merge(legacy_parser_txt(txt, args.chunk_token_num),
+                                                                       args.chunk_token_num))
+    res, elapsed = run("builder", lambda: naive_merge(TxtParser.parser_txt(txt, args.chunk_token_num),
+                                                      args.chunk_token_num))
+    print(f"same chunks: {legacy == res}\tspeedup: {legacy_elapsed / elapsed:.1f}x")
+
+    # the legacy merge is far too slow at this size, run the builder alone
+    txt = synthetic_text(int(args.mb * 1024 * 1024))
+    print(f"{len(txt)} chars")
+    chunks, elapsed = run("builder", lambda: naive_merge(TxtParser.parser_txt(txt, args.chunk_token_num),
+                                                         args.chunk_token_num))
+    print(f"{len(chunks)} chunks, {len(txt) / elapsed / 1024 / 1024:.1f} MB chars/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mb', help="Size of the large synthetic text in M chars. Default: 100", type=float, default=100)
+    parser.add_argument('--legacy_mb', help="Size of the text compared with the legacy merge. Default: 2",
+                        type=float, default=2)
+    parser.add_argument('--chunk_token_num', help="Default: 128", type=int, default=128)
+    parser.add_argument('--seed', help="Random seed. Default: 0", type=int, default=0)
+    args = parser.parse_args()
+    main(args)
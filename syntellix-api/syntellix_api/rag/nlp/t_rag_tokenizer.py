@@ -0,0 +1,115 @@
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import os
+import sys
+sys.path.insert(
+    0,
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(
+                os.path.abspath(__file__)),
+            '../../../')))
+
+import argparse
+import string
+from timeit import default_timer as timer
+
+import datrie
+
+from syntellix_api.rag.nlp.rag_tokenizer import RagTokenizer, tokenize_batch
+
+
+class LegacyTokenizer(RagTokenizer):
+    # segments by enumerating every dfs_ path, as the tokenizer did before segment_
+    def segment_(self, chars, topk=1):
+        tkslist = []
+        self.dfs_(chars, 0, [], tkslist)
+        return [tks for tks, _ in self.sortTks_(tkslist)[:topk]]
+
+
+def datrie_tokenizer(tknzr):
+    # the tokenizer on an in-memory datrie of the same entries, as before the compiled dictionaries
+    trie = datrie.Trie(string.printable)
+    for k, v in tknzr.trie_.items():
+        trie[k] = v
+    res = RagTokenizer()
+    res.trie_ = trie
+    return res
+
+
+def cold_run(tknzr, lines):
+    # every trie probe misses the memos, as on the first chunks a worker tokenizes
+    tknzr.clear_cache_()
+    tknzr.normalize_word_.cache_clear()
+    return run(tknzr, lines)
+
+
+def run(tknzr, lines):
+    st = timer()
+    res = [(tks, tknzr.fine_grained_tokenize(tks)) for tks in map(tknzr.tokenize, lines)]
+    return res, timer() - st
+
+
+def main(args):
+    with open(args.corpus, encoding="utf-8") as f:
+        lines = [line.strip() for line in f if line.strip()]
+    # the legacy search is exponential, keep it to lines it finishes in reasonable time
+    legacy_lines = [line for line in lines if len(line) <= args.legacy_max_len]
+    chars = sum(len(line) for line in legacy_lines)
+
+    legacy, legacy_elapsed = run(LegacyTokenizer(), legacy_lines)
+    tknzr = RagTokenizer()
+    res, elapsed = run(tknzr, legacy_lines)
+    diffs = [(line, a, b) for line, a, b in zip(legacy_lines, legacy, res) if a != b]
+    for line, a, b in diffs:
+        print(f"DIFF {line}\n  legacy: {a}\n  new:    {b}")
+    print(f"{len(legacy_lines)} lines, identical tokens: {len(legacy_lines) - len(diffs)}/{len(legacy_lines)}")
+    print(f"legacy: {chars / legacy_elapsed:.0f} chars/s\tnew: {chars / elapsed:.0f} chars/s")
+
+    # dictionary lookups without the memos, compiled dictionary against datrie
+    compiled, compiled_elapsed = cold_run(tknzr, legacy_lines)
+    reference, datrie_elapsed = cold_run(datrie_tokenizer(tknzr), legacy_lines)
+    print(f"cold caches, compiled dictionary: {chars / compiled_elapsed:.0f} chars/s"
+          f"\tdatrie: {chars / datrie_elapsed:.0f} chars/s\tidentical tokens: {compiled == reference}")
+
+    # a long ambiguous run the legacy search never finishes
+    run_ = "哈" * args.ambiguous_len
+    st = timer()
+    tknzr.tokenize(run_)
+    print(f"ambiguous run of {len(run_)} chars: {len(run_) / (timer() - st):.0f} chars/s")
+
+    # chunks of a large document, tokenized one by one and as a batch
+    lines = lines * args.batch_repeat
+    chars = sum(len(line) for line in lines)
+    res, elapsed = run(RagTokenizer(), lines)
+    st = timer()
+    batch = tokenize_batch(lines, fine_grained=True, workers=args.workers)
+    batch_elapsed = timer() - st
+    print(f"{len(lines)} chunks, batch identical: {batch == res}")
+    print(f"one by one: {chars / elapsed:.0f} chars/s\tbatch: {chars / batch_elapsed:.0f} chars/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--corpus', help="Text file with one line per regression sample",
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "tokenizer_regression.txt"))
+    parser.add_argument('--legacy_max_len', help="Skip lines longer than this. Default: 300", type=int, default=300)
+    parser.add_argument('--ambiguous_len', help="Length of the synthetic ambiguous run. Default: 2000",
+                        type=int, default=2000)
+    parser.add_argument('--batch_repeat', help="Times the corpus is repeated for the batch run. Default: 20",
+                        type=int, default=20)
+    parser.add_argument('--workers', help="Tokenize worker processes of the batch run. Default: 0", type=int, default=0)
+    args = parser.parse_args()
+    main(args)
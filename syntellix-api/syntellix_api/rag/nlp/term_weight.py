@@ -15,15 +15,50 @@
 #
 
 import json
+import logging
 import math
 import os
 import re
 
 import numpy as np
-from syntellix_api.rag.nlp import rag_tokenizer
+from syntellix_api.rag.nlp import compiled_dict, rag_tokenizer
 from syntellix_api.rag.utils.file_utils import get_project_base_directory
 
 
+def ner_entries(fnm):
+    with open(fnm, "r") as f:
+        return json.load(f)
+
+
+def freq_entries(fnm):
+    res = {}
+    f = open(fnm, "r")
+    while True:
+        l = f.readline()
+        if not l:
+            break
+        arr = l.replace("\n", "").split("\t")
+        if len(arr) < 2:
+            res[arr[0]] = 0
+        else:
+            res[arr[0]] = int(arr[1])
+    f.close()
+    return res
+
+
+def load_compiled(name, fnm, entries):
+    fnm = os.path.join(get_project_base_directory(), "rag/res", fnm)
+    try:
+        res = compiled_dict.load_dict(name, fnm, entries)
+    except Exception as e:
+        logging.exception(f"Failed to load dictionary {fnm}: {e}")
+        return {}
+    if res is None:
+        logging.warning(f"Missing dictionary {fnm}")
+        return {}
+    return res
+
+
 class Dealer:
     def __init__(self):
         self.stop_words = set(
@@ -62,36 +97,20 @@ class Dealer:
             ]
         )
 
-        def load_dict(fnm):
-            res = {}
-            f = open(fnm, "r")
-            while True:
-                l = f.readline()
-                if not l:
-                    break
-                arr = l.replace("\n", "").split("\t")
-                if len(arr) < 2:
-                    res[arr[0]] = 0
-                else:
-                    res[arr[0]] = int(arr[1])
+        self._ne, self._df = None, None
 
-            c = 0
-            for _, v in res.items():
-                c += v
-            if c == 0:
-                return set(res.keys())
-            return res
+    # the dictionaries are mapped at first use, not when the dealer is created
+    @property
+    def ne(self):
+        if self._ne is None:
+            self._ne = load_compiled("ner", "ner.json", ner_entries)
+        return self._ne
 
-        fnm = os.path.join(get_project_base_directory(), "rag/res")
-        self.ne, self.df = {}, {}
-        try:
-            self.ne = json.load(open(os.path.join(fnm, "ner.json"), "r"))
-        except Exception as e:
-            print("[WARNING] Load ner.json FAIL!")
-        try:
-            self.df = load_dict(os.path.join(fnm, "term.freq"))
-        except Exception as e:
-            print("[WARNING] Load term.freq FAIL!")
+    @property
+    def df(self):
+        if self._df is None:
+            self._df = load_compiled("term_freq", "term.freq", freq_entries)
+        return self._df
 
     def pretoken(self, txt, num=False, stpwd=True):
         patt = [
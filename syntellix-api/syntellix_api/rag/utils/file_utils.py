@@ -14,9 +14,11 @@
 #  limitations under the License.
 #
 import base64
+import hashlib
 import json
 import os
 import re
+from functools import lru_cache
 from io import BytesIO
 
 import pdfplumber
@@ -44,6 +46,34 @@ def get_project_base_directory(*args):
     return PROJECT_BASE
 
 
+@lru_cache(maxsize=None)
+def resource_stamps(resources: tuple) -> dict:
+    """
+    SHA-256 of the files of `resources`, files or directories relative to the
+    project base directory, by relative path, the same on every node shipping
+    the same files. Hidden files, like the download metadata of the models,
+    are left out. Hashed once per process: resources change with a deploy.
+    """
+    base = get_project_base_directory()
+    files = []
+    for resource in resources:
+        path = os.path.join(base, resource)
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs[:] = [d for d in dirs if not d.startswith(".")]
+                files.extend(os.path.join(root, name) for name in names if not name.startswith("."))
+        elif os.path.exists(path):
+            files.append(path)
+    stamps = {}
+    for fnm in sorted(files):
+        digest = hashlib.sha256()
+        with open(fnm, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        stamps[os.path.relpath(fnm, base)] = digest.hexdigest()
+    return stamps
+
+
 def get_rag_directory(*args):
     global RAG_BASE
     if RAG_BASE is None:
@@ -0,0 +1,46 @@
+import resource
+import sys
+
+
+def _proc_status(field):
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def current_rss():
+    """
+    Resident set size of this process in bytes, None if it can't be read.
+    """
+    return _proc_status("VmRSS")
+
+
+def peak_rss():
+    """
+    Peak resident set size of this process in bytes since it started or
+    since the last `reset_peak_rss()`.
+    """
+    peak = _proc_status("VmHWM")
+    if peak is not None:
+        return peak
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def reset_peak_rss():
+    """
+    Reset the peak RSS watermark so that `peak_rss()` covers a single
+    document. Only supported on Linux, returns whether it succeeded.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
@@ -16,6 +16,8 @@
 
 import os
 import re
+from functools import lru_cache
+
 import tiktoken
 
 
@@ -72,19 +74,37 @@ def findMaxTm(fnm):
     return m
 
 
-encoder = tiktoken.encoding_for_model("gpt-3.5-turbo")
+@lru_cache(maxsize=None)
+def get_encoder():
+    # resolved at first use so that importing parsers doesn't load the BPE ranks
+    return tiktoken.encoding_for_model("gpt-3.5-turbo")
 
 
 def num_tokens_from_string(string: str) -> int:
     """Returns the number of tokens in a text string."""
     try:
-        num_tokens = len(encoder.encode(string))
+        num_tokens = len(get_encoder().encode(string))
         return num_tokens
     except Exception as e:
         pass
     return 0
 
 
+def num_tokens_from_strings(strings, batch_size=1024):
+    """Returns the number of tokens of every string, encoded in batches."""
+    encoder = get_encoder()
+    res = []
+    for i in range(0, len(strings), batch_size):
+        batch = strings[i:i + batch_size]
+        try:
+            res.extend(len(tks) for tks in encoder.encode_batch(batch))
+        except Exception as e:
+            # e.g. a special token in one of them, count them one by one like num_tokens_from_string
+            res.extend(num_tokens_from_string(s) for s in batch)
+    return res
+
+
 def truncate(string: str, max_len: int) -> str:
     """Returns truncated text if the length of text exceed max_len."""
+    encoder = get_encoder()
     return encoder.decode(encoder.encode(string)[:max_len])
@@ -7,7 +7,7 @@ from typing import Any, Callable, Dict, List, Literal, Optional, Tuple, Union, c
 import numpy as np
 import requests
 from elasticsearch import Elasticsearch
-from elasticsearch.helpers import bulk
+from elasticsearch.helpers import bulk, scan
 from flask import current_app
 from pydantic import BaseModel, model_validator
 from syntellix_api.rag.vector_database.vector_model import BaseNode
@@ -20,6 +20,37 @@ DISTANCE_STRATEGIES = Literal[
     "EUCLIDEAN_DISTANCE",
 ]
 
+TEXT_ANALYSIS = Literal["ik", "pretokenized"]
+
+INDEX_LAYOUTS = Literal["shared", "routed", "per_knowledge_base"]
+
+VECTOR_INDEX_TYPES = Literal[
+    "hnsw", "int8_hnsw", "int4_hnsw", "bbq_hnsw", "flat", "int8_flat", "int4_flat", "bbq_flat"
+]
+
+# max kNN num_candidates accepted by Elasticsearch
+MAX_NUM_CANDIDATES = 10000
+# searches of a multi search run at once, bounds the load a batch puts on the cluster
+MSEARCH_MAX_CONCURRENT_SEARCHES = 8
+
+# whitespace analyzed fields holding the tokens of the RAG tokenizer
+CONTENT_TOKENS_FIELD = "content_ltks"
+CONTENT_SM_TOKENS_FIELD = "content_sm_ltks"
+CONTEXTUALIZED_TOKENS_FIELD = "contextualized_ltks"
+TOKEN_FIELDS = (CONTENT_TOKENS_FIELD, CONTENT_SM_TOKENS_FIELD, CONTEXTUALIZED_TOKENS_FIELD)
+
+_fulltext_queryer = None
+
+
+def get_fulltext_queryer():
+    global _fulltext_queryer
+    if _fulltext_queryer is None:
+        # the tokenizer is only needed, and imported, for pre-tokenized indices
+        from syntellix_api.rag.nlp.query import FulltextQueryer
+
+        _fulltext_queryer = FulltextQueryer()
+    return _fulltext_queryer
+
 # Ensure that the 'fork' start method is not used in macOS
 if os.name == "posix" and os.uname().sysname == "Darwin":
     import multiprocessing
@@ -47,7 +78,36 @@ class ElasticSearchConfig(BaseModel):
         return values
 
 
+class ElasticSearchIndexConfig(BaseModel):
+    """
+    Layout and settings of the indices created for a tenant. `layout` only
+    applies to tenants without an index yet, others keep the layout saved in
+    their index until `migrate_layout`.
+    """
+
+    layout: INDEX_LAYOUTS = "routed"
+    per_knowledge_base_min_docs: int = 500000
+    number_of_shards: int = 1
+    routed_number_of_shards: int = 4
+    number_of_replicas: int = 1
+    vector_index_type: VECTOR_INDEX_TYPES = "int8_hnsw"
+    vector_in_source: bool = True
+    hnsw_m: int = 16
+    hnsw_ef_construction: int = 100
+
+
 class ElasticSearchVector:
+    """
+    The chunks of a tenant. `index_name` is the index of the `shared` layout,
+    or the alias over the indices of the `routed` and `per_knowledge_base`
+    layouts:
+
+    - shared: one index, queries go through the chunks of every knowledge base.
+    - routed: one index routed by knowledge base id, queries only search the
+      shards of their knowledge bases.
+    - per_knowledge_base: an index per knowledge base, queries only search the
+      indices of their knowledge bases.
+    """
 
     def __init__(
         self,
@@ -58,15 +118,22 @@ class ElasticSearchVector:
         contextualized_text_field: str = "contextualized_content",
         batch_size: int = 200,
         distance_strategy: Optional[DISTANCE_STRATEGIES] = "COSINE",
+        text_analysis: TEXT_ANALYSIS = "ik",
+        index_config: Optional[ElasticSearchIndexConfig] = None,
         client: Optional[Elasticsearch] = None,
     ) -> None:
         self._index_name = index_name
+        self._index_config = index_config or ElasticSearchIndexConfig()
+        # resolved from the existing indices at first use
+        self._layout: Optional[str] = None
+        self._ensured_indices: set[str] = set()
         self._client = client or self._init_client(client_config)
         self._text_field = text_field
         self._contextualized_text_field = contextualized_text_field
         self._vector_field = vector_field
         self._batch_size = batch_size
         self._distance_strategy = distance_strategy
+        self._text_analysis = text_analysis
 
     def _init_client(self, config: ElasticSearchConfig) -> Elasticsearch:
         try:
@@ -87,12 +154,151 @@ class ElasticSearchVector:
 
         return client
 
+    def layout(self) -> str:
+        """
+        The layout saved in the tenant's indices, the configured one when the
+        tenant has none yet. Indices created before layouts are `shared`.
+        """
+        if self._layout is None:
+            mappings = self._get_mappings()
+            if not mappings:
+                self._layout = self._index_config.layout
+            else:
+                layouts = {
+                    m["mappings"].get("_meta", {}).get("layout", "shared")
+                    for m in mappings.values()
+                }
+                if len(layouts) > 1:
+                    raise ValueError(
+                        f"Indices of {self._index_name} have different layouts: {layouts}"
+                    )
+                self._layout = layouts.pop()
+        return self._layout
+
+    def _get_mappings(self) -> dict:
+        # mappings of the concrete indices behind the tenant index or alias
+        if not self._client.indices.exists(index=self._index_name):
+            return {}
+        return dict(self._client.indices.get_mapping(index=self._index_name))
+
+    def _knowledge_base_index(self, knowledge_base_id) -> str:
+        return f"{self._index_name}_kb_{knowledge_base_id}"
+
+    def _routed_index(self) -> str:
+        return f"{self._index_name}_routed"
+
+    def _write_index(self, knowledge_base_id) -> str:
+        if self.layout() == "per_knowledge_base":
+            return self._knowledge_base_index(knowledge_base_id)
+        return self._index_name
+
+    def _routing(self, knowledge_base_ids: Optional[List]) -> Optional[str]:
+        if self.layout() != "routed" or not knowledge_base_ids:
+            return None
+        return ",".join(sorted({str(kb_id) for kb_id in knowledge_base_ids}))
+
+    def _search_target(self, knowledge_base_ids: Optional[List]) -> dict:
+        """
+        The index and routing arguments of a search over `knowledge_base_ids`,
+        every knowledge base when None.
+        """
+        if self.layout() == "per_knowledge_base" and knowledge_base_ids:
+            return {
+                "index": ",".join(
+                    self._knowledge_base_index(kb_id)
+                    for kb_id in sorted({str(kb_id) for kb_id in knowledge_base_ids})
+                ),
+                # knowledge bases without chunks have no index yet
+                "ignore_unavailable": True,
+            }
+        target = {"index": self._index_name}
+        routing = self._routing(knowledge_base_ids)
+        if routing:
+            target["routing"] = routing
+        return target
+
+    @staticmethod
+    def _filter_knowledge_base_ids(es_filter: List[Dict]) -> Optional[List]:
+        # the knowledge bases a query filter restricts the search to, if any
+        for clause in es_filter:
+            if "terms" in clause and "metadata.knowledge_base_id" in clause["terms"]:
+                return list(clause["terms"]["metadata.knowledge_base_id"])
+            if "term" in clause and "metadata.knowledge_base_id" in clause["term"]:
+                value = clause["term"]["metadata.knowledge_base_id"]
+                return [value["value"] if isinstance(value, dict) else value]
+        return None
+
+    def _similarity(self) -> str:
+        if self._distance_strategy == "COSINE":
+            return "cosine"
+        elif self._distance_strategy == "EUCLIDEAN_DISTANCE":
+            return "l2_norm"
+        elif self._distance_strategy == "DOT_PRODUCT":
+            return "dot_product"
+        raise ValueError(f"Similarity {self._distance_strategy} not supported.")
+
+    def _vector_index_options(self) -> dict:
+        config = self._index_config
+        index_options = {"type": config.vector_index_type}
+        if config.vector_index_type.endswith("hnsw"):
+            index_options.update(
+                {"m": config.hnsw_m, "ef_construction": config.hnsw_ef_construction}
+            )
+        return index_options
+
+    def _index_body(self, layout: str, dims_length: int) -> dict:
+        config = self._index_config
+        mappings = {
+            "_meta": {"layout": layout},
+            "properties": {
+                self._vector_field: {
+                    "type": "dense_vector",
+                    "dims": dims_length,
+                    "index": True,
+                    "similarity": self._similarity(),
+                    "index_options": self._vector_index_options(),
+                },
+                **self._text_mappings(),
+                "metadata": {
+                    "properties": {
+                        "file_name": {"type": "text"},
+                        "document_id": {"type": "keyword"},
+                        "image_id": {"type": "text"},
+                        "knowledge_base_id": {"type": "keyword"},
+                        "created_at": {"type": "date"},
+                    }
+                },
+            },
+        }
+        if layout == "routed":
+            # a chunk written without routing would be missed by routed queries
+            mappings["_routing"] = {"required": True}
+        if not config.vector_in_source:
+            # the vectors are still indexed, only the copy in _source is dropped
+            mappings["_source"] = {"excludes": [self._vector_field]}
+        settings = {
+            "number_of_shards": (
+                config.routed_number_of_shards
+                if layout == "routed"
+                else config.number_of_shards
+            ),
+            "number_of_replicas": config.number_of_replicas,
+        }
+        body = {"settings": settings, "mappings": mappings}
+        if layout != "shared":
+            body["aliases"] = {self._index_name: {}}
+        return body
+
     def _create_index_if_not_exists(
         self, index_name: str, dims_length: Optional[int] = None
     ) -> None:
+        if index_name in self._ensured_indices:
+            return
         exists = self._client.indices.exists(index=index_name)
         if exists:
             logger.debug(f"Index {index_name} already exists. Skipping creation.")
+            if self._text_analysis == "pretokenized":
+                self._add_token_fields_if_not_exists(index_name)
         else:
             if dims_length is None:
                 raise ValueError(
@@ -102,51 +308,66 @@ class ElasticSearchVector:
                     "you have provided an embedding function."
                 )
 
-            if self._distance_strategy == "COSINE":
-                similarityAlgo = "cosine"
-            elif self._distance_strategy == "EUCLIDEAN_DISTANCE":
-                similarityAlgo = "l2_norm"
-            elif self._distance_strategy == "DOT_PRODUCT":
-                similarityAlgo = "dot_product"
-            else:
-                raise ValueError(f"Similarity {self._distance_strategy} not supported.")
-
-            index_settings = {
-                "mappings": {
-                    "properties": {
-                        self._vector_field: {
-                            "type": "dense_vector",
-                            "dims": dims_length,
-                            "index": True,
-                            "similarity": similarityAlgo,
-                        },
-                        self._text_field: {
-                            "type": "text",
-                            "analyzer": "ik_smart",
-                            "search_analyzer": "ik_smart",
-                        },
-                        self._contextualized_text_field: {
-                            "type": "text",
-                            "analyzer": "ik_smart",
-                            "search_analyzer": "ik_smart",
-                        },
-                        "metadata": {
-                            "properties": {
-                                "file_name": {"type": "text"},
-                                "document_id": {"type": "keyword"},
-                                "image_id": {"type": "text"},
-                                "knowledge_base_id": {"type": "keyword"},
-                                "created_at": {"type": "date"},
-                            }
-                        },
-                    }
-                },
-            }
+            layout = self.layout()
+            concrete_name = (
+                self._routed_index()
+                if layout == "routed" and index_name == self._index_name
+                else index_name
+            )
+            index_settings = self._index_body(layout, dims_length)
 
             logger.debug(
-                f"Creating index {index_name} with mappings {index_settings['mappings']}"
+                f"Creating index {concrete_name} with mappings {index_settings['mappings']}"
             )
-            self._client.indices.create(index=index_name, **index_settings)
+            self._client.indices.create(index=concrete_name, **index_settings)
+        self._ensured_indices.add(index_name)
+
+    def _text_mappings(self) -> dict:
+        if self._text_analysis == "pretokenized":
+            # the raw text is only kept in _source, search goes through the token fields
+            return {
+                self._text_field: {"type": "text", "index": False},
+                self._contextualized_text_field: {"type": "text", "index": False},
+                **self._token_mappings(),
+            }
+        return {
+            self._text_field: {
+                "type": "text",
+                "analyzer": "ik_smart",
+                "search_analyzer": "ik_smart",
+            },
+            self._contextualized_text_field: {
+                "type": "text",
+                "analyzer": "ik_smart",
+                "search_analyzer": "ik_smart",
+            },
+        }
+
+    @staticmethod
+    def _token_mappings() -> dict:
+        return {
+            field: {
+                "type": "text",
+                "analyzer": "whitespace",
+                "search_analyzer": "whitespace",
+            }
+            for field in TOKEN_FIELDS
+        }
+
+    def _add_token_fields_if_not_exists(self, index_name: str) -> None:
+        # indices created in ik mode get the token fields, chunks indexed before
+        # the switch keep matching by vector only until they are re-indexed
+        mapping = self._client.indices.get_mapping(index=index_name)
+        for concrete_name, index_mapping in mapping.items():
+            properties = index_mapping["mappings"].get("properties", {})
+            missing = {
+                field: value
+                for field, value in self._token_mappings().items()
+                if field not in properties
+            }
+            if missing:
+                logger.info(f"Adding token fields {list(missing)} to index {concrete_name}")
+                self._client.indices.put_mapping(index=concrete_name, properties=missing)
 
     def add(
         self,
@@ -160,9 +381,13 @@ class ElasticSearchVector:
 
         if create_index_if_not_exists:
             dims_length = len(nodes[0].get_embedding())
-            self._create_index_if_not_exists(
-                index_name=self._index_name, dims_length=dims_length
-            )
+            for index_name in {
+                self._write_index(node.get_metadata().get("knowledge_base_id"))
+                for node in nodes
+            }:
+                self._create_index_if_not_exists(
+                    index_name=index_name, dims_length=dims_length
+                )
 
         return self._bulk_add(nodes, **add_kwargs)
 
@@ -172,9 +397,10 @@ class ElasticSearchVector:
 
         for node in nodes:
             _id = node.node_id or str(uuid.uuid4())
+            knowledge_base_id = node.get_metadata().get("knowledge_base_id")
             request = {
                 "_op_type": "index",
-                "_index": self._index_name,
+                "_index": self._write_index(knowledge_base_id),
                 "_id": _id,
                 "_source": {
                     self._vector_field: node.get_embedding(),
@@ -183,6 +409,17 @@ class ElasticSearchVector:
                     "metadata": node.get_metadata(),
                 },
             }
+            routing = self._routing([knowledge_base_id])
+            if routing:
+                request["_routing"] = routing
+            if self._text_analysis == "pretokenized":
+                request["_source"].update(
+                    {
+                        field: value
+                        for field, value in node.get_tokens().items()
+                        if field in TOKEN_FIELDS
+                    }
+                )
             requests.append(request)
             return_ids.append(_id)
 
@@ -220,7 +457,7 @@ class ElasticSearchVector:
     ) -> None:
         try:
             res = self._client.delete_by_query(
-                index=self._index_name,
+                **self._search_target([knowledge_base_id]),
                 body={
                     "query": {
                         "bool": {
@@ -251,77 +488,355 @@ class ElasticSearchVector:
             )
             raise
 
-    def query(
+    def count(self, knowledge_base_ids: Optional[List] = None) -> int:
+        """
+        Chunks of `knowledge_base_ids`, of every knowledge base when None.
+        """
+        if not self._client.indices.exists(index=self._index_name):
+            return 0
+        if not knowledge_base_ids:
+            return self._client.count(index=self._index_name)["count"]
+        return self._client.count(
+            **self._search_target(knowledge_base_ids),
+            query={
+                "terms": {
+                    "metadata.knowledge_base_id": [str(kb_id) for kb_id in knowledge_base_ids]
+                }
+            },
+        )["count"]
+
+    def choose_layout(self) -> str:
+        """
+        The layout fitting the size of the tenant, for `migrate_layout`.
+        """
+        if self.count() >= self._index_config.per_knowledge_base_min_docs:
+            return "per_knowledge_base"
+        return "routed"
+
+    def _source_knowledge_base_ids(self, sources: List[str]) -> List[str]:
+        response = self._client.search(
+            index=",".join(sources),
+            size=0,
+            aggs={
+                "knowledge_base_ids": {
+                    "terms": {"field": "metadata.knowledge_base_id", "size": 65536}
+                }
+            },
+        )
+        return [
+            bucket["key"]
+            for bucket in response["aggregations"]["knowledge_base_ids"]["buckets"]
+        ]
+
+    def migrate_layout(self, layout: INDEX_LAYOUTS) -> bool:
+        """
+        Reindex the chunks of the tenant into new indices of `layout`, then
+        point the tenant alias to them and delete the old indices in one
+        step. The old indices are write-blocked meanwhile, ingestion tasks
+        failing during a migration have to be retried. False when the tenant
+        has no index or already has the layout.
+        """
+        if layout == "shared":
+            raise ValueError("Tenants can not be migrated back to the shared layout.")
+        mappings = self._get_mappings()
+        if not mappings or self.layout() == layout:
+            return False
+        sources = list(mappings)
+        source_index = ",".join(sources)
+        for name, index_mapping in mappings.items():
+            if self._vector_field in (
+                index_mapping["mappings"].get("_source", {}).get("excludes", [])
+            ):
+                raise ValueError(
+                    f"Index {name} does not keep the vectors in _source, its documents"
+                    " have to be processed again instead of reindexed."
+                )
+        dims_length = next(iter(mappings.values()))["mappings"]["properties"][
+            self._vector_field
+        ]["dims"]
+
+        if layout == "per_knowledge_base":
+            targets = {
+                self._knowledge_base_index(kb_id): kb_id
+                for kb_id in self._source_knowledge_base_ids(sources)
+            }
+        else:
+            targets = {self._routed_index(): None}
+        if not targets:
+            # no chunk to move, the indices are created at the next ingestion
+            return False
+        body = self._index_body(layout, dims_length)
+        # the alias moves over once every chunk is copied
+        body.pop("aliases")
+
+        logger.info(f"Migrating {source_index} to {layout} indices {list(targets)}")
+        self._client.indices.put_settings(
+            index=source_index, settings={"index.blocks.write": True}
+        )
+        try:
+            for target, kb_id in targets.items():
+                self._client.indices.create(index=target, **body)
+                source = {"index": sources}
+                reindex_kwargs = {}
+                if kb_id is not None:
+                    source["query"] = {"term": {"metadata.knowledge_base_id": kb_id}}
+                if layout == "routed":
+                    reindex_kwargs["script"] = {
+                        "lang": "painless",
+                        "source": "ctx._routing = String.valueOf(ctx._source.metadata.knowledge_base_id)",
+                    }
+                self._client.reindex(
+                    source=source,
+                    dest={"index": target},
+                    slices="auto",
+                    refresh=True,
+                    wait_for_completion=True,
+                    **reindex_kwargs,
+                )
+
+            copied = self._client.count(index=",".join(targets))["count"]
+            total = self._client.count(index=source_index)["count"]
+            if copied != total:
+                raise ValueError(
+                    f"Copied {copied} of {total} chunks of {source_index}, chunks without knowledge base?"
+                )
+
+            self._client.indices.update_aliases(
+                actions=[
+                    {"add": {"index": target, "alias": self._index_name}}
+                    for target in targets
+                ]
+                + [{"remove_index": {"index": source}} for source in sources]
+            )
+        except Exception:
+            for target in targets:
+                self._client.indices.delete(index=target, ignore_unavailable=True)
+            self._client.indices.put_settings(
+                index=source_index, settings={"index.blocks.write": False}
+            )
+            raise
+
+        self._layout = layout
+        self._ensured_indices.clear()
+        return True
+
+    @staticmethod
+    def _gc_query(
+        knowledge_base_id,
+        document_ids: Optional[List] = None,
+        before: Optional[str] = None,
+    ) -> dict:
+        filter = [{"term": {"metadata.knowledge_base_id": knowledge_base_id}}]
+        if document_ids:
+            filter.append({"terms": {"metadata.document_id": list(document_ids)}})
+        if before:
+            # chunks of a re-processed document indexed after the cutoff are kept
+            filter.append({"range": {"metadata.created_at": {"lt": before}}})
+        return {"bool": {"filter": filter}}
+
+    def iter_image_ids(
+        self,
+        knowledge_base_id,
+        document_ids: Optional[List] = None,
+        before: Optional[str] = None,
+    ):
+        """
+        The image ids of the chunks `delete_async` would delete.
+        """
+        target = self._search_target([knowledge_base_id])
+        for hit in scan(
+            self._client,
+            query={"query": self._gc_query(knowledge_base_id, document_ids, before)},
+            _source=["metadata.image_id"],
+            **target,
+        ):
+            image_id = hit["_source"].get("metadata", {}).get("image_id")
+            if image_id:
+                yield image_id
+
+    def bytes_per_doc(self, knowledge_base_id=None) -> float:
+        """
+        Average primary store size of a chunk, to estimate reclaimed bytes.
+        """
+        index = self._search_target([knowledge_base_id] if knowledge_base_id else None)["index"]
+        stats = self._client.indices.stats(
+            index=index, metric="docs,store", ignore_unavailable=True
+        )["_all"]["primaries"]
+        count = stats.get("docs", {}).get("count", 0)
+        return stats.get("store", {}).get("size_in_bytes", 0) / count if count else 0.0
+
+    def delete_async(
+        self,
+        knowledge_base_id,
+        document_ids: Optional[List] = None,
+        before: Optional[str] = None,
+        requests_per_second: Optional[float] = None,
+    ) -> dict:
+        """
+        Delete the chunks of a knowledge base, or of some of its documents, in
+        the background. Returns {"task": id} of the Elasticsearch task to poll
+        with `gc_task_status`, or {"deleted": n, "bytes": n} when the whole
+        index of a knowledge base could be dropped at once.
+        """
+        if self.layout() == "per_knowledge_base" and not document_ids and not before:
+            index_name = self._knowledge_base_index(knowledge_base_id)
+            if not self._client.indices.exists(index=index_name):
+                return {"deleted": 0, "bytes": 0}
+            stats = self._client.indices.stats(index=index_name, metric="docs,store")
+            primaries = stats["_all"]["primaries"]
+            self._client.indices.delete(index=index_name)
+            self._ensured_indices.discard(index_name)
+            return {
+                "deleted": primaries["docs"]["count"],
+                "bytes": primaries["store"]["size_in_bytes"],
+            }
+        response = self._client.delete_by_query(
+            **self._search_target([knowledge_base_id]),
+            query=self._gc_query(knowledge_base_id, document_ids, before),
+            slices="auto",
+            conflicts="proceed",
+            refresh=False,
+            wait_for_completion=False,
+            requests_per_second=requests_per_second or -1,
+        )
+        return {"task": response["task"]}
+
+    def gc_task_status(self, task_id: str) -> Tuple[bool, int]:
+        """
+        (completed, deleted chunks) of a `delete_async` task.
+        """
+        response = self._client.tasks.get(task_id=task_id)
+        if not response.get("completed"):
+            return False, 0
+        if response.get("error"):
+            raise RuntimeError(f"Delete task {task_id} failed: {response['error']}")
+        return True, response.get("response", {}).get("deleted", 0)
+
+    def iter_document_ids(self, batch_size: int = 1000):
+        """
+        Yield (knowledge base id, document id) of every document with chunks
+        in the tenant's indices.
+        """
+        if not self._client.indices.exists(index=self._index_name):
+            return
+        after = None
+        while True:
+            composite = {
+                "size": batch_size,
+                "sources": [
+                    {"knowledge_base_id": {"terms": {"field": "metadata.knowledge_base_id"}}},
+                    {"document_id": {"terms": {"field": "metadata.document_id"}}},
+                ],
+            }
+            if after:
+                composite["after"] = after
+            response = self._client.search(
+                index=self._index_name,
+                size=0,
+                aggs={"documents": {"composite": composite}},
+            )
+            agg = response["aggregations"]["documents"]
+            for bucket in agg["buckets"]:
+                yield bucket["key"]["knowledge_base_id"], bucket["key"]["document_id"]
+            after = agg.get("after_key")
+            if not after or not agg["buckets"]:
+                return
+
+    def _text_query(self, query_str: str, text_boost: float) -> Optional[dict]:
+        if self._text_analysis == "pretokenized":
+            # None when nothing but stop words is left, the search is then kNN only
+            return get_fulltext_queryer().question(
+                query_str,
+                [CONTENT_TOKENS_FIELD, CONTEXTUALIZED_TOKENS_FIELD],
+                sm_field=CONTENT_SM_TOKENS_FIELD,
+                boost=text_boost,
+            )
+        return {
+            "multi_match": {
+                "query": query_str,
+                "fields": [
+                    self._text_field,
+                    self._contextualized_text_field,
+                ],
+                "boost": text_boost,
+            }
+        }
+
+    def _search_request(
         self,
         query: dict,
-        es_filter: Optional[List[Dict]] = None,
-        knn_boost: float = 1.5,
-        text_boost: float = 0.5,
-        **kwargs: Any,
-    ) -> list[BaseNode]:
+        es_filter: Optional[List[Dict]],
+        knn_boost: float,
+        text_boost: float,
+    ) -> Tuple[dict, dict]:
+        # the target and body of the search of `query`
         query_embedding = cast(List[float], query["query_embedding"])
+        k = query.get("recall_k") or query["similarity_top_k"]
+        num_candidates = min(
+            max(query.get("num_candidates") or k * 10, k), MAX_NUM_CANDIDATES
+        )
 
         filter = es_filter or []
 
-        es_query = {
+        body = {
             "knn": {
                 "filter": filter,
                 "field": self._vector_field,
                 "query_vector": query_embedding,
-                "k": query["similarity_top_k"],
-                "num_candidates": query["similarity_top_k"] * 10,
+                "k": k,
+                "num_candidates": num_candidates,
                 "boost": knn_boost,
             },
-            "query": {
+            "size": k,
+            "_source": {"excludes": [self._vector_field]},
+        }
+        text_query = self._text_query(query["query_str"], text_boost)
+        if text_query is not None:
+            body["query"] = {
                 "bool": {
-                    "must": [
-                        {
-                            "multi_match": {
-                                "query": query["query_str"],
-                                "fields": [
-                                    self._text_field,
-                                    self._contextualized_text_field,
-                                ],
-                                "boost": text_boost,
-                            }
-                        }
-                    ],
+                    "must": [text_query],
                     "filter": filter,
                 }
-            },
-            "rank": {
+            }
+            body["rank"] = {
                 "rrf": {
-                    "rank_constant": 10 if query["similarity_top_k"] <= 5 else (
-                        20 if query["similarity_top_k"] <= 10 else 60
-                    )
+                    "rank_constant": 10 if k <= 5 else (20 if k <= 10 else 60)
                 }
-            },
-        }
+            }
+        if query.get("timeout_ms"):
+            body["timeout"] = f"{int(query['timeout_ms'])}ms"
 
-        response = self._client.search(
-            index=self._index_name,
-            **es_query,
-            size=query["similarity_top_k"],
-            _source={"excludes": [self._vector_field]},
-        )
+        return self._search_target(self._filter_knowledge_base_ids(filter)), body
 
-        print(response)
+    def _query_result(
+        self, response: dict, k: int, stats: Optional[dict] = None
+    ) -> Tuple[List[BaseNode], List[str], List[float]]:
+        hits = response["hits"]["hits"]
+        if response.get("timed_out"):
+            logger.warning(
+                f"Search of index {self._index_name} timed out after {response.get('took')}ms"
+                f" with {len(hits)} of {k} hits"
+            )
+        if stats is not None:
+            stats.update(
+                took=response.get("took", 0),
+                timed_out=bool(response.get("timed_out")),
+                hits=len(hits),
+            )
 
-        top_k_nodes = []
         top_k_ids = []
         top_k_scores = []
-        hits = response["hits"]["hits"]
         nodes = []
         for hit in hits:
             source = hit["_source"]
-            metadata = source.get("metadata", None)
-            content = source.get(self._text_field, None)
-            node_id = hit["_id"]
-
-            node = BaseNode(content=content, metadata=metadata, id_=node_id)
+            node = BaseNode(
+                content=source.get(self._text_field) or "",
+                contextualized_content=source.get(self._contextualized_text_field) or "",
+                metadata=source.get("metadata") or {},
+                id_=hit["_id"],
+            )
 
-            top_k_nodes.append(node)
-            top_k_ids.append(node_id)
+            top_k_ids.append(hit["_id"])
             top_k_scores.append(hit.get("_rank", hit["_score"]))
 
             nodes.append(node)
@@ -331,6 +846,74 @@ class ElasticSearchVector:
 
         return (nodes, top_k_ids, _to_llama_similarities(top_k_scores))
 
+    def query(
+        self,
+        query: dict,
+        es_filter: Optional[List[Dict]] = None,
+        knn_boost: float = 1.5,
+        text_boost: float = 0.5,
+        stats: Optional[dict] = None,
+        **kwargs: Any,
+    ) -> list[BaseNode]:
+        """
+        Hybrid kNN and full text search. `query` holds the `query_str`, the
+        `query_embedding` and the `similarity_top_k` hits to return, and
+        optionally:
+
+        - recall_k: hits to return instead of `similarity_top_k`, the recall
+          set of a two stage retrieval.
+        - num_candidates: kNN candidates per shard, 10 * k by default.
+        - timeout_ms: search budget, the hits found within it are returned
+          when it runs out.
+
+        `stats`, when given, is filled with the `took`, `timed_out` and `hits`
+        of the search.
+        """
+        target, body = self._search_request(query, es_filter, knn_boost, text_boost)
+        response = self._client.search(**target, **body)
+        return self._query_result(response, body["size"], stats)
+
+    def query_batch(
+        self,
+        queries: List[dict],
+        es_filter: Optional[List[Dict]] = None,
+        knn_boost: float = 1.5,
+        text_boost: float = 0.5,
+        stats: Optional[List[dict]] = None,
+        **kwargs: Any,
+    ) -> List[Tuple[List[BaseNode], List[str], List[float]]]:
+        """
+        The results of `query` for every query of `queries`, searched with one
+        multi search request. A query whose search fails gets an empty result.
+        `stats`, when given, gets the stats of every search appended.
+        """
+        searches = []
+        for query in queries:
+            target, body = self._search_request(query, es_filter, knn_boost, text_boost)
+            searches.extend([target, body])
+        if not searches:
+            return []
+
+        response = self._client.msearch(
+            searches=searches, max_concurrent_searches=MSEARCH_MAX_CONCURRENT_SEARCHES
+        )
+
+        results = []
+        for i, item in enumerate(response["responses"]):
+            item_stats = {"took": 0, "timed_out": False, "hits": 0}
+            if "error" in item:
+                logger.error(
+                    f"Search {i} of a multi search of index {self._index_name} failed: {item['error']}"
+                )
+                results.append(([], [], []))
+            else:
+                results.append(
+                    self._query_result(item, searches[2 * i + 1]["size"], item_stats)
+                )
+            if stats is not None:
+                stats.append(item_stats)
+        return results
+
 
 class ElasticSearchVectorFactory:
     _instance = None
@@ -356,6 +939,26 @@ class ElasticSearchVectorFactory:
                 username=config.get("ELASTICSEARCH_USERNAME"),
                 password=config.get("ELASTICSEARCH_PASSWORD"),
             ),
+            text_analysis=config.get("ELASTICSEARCH_TEXT_ANALYSIS", "ik"),
+            index_config=ElasticSearchIndexConfig(
+                layout=config.get("ELASTICSEARCH_INDEX_LAYOUT", "routed"),
+                per_knowledge_base_min_docs=config.get(
+                    "ELASTICSEARCH_PER_KNOWLEDGE_BASE_MIN_DOCS", 500000
+                ),
+                number_of_shards=config.get("ELASTICSEARCH_NUMBER_OF_SHARDS", 1),
+                routed_number_of_shards=config.get(
+                    "ELASTICSEARCH_ROUTED_NUMBER_OF_SHARDS", 4
+                ),
+                number_of_replicas=config.get("ELASTICSEARCH_NUMBER_OF_REPLICAS", 1),
+                vector_index_type=config.get(
+                    "ELASTICSEARCH_VECTOR_INDEX_TYPE", "int8_hnsw"
+                ),
+                vector_in_source=config.get("ELASTICSEARCH_VECTOR_IN_SOURCE", True),
+                hnsw_m=config.get("ELASTICSEARCH_HNSW_M", 16),
+                hnsw_ef_construction=config.get(
+                    "ELASTICSEARCH_HNSW_EF_CONSTRUCTION", 100
+                ),
+            ),
             client=self._es_client,
         )
 
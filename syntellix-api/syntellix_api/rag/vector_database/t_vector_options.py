@@ -0,0 +1,183 @@
+import os
+import sys
+sys.path.insert(
+    0,
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(
+                os.path.abspath(__file__)),
+            '../../../')))
+
+import argparse
+import json
+from timeit import default_timer as timer
+
+import numpy as np
+from elasticsearch import Elasticsearch
+
+from syntellix_api.rag.llm.embedding_model_local import EmbeddingModel, truncate_embeddings
+from syntellix_api.rag.vector_database.elasticsearch.elasticsearch_vector import (
+    ElasticSearchIndexConfig, ElasticSearchVector)
+from syntellix_api.rag.vector_database.vector_model import BaseNode
+
+
+def load_jsonl(fnm):
+    with open(fnm, encoding="utf-8") as f:
+        return [json.loads(l) for l in f if l.strip()]
+
+
+def vector_bytes(index_type, dims):
+    """
+    Bytes per vector the searches keep in memory, without the HNSW graph.
+    """
+    if index_type.startswith("int8"):
+        return dims + 4
+    if index_type.startswith("int4"):
+        return dims / 2 + 4
+    if index_type.startswith("bbq"):
+        return dims / 8 + 14
+    return dims * 4
+
+
+def embed(args, texts, name):
+    cache = os.path.join(args.cache_dir, f"{name}.npy") if args.cache_dir else None
+    if cache and os.path.exists(cache):
+        return np.load(cache)
+    # full size embeddings, every variant truncates its own
+    model = EmbeddingModel(model_name=args.model, dimensions=0)
+    vectors = np.asarray(model.encode(texts))
+    if cache:
+        os.makedirs(args.cache_dir, exist_ok=True)
+        np.save(cache, vectors)
+    return vectors
+
+
+def build_index(args, es, index_type, dims, corpus, vectors):
+    index_name = f"{args.index_prefix}_{index_type}_{dims or 'full'}"
+    es.indices.delete(index=index_name, ignore_unavailable=True)
+    vector = ElasticSearchVector(
+        index_name,
+        None,
+        index_config=ElasticSearchIndexConfig(
+            layout="shared",
+            number_of_replicas=0,
+            vector_index_type=index_type,
+            vector_in_source=not args.exclude_source,
+            hnsw_m=args.m,
+            hnsw_ef_construction=args.ef_construction,
+        ),
+        client=es,
+    )
+    vectors = truncate_embeddings(vectors, dims)
+    st = timer()
+    for i in range(0, len(corpus), args.batch_size):
+        vector.add([
+            BaseNode(
+                content=doc["text"],
+                contextualized_content="",
+                embedding=v.tolist(),
+                metadata={"knowledge_base_id": "bench", "document_id": str(doc["id"])},
+            )
+            for doc, v in zip(corpus[i:i + args.batch_size], vectors[i:i + args.batch_size])
+        ])
+    if args.force_merge:
+        es.indices.forcemerge(index=index_name, max_num_segments=1)
+    es.indices.refresh(index=index_name)
+    return index_name, timer() - st
+
+
+def search(args, es, index_name, query_vectors):
+    results, latencies, took = [], [], []
+    for v in query_vectors:
+        st = timer()
+        response = es.search(
+            index=index_name,
+            knn={
+                "field": "embedding",
+                "query_vector": v.tolist(),
+                "k": args.k,
+                "num_candidates": args.k * args.num_candidates_factor,
+            },
+            size=args.k,
+            _source=["metadata.document_id"],
+        )
+        latencies.append(timer() - st)
+        took.append(response["took"] / 1000)
+        results.append([hit["_source"]["metadata"]["document_id"] for hit in response["hits"]["hits"]])
+    return results, np.array(latencies), np.array(took)
+
+
+def recall(results, expected, k):
+    scores = [
+        len(set(res[:k]) & set(exp)) / min(k, len(exp))
+        for res, exp in zip(results, expected) if exp
+    ]
+    return float(np.mean(scores)) if scores else 0.0
+
+
+def main(args):
+    corpus = load_jsonl(args.corpus)
+    queries = load_jsonl(args.queries)
+    labels = [[str(i) for i in q.get("relevant", [])] for q in queries]
+    print(f"{len(corpus)} docs, {len(queries)} queries")
+    vectors = embed(args, [doc["text"] for doc in corpus], "corpus")
+    query_vectors = embed(args, [q["query"] for q in queries], "queries")
+
+    es = Elasticsearch(
+        hosts=args.host,
+        basic_auth=(args.username, args.password) if args.username else None,
+        request_timeout=600,
+    )
+
+    variants = [("hnsw", 0)] + [
+        (t, int(d)) for t in args.index_types.split(",") for d in args.dims.split(",")
+        if (t, int(d)) != ("hnsw", 0)
+    ]
+    baseline = None
+    print("variant\tindex s\trecall@k\tvs baseline\tp50 ms\tp95 ms\ttook p50 ms\tstore MB\tvector RAM MB")
+    for index_type, dims in variants:
+        index_name, elapsed = build_index(args, es, index_type, dims, corpus, vectors)
+        results, latencies, took = search(args, es, index_name, truncate_embeddings(query_vectors, dims))
+        if baseline is None:
+            # full size float vectors
+            baseline = results
+        stats = es.indices.stats(index=index_name, metric="store")["_all"]["primaries"]
+        used_dims = dims or vectors.shape[1]
+        print(f"{index_type}/{used_dims}\t{elapsed:.1f}\t{recall(results, labels, args.k):.4f}"
+              f"\t{recall(results, baseline, args.k):.4f}"
+              f"\t{np.percentile(latencies, 50) * 1000:.1f}\t{np.percentile(latencies, 95) * 1000:.1f}"
+              f"\t{np.percentile(took, 50) * 1000:.1f}"
+              f"\t{stats['store']['size_in_bytes'] / 1024 / 1024:.1f}"
+              f"\t{len(corpus) * vector_bytes(index_type, used_dims) / 1024 / 1024:.1f}")
+        if not args.keep:
+            es.indices.delete(index=index_name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Recall and latency of quantized and truncated vector indices against full float vectors.")
+    parser.add_argument('--corpus', help='JSON lines of {"id", "text"}', required=True)
+    parser.add_argument('--queries', help='JSON lines of {"query", "relevant": [corpus ids]}', required=True)
+    parser.add_argument('--model', help="Embedding model. Default: BAAI/bge-large-zh-v1.5",
+                        default="BAAI/bge-large-zh-v1.5")
+    parser.add_argument('--host', help="Default: http://127.0.0.1:9200", default="http://127.0.0.1:9200")
+    parser.add_argument('--username', help="Default: elastic", default="elastic")
+    parser.add_argument('--password', help="Default: elastic", default="elastic")
+    parser.add_argument('--index_types', help="Comma separated dense_vector index types. "
+                        "Default: hnsw,int8_hnsw,int4_hnsw,bbq_hnsw", default="hnsw,int8_hnsw,int4_hnsw,bbq_hnsw")
+    parser.add_argument('--dims', help="Comma separated truncated dimensions, 0 keeps them all. Default: 0",
+                        default="0")
+    parser.add_argument('--k', help="Default: 10", type=int, default=10)
+    parser.add_argument('--num_candidates_factor', help="num_candidates = k * factor. Default: 10",
+                        type=int, default=10)
+    parser.add_argument('--m', help="HNSW m. Default: 16", type=int, default=16)
+    parser.add_argument('--ef_construction', help="HNSW ef_construction. Default: 100", type=int, default=100)
+    parser.add_argument('--exclude_source', help="Drop the vectors from _source", action="store_true")
+    parser.add_argument('--force_merge', help="Merge every index to one segment before searching",
+                        action="store_true")
+    parser.add_argument('--batch_size', help="Default: 500", type=int, default=500)
+    parser.add_argument('--cache_dir', help="Directory to keep the embeddings in between runs", default=None)
+    parser.add_argument('--index_prefix', help="Default: bench_vectors", default="bench_vectors")
+    parser.add_argument('--keep', help="Keep the indices", action="store_true")
+    args = parser.parse_args()
+    main(args)
@@ -15,6 +15,9 @@ class BaseNode(BaseModel):
         default=None, description="Embedding of the node."
     )
     metadata: Optional[dict] = Field(default_factory=dict)
+    tokens: Optional[dict[str, str]] = Field(
+        default=None, description="Pre-tokenized text of the node by field, indexed as is."
+    )
 
     def get_content(self) -> str:
         return self.content
@@ -25,6 +28,9 @@ class BaseNode(BaseModel):
     def get_metadata(self) -> dict:
         return self.metadata
 
+    def get_tokens(self) -> dict[str, str]:
+        return self.tokens or {}
+
     def set_content(self, value: str) -> None:
         self.content = value
 
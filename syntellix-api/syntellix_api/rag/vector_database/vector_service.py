@@ -44,7 +44,23 @@ class VectorService:
             return self._vector_processor.query(query, es_filter, **kwargs)
         except Exception as e:
             logger.error(f"Error querying vector database: {str(e)}", exc_info=True)
-            return []
+            return [], [], []
+
+    def query_batch(
+        self,
+        queries: List[dict],
+        es_filter: Optional[List[Dict]] = None,
+        **kwargs: Any,
+    ) -> list[tuple]:
+        logger.debug(f"Querying vector database with {len(queries)} queries")
+        try:
+            return self._vector_processor.query_batch(queries, es_filter, **kwargs)
+        except Exception as e:
+            logger.error(f"Error querying vector database: {str(e)}", exc_info=True)
+            return [([], [], []) for _ in queries]
+
+    def count(self, knowledge_base_ids: Optional[List[str]] = None) -> int:
+        return self._vector_processor.count(knowledge_base_ids)
 
     def delete_by_knowledge_base_and_document_id(
         self, knowledge_base_id: str, document_id: str
@@ -59,3 +75,38 @@ class VectorService:
             logger.info("Document deleted successfully")
         except Exception as e:
             logger.error(f"Error deleting document: {str(e)}", exc_info=True)
+
+    def delete_async(
+        self,
+        knowledge_base_id: str,
+        document_ids: Optional[List[str]] = None,
+        before: Optional[str] = None,
+        requests_per_second: Optional[float] = None,
+    ) -> dict:
+        logger.info(
+            f"Deleting chunks of knowledge_base_id {knowledge_base_id}"
+            + (f" and document_ids {document_ids}" if document_ids else "")
+            + (f" indexed before {before}" if before else "")
+        )
+        return self._vector_processor.delete_async(
+            knowledge_base_id, document_ids, before, requests_per_second
+        )
+
+    def gc_task_status(self, task_id: str) -> tuple[bool, int]:
+        return self._vector_processor.gc_task_status(task_id)
+
+    def iter_image_ids(
+        self,
+        knowledge_base_id: str,
+        document_ids: Optional[List[str]] = None,
+        before: Optional[str] = None,
+    ):
+        return self._vector_processor.iter_image_ids(
+            knowledge_base_id, document_ids, before
+        )
+
+    def iter_document_ids(self):
+        return self._vector_processor.iter_document_ids()
+
+    def bytes_per_doc(self, knowledge_base_id: Optional[str] = None) -> float:
+        return self._vector_processor.bytes_per_doc(knowledge_base_id)
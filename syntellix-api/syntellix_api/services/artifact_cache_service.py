@@ -0,0 +1,140 @@
+import hashlib
+import json
+import logging
+import pickle
+import zlib
+from io import BytesIO
+from typing import Any, Optional
+
+from syntellix_api.configs import syntellix_config
+from syntellix_api.extensions.ext_redis import redis_client
+from syntellix_api.extensions.ext_storage import storage
+from syntellix_api.rag.utils.file_utils import resource_stamps
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_STAGES = ("chunks", "contexts", "embeddings")
+STATS_KEY = "artifact_cache:stats"
+# the OCR and layout models and the tokenizer dictionary, which change the
+# chunks of a file as much as the parser config does
+PARSER_RESOURCES = ("rag/res/deepdoc", "rag/res/huqie.txt")
+
+
+def _digest(value: dict) -> str:
+    return hashlib.sha3_256(
+        json.dumps(value, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+class ArtifactCacheService:
+    """
+    Parsed chunks, contexts and embeddings of uploaded files, stored in object
+    storage under keys derived from the file content and everything that
+    produced them. Each stage's key includes the key of the stage it was built
+    from, so a new embedding model reuses cached chunks and contexts.
+    """
+
+    @staticmethod
+    def stage_keys(file_hash: str, parser_type: str, parser_config: dict) -> dict[str, str]:
+        chunks = _digest(
+            {
+                "file_hash": file_hash,
+                "parser_type": parser_type,
+                "parser_config": parser_config,
+                "version": syntellix_config.INDEXING_ARTIFACT_CACHE_VERSION,
+                "resources": resource_stamps(PARSER_RESOURCES),
+                "quantized_models": syntellix_config.DEEPDOC_ORT_QUANTIZED_MODELS,
+                "text_layer_first": syntellix_config.DEEPDOC_PDF_TEXT_LAYER_FIRST,
+                "text_layer_min_chars": syntellix_config.DEEPDOC_PDF_TEXT_LAYER_MIN_CHARS,
+            }
+        )
+        contexts = _digest(
+            {"chunks": chunks, "model": syntellix_config.DEEPSEEK_MODEL_NAME}
+        )
+        embedding_key = {"contexts": contexts, "model": syntellix_config.EMBEDDING_MODEL_NAME}
+        if syntellix_config.EMBEDDING_DIMENSIONS:
+            # full embeddings keep their keys
+            embedding_key["dimensions"] = syntellix_config.EMBEDDING_DIMENSIONS
+        embeddings = _digest(embedding_key)
+        return {"chunks": chunks, "contexts": contexts, "embeddings": embeddings}
+
+    @staticmethod
+    def _storage_key(stage: str, key: str) -> str:
+        return f"artifacts/{stage}/{key[:2]}/{key}.pkl.z"
+
+    @staticmethod
+    def load(stage: str, key: str) -> Optional[Any]:
+        if not syntellix_config.INDEXING_ARTIFACT_CACHE_ENABLED:
+            return None
+        storage_key = ArtifactCacheService._storage_key(stage, key)
+        try:
+            if not storage.exists(storage_key):
+                ArtifactCacheService._record(stage, hit=False)
+                return None
+            data = storage.load_once(storage_key)
+            value = ArtifactCacheService.deserialize(data)
+        except Exception as e:
+            logger.warning(f"Failed to load {stage} artifact {key}: {str(e)}")
+            ArtifactCacheService._record(stage, hit=False)
+            return None
+        ArtifactCacheService._record(stage, hit=True, size=len(data))
+        logger.info(f"Artifact cache hit: {stage} {key}, {len(data)} bytes reused")
+        return value
+
+    @staticmethod
+    def save(stage: str, key: str, value: Any) -> None:
+        if not syntellix_config.INDEXING_ARTIFACT_CACHE_ENABLED:
+            return
+        try:
+            data = ArtifactCacheService.serialize(stage, value)
+            storage.save(ArtifactCacheService._storage_key(stage, key), data)
+        except Exception as e:
+            logger.warning(f"Failed to save {stage} artifact {key}: {str(e)}")
+
+    @staticmethod
+    def serialize(stage: str, value: Any) -> bytes:
+        if stage == "chunks":
+            value = [ArtifactCacheService._portable_chunk(chunk) for chunk in value]
+        return zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+    @staticmethod
+    def deserialize(data: bytes) -> Any:
+        return pickle.loads(zlib.decompress(data))
+
+    @staticmethod
+    def _portable_chunk(chunk: dict) -> dict:
+        # chunk images are stored as the JPEG bytes they are indexed with
+        image = chunk.get("image")
+        if image is None or isinstance(image, bytes):
+            return chunk
+        output_buffer = BytesIO()
+        image.save(output_buffer, format="JPEG")
+        return {**chunk, "image": output_buffer.getvalue()}
+
+    @staticmethod
+    def _record(stage: str, hit: bool, size: int = 0) -> None:
+        try:
+            pipe = redis_client.pipeline()
+            pipe.hincrby(STATS_KEY, f"{stage}:{'hits' if hit else 'misses'}", 1)
+            if size:
+                pipe.hincrby(STATS_KEY, f"{stage}:bytes_saved", size)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to record artifact cache stats: {str(e)}")
+
+    @staticmethod
+    def get_stats() -> dict[str, dict[str, int]]:
+        """
+        Hits, misses and reused artifact bytes per stage since the stats were
+        last reset.
+        """
+        raw = redis_client.hgetall(STATS_KEY)
+        stats = {stage: {"hits": 0, "misses": 0, "bytes_saved": 0} for stage in ARTIFACT_STAGES}
+        for field, value in raw.items():
+            stage, name = field.split(":", 1)
+            stats.setdefault(stage, {})[name] = int(value)
+        return stats
+
+    @staticmethod
+    def reset_stats() -> None:
+        redis_client.delete(STATS_KEY)
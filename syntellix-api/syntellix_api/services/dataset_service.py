@@ -14,11 +14,16 @@ from syntellix_api.models.dataset_model import (
     KnowledgeBasePermissionEnum,
     UploadFile,
 )
-from syntellix_api.rag.vector_database.vector_service import VectorService
+from syntellix_api.services.document_progress_service import DocumentProgressService
 from syntellix_api.services.errors.account import NoPermissionError
 from syntellix_api.services.errors.dataset import DatasetNameDuplicateError
 from syntellix_api.services.errors.file import FileNotExistsError
+from syntellix_api.services.ingestion_scheduler_service import IngestionScheduler
 from syntellix_api.tasks.document_processing import process_document
+from syntellix_api.tasks.vector_gc import (
+    delete_document_vectors,
+    delete_knowledge_base_vectors,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -223,8 +228,17 @@ class KonwledgeBaseService:
 
         KonwledgeBaseService.check_knowledge_base_permission(knowledge_base, user)
 
+        tenant_id = knowledge_base.tenant_id
         db.session.delete(knowledge_base)
         db.session.commit()
+
+        # chunks and images of the knowledge base are purged in the background
+        try:
+            delete_knowledge_base_vectors.delay(tenant_id, knowledge_base_id)
+        except Exception as e:
+            logger.error(
+                f"Failed to send vector GC task for knowledge base {knowledge_base_id}: {str(e)}"
+            )
         return True
 
     @staticmethod
@@ -373,6 +387,7 @@ class DocumentService:
     @staticmethod
     def save_documents(knowledge_base, args, user):
         documents = []
+        reprocessed = []
         data_source_type = args["data_source"]["type"]
 
         if data_source_type == "upload_file":
@@ -408,16 +423,15 @@ class DocumentService:
                 (doc.name, doc.extension, doc.size): doc for doc in existing_documents
             }
 
-            vector_service = VectorService(knowledge_base.tenant_id)
+            # chunks indexed before now are the ones of the previous processing
+            reprocessed_before = datetime.datetime.now().isoformat()
 
             for file in files:
                 file_key = (file.name, file.extension, file.size)
                 if file_key in existing_doc_map:
                     doc = existing_doc_map[file_key]
                     # 删除原来的索引
-                    vector_service.delete_by_knowledge_base_and_document_id(
-                        knowledge_base.id, doc.id
-                    )
+                    reprocessed.append(doc.id)
                     doc.updated_at = datetime.datetime.now()
                     doc.parser_type = DocumentParserTypeEnum(args["parser_type"])
                     doc.parser_config = args["parser_config"]
@@ -451,18 +465,40 @@ class DocumentService:
             logger.error(f"Failed to commit documents: {str(e)}")
             raise
 
-        # 为每个文档发送 Celery 任务
-        for document in documents:
+        if reprocessed:
             try:
-                process_document.delay(
-                    document.id,
-                    document.location,
-                    document.parser_type,
-                    document.parser_config,
-                    user.current_tenant_id,
+                delete_document_vectors.delay(
+                    knowledge_base.tenant_id,
                     knowledge_base.id,
+                    reprocessed,
+                    reprocessed_before,
                 )
-                logger.info(f"Celery task sent for document {document.id}")
+            except Exception as e:
+                logger.error(f"Failed to send vector GC task for documents {reprocessed}: {str(e)}")
+
+        # 为每个文档发送 Celery 任务
+        for document in documents:
+            task_args = [
+                document.id,
+                document.location,
+                document.parser_type,
+                document.parser_config,
+                user.current_tenant_id,
+                knowledge_base.id,
+            ]
+            try:
+                if IngestionScheduler.enabled():
+                    queue = IngestionScheduler.enqueue(document, task_args)
+                    DocumentProgressService.publish(
+                        knowledge_base.id,
+                        document.id,
+                        progress=0,
+                        message=f"排队中（{queue}）",
+                        parse_status=DocumentParseStatusEnum.PENDING.value,
+                    )
+                else:
+                    process_document.delay(*task_args)
+                    logger.info(f"Celery task sent for document {document.id}")
             except Exception as e:
                 logger.error(
                     f"Failed to send Celery task for document {document.id}: {str(e)}"
@@ -471,6 +507,48 @@ class DocumentService:
         logger.info(f"All tasks sent. Returning {len(documents)} documents.")
         return documents, len(documents)
 
+    @staticmethod
+    def get_pending_document(knowledge_base_id, document_id, tenant_id):
+        """
+        The document if it is still queued or processing, None otherwise.
+        """
+        return Document.query.filter(
+            Document.id == document_id,
+            Document.knowledge_base_id == knowledge_base_id,
+            Document.tenant_id == tenant_id,
+            Document.parse_status.in_(
+                [DocumentParseStatusEnum.PENDING, DocumentParseStatusEnum.PROCESSING]
+            ),
+        ).first()
+
+    @staticmethod
+    def cancel_document(document):
+        """
+        Cancel the processing of a document. A queued document is failed at
+        once, a running one when its task notices the cancellation.
+        """
+        if IngestionScheduler.cancel(document.id) == "pending":
+            document.parse_status = DocumentParseStatusEnum.FAILED
+            document.progress = 0
+            document.progress_msg = "已取消"
+            db.session.commit()
+            DocumentProgressService.publish(
+                document.knowledge_base_id,
+                document.id,
+                progress=0,
+                message="已取消",
+                parse_status=DocumentParseStatusEnum.FAILED.value,
+            )
+        logger.info(f"Document {document.id} cancelled")
+
+    @staticmethod
+    def prioritize_document(document) -> bool:
+        """
+        Process a queued document before the other queued documents of its
+        tenant. Returns False if it is no longer queued.
+        """
+        return IngestionScheduler.prioritize(document.id)
+
     @staticmethod
     def get_documents_progress(knowledge_base_id, file_ids):
         documents = Document.query.filter(
@@ -498,4 +576,4 @@ class DocumentService:
                 }
             )
 
-        return progress_data
+        return DocumentProgressService.merge_progress(progress_data)
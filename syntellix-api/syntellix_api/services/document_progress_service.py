@@ -0,0 +1,230 @@
+import json
+import logging
+import time
+from collections.abc import Iterator
+from typing import Optional
+
+from syntellix_api.configs import syntellix_config
+from syntellix_api.extensions.ext_database import db
+from syntellix_api.extensions.ext_redis import redis_client
+from syntellix_api.models.dataset_model import Document, DocumentParseStatusEnum
+from syntellix_api.services.errors.document import DocumentCancelledError
+from syntellix_api.services.ingestion_scheduler_service import IngestionScheduler
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_KEY = "document_progress:{}"
+PROGRESS_CHANNEL = "document_progress:knowledge_base:{}"
+FINAL_STATUSES = (
+    DocumentParseStatusEnum.COMPLETED.value,
+    DocumentParseStatusEnum.FAILED.value,
+)
+# seconds between two keep-alive comments of an idle event stream
+STREAM_HEARTBEAT_INTERVAL = 15
+
+
+def _status(value) -> str:
+    return getattr(value, "value", value)
+
+
+class ProgressReporter:
+    """
+    The progress callback of a document being processed. Every update goes to
+    redis, coalesced to one per `INDEXING_PROGRESS_PUBLISH_INTERVAL`, while
+    the document row is only written at stage boundaries with `stage`.
+
+    Calls follow the parsers' callback convention: `prog` is a fraction, None
+    keeps the current progress and a negative value reports an error message.
+    Every publish also renews the scheduler lease of the document, and raises
+    DocumentCancelledError once the document is cancelled.
+    """
+
+    def __init__(self, document: Document, queue_wait: Optional[float] = None):
+        self.document = document
+        self.document_id = document.id
+        self.knowledge_base_id = document.knowledge_base_id
+        self.progress = int(document.progress or 0)
+        self.message = document.progress_msg or ""
+        self.parse_status = _status(document.parse_status)
+        self.interval = syntellix_config.INDEXING_PROGRESS_PUBLISH_INTERVAL
+        self.published_at = 0.0
+        self.pending = False
+        # seconds the document waited in the ingestion queues
+        self.queue_wait = queue_wait
+        self.cancelled = False
+
+    def __call__(self, prog: Optional[float] = None, msg: str = "") -> None:
+        if prog is not None and prog >= 0:
+            self.progress = int(prog * 100)
+        if msg:
+            self.message = msg
+        self.pending = True
+        if time.monotonic() - self.published_at >= self.interval:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Publish the latest update if it was coalesced.
+        """
+        if not self.pending:
+            return
+        self.pending = False
+        self.published_at = time.monotonic()
+        DocumentProgressService.publish(
+            self.knowledge_base_id,
+            self.document_id,
+            progress=self.progress,
+            message=self.message,
+            parse_status=self.parse_status,
+            queue_wait=self.queue_wait,
+        )
+        if not self.cancelled and IngestionScheduler.heartbeat(self.document_id):
+            self.cancelled = True
+            raise DocumentCancelledError()
+
+    def stage(
+        self,
+        prog: Optional[float],
+        msg: str,
+        parse_status: Optional[DocumentParseStatusEnum] = None,
+        **fields,
+    ) -> None:
+        """
+        Publish an update at once and save it to the document row, along with
+        the other document `fields` given.
+        """
+        if parse_status is not None:
+            self.parse_status = parse_status.value
+            self.document.parse_status = parse_status
+        if prog is not None and prog < 0:
+            self.progress = 0
+        self(prog, msg)
+        self.flush()
+        self.document.progress = self.progress
+        self.document.progress_msg = self.message
+        for name, value in fields.items():
+            setattr(self.document, name, value)
+        db.session.commit()
+        logger.info(
+            f"Document {self.document_id} progress: {self.progress}% - {self.message}"
+        )
+
+
+class DocumentProgressService:
+    """
+    Processing progress of documents in redis: the latest state of each
+    document in a hash, and every update published on the channel of its
+    knowledge base for the progress event streams.
+    """
+
+    @staticmethod
+    def publish(
+        knowledge_base_id: int,
+        document_id: int,
+        progress: int,
+        message: str,
+        parse_status: str,
+        queue_wait: Optional[float] = None,
+    ) -> None:
+        state = {
+            "id": document_id,
+            "progress": progress,
+            "message": message,
+            "parse_status": parse_status,
+        }
+        if queue_wait is not None:
+            state["queue_wait"] = round(queue_wait, 1)
+        key = PROGRESS_KEY.format(document_id)
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.hset(key, mapping=state)
+            pipe.expire(key, syntellix_config.INDEXING_PROGRESS_TTL)
+            pipe.publish(
+                PROGRESS_CHANNEL.format(knowledge_base_id),
+                json.dumps(state, ensure_ascii=False),
+            )
+            pipe.execute()
+        except Exception as e:
+            # the document row still gets the progress of every stage
+            logger.warning(f"Failed to publish progress of document {document_id}: {str(e)}")
+
+    @staticmethod
+    def get_progress(document_ids: list[int]) -> dict[int, dict]:
+        """
+        The latest progress in redis of the given documents, by document id.
+        Documents without progress in redis are left out.
+        """
+        if not document_ids:
+            return {}
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            for document_id in document_ids:
+                pipe.hgetall(PROGRESS_KEY.format(document_id))
+            states = pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to load document progress: {str(e)}")
+            return {}
+        progress = {}
+        for document_id, state in zip(document_ids, states):
+            if not state:
+                continue
+            progress[document_id] = {
+                "progress": int(state["progress"]),
+                "message": state["message"],
+                "parse_status": state["parse_status"],
+            }
+            if "queue_wait" in state:
+                progress[document_id]["queue_wait"] = float(state["queue_wait"])
+        return progress
+
+    @staticmethod
+    def merge_progress(documents: list[dict]) -> list[dict]:
+        """
+        Update the progress entries read from the document rows with the newer
+        progress in redis, and the queue status of the queued documents.
+        """
+        document_ids = [doc["id"] for doc in documents]
+        progress = DocumentProgressService.get_progress(document_ids)
+        queued = IngestionScheduler.queue_status(document_ids)
+        for doc in documents:
+            if _status(doc["parse_status"]) in FINAL_STATUSES:
+                continue
+            doc.update(progress.get(doc["id"], {}))
+            doc.update(queued.get(doc["id"], {}))
+        return documents
+
+    @staticmethod
+    def stream(knowledge_base_id: int, documents: list[dict]) -> Iterator[str]:
+        """
+        Server-sent events of the progress of `documents`, the entries of
+        `DocumentService.get_documents_progress`: their current state first,
+        then every update until all of them are completed or failed.
+        """
+        pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(PROGRESS_CHANNEL.format(knowledge_base_id))
+        try:
+            # read the current state once subscribed, so that no update is missed
+            for doc in DocumentProgressService.merge_progress(documents):
+                yield f"data: {json.dumps(doc, ensure_ascii=False, default=str)}\n\n"
+            pending = {
+                doc["id"]
+                for doc in documents
+                if _status(doc["parse_status"]) not in FINAL_STATUSES
+            }
+            deadline = time.monotonic() + syntellix_config.INDEXING_PROGRESS_STREAM_TIMEOUT
+            heartbeat_at = time.monotonic() + STREAM_HEARTBEAT_INTERVAL
+            while pending and time.monotonic() < deadline:
+                message = pubsub.get_message(timeout=1.0)
+                if message is None:
+                    if time.monotonic() >= heartbeat_at:
+                        heartbeat_at = time.monotonic() + STREAM_HEARTBEAT_INTERVAL
+                        yield ": keep-alive\n\n"
+                    continue
+                state = json.loads(message["data"])
+                if state["id"] not in pending:
+                    continue
+                yield f"data: {message['data']}\n\n"
+                if state["parse_status"] in FINAL_STATUSES:
+                    pending.discard(state["id"])
+        finally:
+            pubsub.close()
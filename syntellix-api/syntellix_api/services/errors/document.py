@@ -3,3 +3,7 @@ from syntellix_api.services.errors.base import BaseServiceError
 
 class DocumentIndexingError(BaseServiceError):
     pass
+
+
+class DocumentCancelledError(BaseServiceError):
+    pass
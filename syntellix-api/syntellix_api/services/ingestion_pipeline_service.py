@@ -0,0 +1,113 @@
+import logging
+import socket
+import time
+from typing import Any, Optional
+
+from syntellix_api.extensions.ext_redis import redis_client
+from syntellix_api.extensions.ext_storage import storage
+from syntellix_api.services.artifact_cache_service import ArtifactCacheService
+
+logger = logging.getLogger(__name__)
+
+PIPELINE_STAGES = ("parse", "contextualize", "embed")
+# what a stage hands to the next ones, in object storage until the document is processed
+HANDOFFS = ("chunks", "contexts")
+HANDOFF_KEY = "ingest/{}/{}.pkl.z"
+STATS_KEY = "ingest:pipeline:stats"
+STATS_FIELDS = ("tasks", "chunks", "busy_ms", "wait_ms")
+# the processed documents of a node, timed from the start of their first stage
+DOCUMENT_STAGE = "document"
+
+
+class IngestionPipeline:
+    """
+    The stages of a document processed in chained tasks, each on the worker
+    pool suited to it: parsing on the CPU workers of the ingestion queues,
+    contextualization on an I/O pool as LLM calls mostly wait, embedding and
+    indexing on workers keeping the embedding model loaded. A stage hands its
+    output to the next ones through object storage, and records per node its
+    chunks, busy time and time waited in its queue.
+    """
+
+    @staticmethod
+    def _handoff_key(document_id, name: str) -> str:
+        return HANDOFF_KEY.format(document_id, name)
+
+    @staticmethod
+    def save(document_id, name: str, value: Any) -> None:
+        storage.save(
+            IngestionPipeline._handoff_key(document_id, name),
+            ArtifactCacheService.serialize(name, value),
+        )
+
+    @staticmethod
+    def load(document_id, name: str) -> Any:
+        data = storage.load_once(IngestionPipeline._handoff_key(document_id, name))
+        return ArtifactCacheService.deserialize(data)
+
+    @staticmethod
+    def clear(document_id) -> None:
+        for name in HANDOFFS:
+            key = IngestionPipeline._handoff_key(document_id, name)
+            try:
+                if storage.exists(key):
+                    storage.delete(key)
+            except Exception as e:
+                logger.warning(f"Failed to delete the {name} of document {document_id}: {str(e)}")
+
+    @staticmethod
+    def record(
+        stage: str,
+        chunks: int,
+        started_at: float,
+        wait: Optional[float] = None,
+    ) -> None:
+        """
+        Record a stage of a document run on this node from `started_at`, a
+        timestamp, until now, after waiting `wait` seconds in its queue.
+        """
+        now = time.time()
+        prefix = f"{stage}:{socket.gethostname()}"
+        values = (1, chunks, (now - started_at) * 1000, (wait or 0) * 1000)
+        try:
+            pipe = redis_client.pipeline()
+            for field, value in zip(STATS_FIELDS, values):
+                if value:
+                    pipe.hincrby(STATS_KEY, f"{prefix}:{field}", int(value))
+            pipe.hsetnx(STATS_KEY, f"{prefix}:first_at", started_at)
+            pipe.hset(STATS_KEY, f"{prefix}:last_at", now)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to record ingestion pipeline stats: {str(e)}")
+
+    @staticmethod
+    def get_stats() -> dict[str, dict[str, dict]]:
+        """
+        Totals by stage and node since the stats were last reset, with the
+        chunks per busy second of the stage and the chunks per second of the
+        node from its first to its last task. The `document` stage times the
+        processed documents end to end, on the node of their last stage.
+        """
+        raw = redis_client.hgetall(STATS_KEY)
+        prefixes = {key.rsplit(":", 1)[0] for key in raw}
+        stats = {}
+        for prefix in sorted(prefixes):
+            stage, node = prefix.split(":", 1)
+            totals = {
+                field: int(raw.get(f"{prefix}:{field}", 0)) for field in STATS_FIELDS
+            }
+            busy = totals["busy_ms"] / 1000
+            elapsed = float(raw.get(f"{prefix}:last_at", 0)) - float(
+                raw.get(f"{prefix}:first_at", 0)
+            )
+            tasks = totals["tasks"] or 1
+            totals["avg_busy_ms"] = round(totals["busy_ms"] / tasks, 1)
+            totals["avg_wait_ms"] = round(totals["wait_ms"] / tasks, 1)
+            totals["chunks_per_busy_s"] = round(totals["chunks"] / busy, 2) if busy else None
+            totals["chunks_per_s"] = round(totals["chunks"] / elapsed, 2) if elapsed > 0 else None
+            stats.setdefault(stage, {})[node] = totals
+        return stats
+
+    @staticmethod
+    def reset_stats() -> None:
+        redis_client.delete(STATS_KEY)
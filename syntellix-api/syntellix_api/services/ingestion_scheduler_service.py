@@ -0,0 +1,384 @@
+import json
+import logging
+import time
+from typing import Optional
+
+from syntellix_api.configs import syntellix_config
+from syntellix_api.extensions.ext_redis import redis_client
+from syntellix_api.services.file_service import IMAGE_EXTENSIONS
+
+logger = logging.getLogger(__name__)
+
+QUEUES = ("small", "medium", "large")
+CELERY_QUEUE = "ingest_{}"
+
+# the dispatch arguments of a queued document: tenant, queue, cost and task args
+JOB_KEY = "ingest:job:{}"
+# queued documents of a tenant in a queue, by order of processing
+PENDING_KEY = "ingest:pending:{}:{}"
+# tenants with queued documents in a queue, by virtual start time of their next document
+TENANTS_KEY = "ingest:tenants:{}"
+# virtual finish time of the last document of every tenant in a queue, and the virtual clock
+FINISH_KEY = "ingest:finish:{}"
+CLOCK_FIELD = "clock"
+# dispatched documents of a tenant, and of a queue
+RUNNING_KEY = "ingest:running:{}"
+INFLIGHT_KEY = "ingest:inflight:{}"
+# dispatched documents by lease expiry, renewed by their progress, or by
+# handoff deadline while they wait in the queue of their next pipeline stage
+LEASES_KEY = "ingest:leases"
+CANCEL_KEY = "ingest:cancel:{}"
+LOCK_KEY = "ingest:lock"
+# seconds a scheduler operation waits for the lock
+LOCK_TIMEOUT = 10
+
+# documents parsed page by page with the OCR and layout models, and the bytes of one of their pages
+BYTES_PER_PAGE = {"pdf": 64 * 1024, "ppt": 128 * 1024, "pptx": 128 * 1024}
+# other documents count one page per TEXT_BYTES_PER_PAGE, at TEXT_PAGE_COST of a pdf page
+TEXT_BYTES_PER_PAGE = 4 * 1024
+TEXT_PAGE_COST = 0.2
+# parsers doing more than parsing and embedding, as a multiple of the cost of their pages
+PARSER_COST_WEIGHTS = {"picture": 2.0, "audio": 2.0, "knowledge_graph": 3.0}
+
+
+def _value(value):
+    return getattr(value, "value", value)
+
+
+class IngestionScheduler:
+    """
+    Documents to process wait in redis, in one of the `small`, `medium` and
+    `large` queues by estimated cost, and are handed to the Celery queue of
+    the same name when a slot of the queue is free. Within a queue, tenants
+    take turns by weighted fair queuing: the next document comes from the
+    tenant whose documents used the least worker time for their weight, as
+    long as the tenant is below its concurrency cap. Within a tenant,
+    documents go in upload order unless prioritized.
+    """
+
+    @staticmethod
+    def enabled() -> bool:
+        return syntellix_config.INDEXING_SCHEDULER_ENABLED
+
+    @staticmethod
+    def estimate_cost(extension: str, size: int, parser_type) -> float:
+        """
+        Estimated processing cost of a document, in pdf page equivalents.
+        """
+        extension = (extension or "").lower()
+        if extension in IMAGE_EXTENSIONS:
+            cost = 1.0
+        elif extension in BYTES_PER_PAGE:
+            cost = max(1.0, (size or 0) / BYTES_PER_PAGE[extension])
+        else:
+            cost = max(1.0, (size or 0) / TEXT_BYTES_PER_PAGE) * TEXT_PAGE_COST
+        return cost * PARSER_COST_WEIGHTS.get(_value(parser_type), 1.0)
+
+    @staticmethod
+    def queue_for(cost: float) -> str:
+        if cost >= syntellix_config.INDEXING_SCHEDULER_LARGE_COST:
+            return "large"
+        if cost >= syntellix_config.INDEXING_SCHEDULER_MEDIUM_COST:
+            return "medium"
+        return "small"
+
+    @staticmethod
+    def _weight(tenant_id) -> float:
+        weight = syntellix_config.INDEXING_SCHEDULER_TENANT_WEIGHTS.get(str(tenant_id), 1.0)
+        return weight if weight > 0 else 1.0
+
+    @staticmethod
+    def _lock():
+        return redis_client.lock(LOCK_KEY, timeout=LOCK_TIMEOUT, blocking_timeout=LOCK_TIMEOUT)
+
+    @staticmethod
+    def enqueue(document, task_args: list) -> str:
+        """
+        Queue a document, `task_args` being the arguments of its processing
+        task, and dispatch what the free slots allow. Returns the queue.
+        """
+        cost = IngestionScheduler.estimate_cost(
+            document.extension, document.size, document.parser_type
+        )
+        queue = IngestionScheduler.queue_for(cost)
+        tenant_id = str(document.tenant_id)
+        job = {
+            "tenant_id": tenant_id,
+            "knowledge_base_id": document.knowledge_base_id,
+            "queue": queue,
+            "cost": cost,
+            "enqueued_at": time.time(),
+            "args": json.dumps(task_args, default=_value),
+        }
+        with IngestionScheduler._lock():
+            pipe = redis_client.pipeline()
+            pipe.delete(CANCEL_KEY.format(document.id))
+            pipe.hset(JOB_KEY.format(document.id), mapping=job)
+            pipe.zadd(PENDING_KEY.format(queue, tenant_id), {document.id: job["enqueued_at"]})
+            pipe.execute()
+            IngestionScheduler._activate(queue, tenant_id)
+        logger.info(f"Document {document.id} queued in {queue}, estimated cost {cost:.1f}")
+        IngestionScheduler.dispatch(queue)
+        return queue
+
+    @staticmethod
+    def _activate(queue: str, tenant_id: str) -> None:
+        # a tenant without queued documents joins at the virtual clock, so
+        # that the time it was idle is not credited to it
+        if redis_client.zscore(TENANTS_KEY.format(queue), tenant_id) is not None:
+            return
+        finish, clock = redis_client.hmget(FINISH_KEY.format(queue), tenant_id, CLOCK_FIELD)
+        start = max(float(finish or 0), float(clock or 0))
+        redis_client.zadd(TENANTS_KEY.format(queue), {tenant_id: start})
+
+    @staticmethod
+    def dispatch(queue: Optional[str] = None) -> int:
+        """
+        Hand queued documents to the workers while their queue has free slots,
+        of every queue when `queue` is None. Returns the documents dispatched.
+        """
+        dispatched = 0
+        for name in [queue] if queue else QUEUES:
+            with IngestionScheduler._lock():
+                jobs = IngestionScheduler._take(name)
+            for document_id, job in jobs:
+                IngestionScheduler._send(document_id, job)
+            dispatched += len(jobs)
+        return dispatched
+
+    @staticmethod
+    def _take(queue: str) -> list:
+        slots = syntellix_config.INDEXING_SCHEDULER_QUEUE_SLOTS.get(queue, 1)
+        free = slots - redis_client.scard(INFLIGHT_KEY.format(queue))
+        cap = syntellix_config.INDEXING_SCHEDULER_TENANT_CONCURRENCY
+        jobs = []
+        while free > 0:
+            tenants = redis_client.zrange(TENANTS_KEY.format(queue), 0, -1, withscores=True)
+            tenant_id, start = next(
+                (
+                    (tenant_id, start)
+                    for tenant_id, start in tenants
+                    if redis_client.scard(RUNNING_KEY.format(tenant_id)) < cap
+                ),
+                (None, None),
+            )
+            if tenant_id is None:
+                break
+            pending_key = PENDING_KEY.format(queue, tenant_id)
+            popped = redis_client.zpopmin(pending_key)
+            if not popped:
+                redis_client.zrem(TENANTS_KEY.format(queue), tenant_id)
+                continue
+            document_id = popped[0][0]
+            job = redis_client.hgetall(JOB_KEY.format(document_id))
+            if not job:
+                continue
+
+            finish = start + float(job["cost"]) / IngestionScheduler._weight(tenant_id)
+            pipe = redis_client.pipeline()
+            pipe.hset(FINISH_KEY.format(queue), mapping={tenant_id: finish, CLOCK_FIELD: start})
+            if redis_client.zcard(pending_key):
+                pipe.zadd(TENANTS_KEY.format(queue), {tenant_id: finish})
+            else:
+                pipe.zrem(TENANTS_KEY.format(queue), tenant_id)
+            pipe.sadd(RUNNING_KEY.format(tenant_id), document_id)
+            pipe.sadd(INFLIGHT_KEY.format(queue), document_id)
+            pipe.zadd(LEASES_KEY, {document_id: time.time() + syntellix_config.INDEXING_SCHEDULER_LEASE})
+            pipe.hset(JOB_KEY.format(document_id), "dispatched_at", time.time())
+            pipe.execute()
+            jobs.append((document_id, job))
+            free -= 1
+        return jobs
+
+    @staticmethod
+    def _send(document_id: str, job: dict) -> None:
+        from syntellix_api.tasks.document_processing import process_document
+
+        try:
+            process_document.apply_async(
+                json.loads(job["args"]), queue=CELERY_QUEUE.format(job["queue"])
+            )
+            logger.info(
+                f"Document {document_id} of tenant {job['tenant_id']} dispatched to {job['queue']}"
+                f" after {time.time() - float(job['enqueued_at']):.1f}s"
+            )
+        except Exception as e:
+            logger.error(f"Failed to send Celery task for document {document_id}: {str(e)}")
+            IngestionScheduler.finish(document_id, dispatch=False)
+
+    @staticmethod
+    def start(document_id) -> Optional[float]:
+        """
+        Seconds a dispatched document waited in the queues, None if it was not
+        queued by the scheduler.
+        """
+        enqueued_at = redis_client.hget(JOB_KEY.format(document_id), "enqueued_at")
+        if enqueued_at is None:
+            return None
+        return max(0.0, time.time() - float(enqueued_at))
+
+    @staticmethod
+    def heartbeat(document_id) -> bool:
+        """
+        Renew the lease of a document being processed, returns whether it was
+        cancelled.
+        """
+        try:
+            pipe = redis_client.pipeline()
+            pipe.zadd(
+                LEASES_KEY,
+                {document_id: time.time() + syntellix_config.INDEXING_SCHEDULER_LEASE},
+                xx=True,
+            )
+            pipe.exists(CANCEL_KEY.format(document_id))
+            return bool(pipe.execute()[1])
+        except Exception as e:
+            logger.warning(f"Failed to renew the lease of document {document_id}: {str(e)}")
+            return False
+
+    @staticmethod
+    def release_slot(document_id) -> None:
+        """
+        Give back the queue slot of a parsed document whose other stages run
+        on other workers. It stays among the running documents of its tenant
+        until `finish`, see `hand_off`.
+        """
+        queue = redis_client.hget(JOB_KEY.format(document_id), "queue")
+        if queue is None:
+            return
+        redis_client.srem(INFLIGHT_KEY.format(queue), document_id)
+        IngestionScheduler.hand_off(document_id)
+        IngestionScheduler.dispatch(queue)
+
+    @staticmethod
+    def hand_off(document_id) -> None:
+        """
+        Replace the lease of a document handed to the queue of its next stage,
+        where it may wait longer than a lease without progress, by the handoff
+        deadline. A stage lost on its way is given back by `expire_leases`.
+        """
+        redis_client.zadd(
+            LEASES_KEY,
+            {document_id: time.time() + syntellix_config.INDEXING_SCHEDULER_HANDOFF_TIMEOUT},
+            xx=True,
+        )
+
+    @staticmethod
+    def resume_lease(document_id) -> None:
+        """
+        Start the lease of a document again when its next stage starts, unless
+        its handoff deadline passed and its slot was given back.
+        """
+        redis_client.zadd(
+            LEASES_KEY,
+            {document_id: time.time() + syntellix_config.INDEXING_SCHEDULER_LEASE},
+            xx=True,
+        )
+
+    @staticmethod
+    def finish(document_id, dispatch: bool = True) -> None:
+        """
+        Give back the slot of a processed document and dispatch the next ones,
+        of every queue as its tenant may have been at its concurrency cap.
+        """
+        job = redis_client.hgetall(JOB_KEY.format(document_id))
+        if not job:
+            redis_client.delete(CANCEL_KEY.format(document_id))
+            return
+        pipe = redis_client.pipeline()
+        pipe.srem(RUNNING_KEY.format(job["tenant_id"]), document_id)
+        pipe.srem(INFLIGHT_KEY.format(job["queue"]), document_id)
+        pipe.zrem(LEASES_KEY, document_id)
+        pipe.delete(JOB_KEY.format(document_id), CANCEL_KEY.format(document_id))
+        pipe.execute()
+        if dispatch:
+            IngestionScheduler.dispatch()
+
+    @staticmethod
+    def expire_leases() -> list:
+        """
+        Give back the slots of dispatched documents without progress for
+        longer than the lease, or still waiting for their next stage at their
+        handoff deadline, returns their ids.
+        """
+        expired = redis_client.zrangebyscore(LEASES_KEY, 0, time.time())
+        for document_id in expired:
+            logger.warning(f"Lease of document {document_id} expired, giving back its slot")
+            IngestionScheduler.finish(document_id, dispatch=False)
+        return expired
+
+    @staticmethod
+    def cancel(document_id) -> str:
+        """
+        Cancel a document: a queued one leaves its queue, a dispatched one is
+        flagged and stops at its next progress update. Returns `pending` or
+        `running`, documents the scheduler did not queue count as running.
+        """
+        with IngestionScheduler._lock():
+            job = redis_client.hgetall(JOB_KEY.format(document_id))
+            if not job or "dispatched_at" in job:
+                redis_client.set(
+                    CANCEL_KEY.format(document_id),
+                    1,
+                    ex=syntellix_config.INDEXING_SCHEDULER_LEASE,
+                )
+                return "running"
+            pending_key = PENDING_KEY.format(job["queue"], job["tenant_id"])
+            pipe = redis_client.pipeline()
+            pipe.zrem(pending_key, document_id)
+            pipe.delete(JOB_KEY.format(document_id))
+            pipe.execute()
+            if not redis_client.zcard(pending_key):
+                redis_client.zrem(TENANTS_KEY.format(job["queue"]), job["tenant_id"])
+        return "pending"
+
+    @staticmethod
+    def prioritize(document_id) -> bool:
+        """
+        Move a queued document to the front of the documents of its tenant.
+        Returns False if it is not queued.
+        """
+        with IngestionScheduler._lock():
+            job = redis_client.hgetall(JOB_KEY.format(document_id))
+            if not job or "dispatched_at" in job:
+                return False
+            pending_key = PENDING_KEY.format(job["queue"], job["tenant_id"])
+            first = redis_client.zrange(pending_key, 0, 0, withscores=True)
+            score = first[0][1] - 1 if first else 0
+            redis_client.zadd(pending_key, {document_id: score}, xx=True)
+        return True
+
+    @staticmethod
+    def queue_status(document_ids: list) -> dict[int, dict]:
+        """
+        The queue, position among the queued documents of its tenant and
+        seconds waited of every queued document, by document id.
+        """
+        if not document_ids:
+            return {}
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            for document_id in document_ids:
+                pipe.hmget(JOB_KEY.format(document_id), "tenant_id", "queue", "enqueued_at", "dispatched_at")
+            jobs = pipe.execute()
+            queued = [
+                (document_id, job)
+                for document_id, job in zip(document_ids, jobs)
+                if job[0] is not None and job[3] is None
+            ]
+            for document_id, (tenant_id, queue, _, _) in queued:
+                pipe.zrank(PENDING_KEY.format(queue, tenant_id), document_id)
+            ranks = pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to load the queue status: {str(e)}")
+            return {}
+        now = time.time()
+        return {
+            document_id: {
+                "queue": queue,
+                "queue_position": rank + 1,
+                "queue_wait": round(now - float(enqueued_at), 1),
+            }
+            for (document_id, (_, queue, enqueued_at, _)), rank in zip(queued, ranks)
+            if rank is not None
+        }
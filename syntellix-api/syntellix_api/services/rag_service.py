@@ -1,49 +1,215 @@
+import logging
+from timeit import default_timer as timer
 from typing import Any, Generator, List, Tuple
 
 from syntellix_api.configs import syntellix_config
+from syntellix_api.extensions.ext_redis import redis_client
 from syntellix_api.llm.llm_factory import LLMFactory
 from syntellix_api.llm.prompts import rag_prompt
 from syntellix_api.rag.llm.embedding_model_local import EmbeddingModel
 from syntellix_api.rag.llm.rerank_model_local import RerankModel
 from syntellix_api.rag.vector_database.vector_service import VectorService
 from syntellix_api.services.agent_service import AgentService
+from syntellix_api.services.retrieval_stats_service import RetrievalStatsService
+
+logger = logging.getLogger(__name__)
+
+INDEX_SIZE_KEY = "retrieval:index_size:{}:{}"
+# seconds the chunk count of a set of knowledge bases is cached for
+INDEX_SIZE_TTL = 600
 
 
 class RAGService:
     @staticmethod
     def retrieve_relevant_documents(tenant_id: int, agent_id: int, message: str) -> str:
+        return RAGService._retrieve(tenant_id, agent_id, [message])[0]
+
+    @staticmethod
+    def retrieve_batch(
+        tenant_id: int, agent_id: int, messages: List[str]
+    ) -> List[Tuple[List, str]]:
+        """
+        `retrieve_relevant_documents` for many messages at once, for evaluation
+        runs and query expansion: the messages are embedded together, searched
+        with one multi search and their chunks reranked in shared batches.
+        """
+        return RAGService._retrieve(tenant_id, agent_id, messages, batch=True)
+
+    @staticmethod
+    def _retrieve(
+        tenant_id: int, agent_id: int, messages: List[str], batch: bool = False
+    ) -> List[Tuple[List, str]]:
+        if not messages:
+            return []
         agent = AgentService.get_agent_by_id(agent_id, tenant_id)
+        advanced_config = agent.advanced_config or {}
+        settings = RAGService._retrieval_settings(advanced_config)
+        top_n = advanced_config.get("top_n", 5)
+
         embedding_model = EmbeddingModel(
             model_name=syntellix_config.EMBEDDING_MODEL_NAME
         )
-        user_message_embedding = embedding_model.encode([message])[0].tolist()
+        message_embeddings = embedding_model.encode(messages)
 
         agent_knowledge_base_ids = AgentService.get_agent_knowledge_base_ids(agent_id)
+        query_settings = {
+            "similarity_top_k": top_n,
+            "timeout_ms": settings["recall_timeout_ms"],
+        }
+        if settings["retrieval_mode"] == "two_stage":
+            recall_k = RAGService._recall_k(settings, top_n)
+            query_settings["recall_k"] = recall_k
+            query_settings["num_candidates"] = settings.get(
+                "num_candidates"
+            ) or RAGService._num_candidates(
+                tenant_id, agent_knowledge_base_ids, recall_k, settings
+            )
+
         vector_service = VectorService(tenant_id)
-        nodes, _, _ = vector_service.query(
-            query={
-                "query_str": message,
-                "query_embedding": user_message_embedding,
-                "similarity_top_k": agent.advanced_config.get("top_n", 5),
-            },
+        search_stats = []
+        st = timer()
+        results = vector_service.query_batch(
+            [
+                {
+                    "query_str": message,
+                    "query_embedding": embedding.tolist(),
+                    **query_settings,
+                }
+                for message, embedding in zip(messages, message_embeddings)
+            ],
             es_filter=[
                 {"terms": {"metadata.knowledge_base_id": agent_knowledge_base_ids}}
             ],
+            stats=search_stats,
         )
+        recall_ms = (timer() - st) * 1000
 
         rerank_model = RerankModel(model_name=syntellix_config.RERANK_MODEL_NAME)
-        rerank_nodes_scores = rerank_model.similarity_batch(
-            message, [node.content for node in nodes]
+        # loading the model is not part of the reranking cost
+        rerank_model.initialize_model()
+        st = timer()
+        scores = rerank_model.similarity_pairs(
+            [
+                (message, node.content)
+                for message, (nodes, _, _) in zip(messages, results)
+                for node in nodes
+            ]
+        )
+        rerank_ms = (timer() - st) * 1000
+
+        similarity_threshold = advanced_config.get("similarity_threshold", 0.5)
+        retrieved = []
+        recall_hits, kept_count, promoted = 0, 0, 0
+        offset = 0
+        for nodes, _, _ in results:
+            node_scores = scores[offset : offset + len(nodes)]
+            offset += len(nodes)
+            # first stage rank of every chunk, to tell the ones reranking promoted
+            ranked = sorted(
+                zip(node_scores, range(len(nodes)), nodes),
+                key=lambda x: x[0],
+                reverse=True,
+            )
+            kept = [
+                (rank, node)
+                for score, rank, node in ranked
+                if score >= similarity_threshold
+            ][:top_n]
+            filtered_nodes = [node for _, node in kept]
+            retrieved.append((filtered_nodes, RAGService._format_context(filtered_nodes)))
+
+            recall_hits += len(nodes)
+            kept_count += len(kept)
+            promoted += sum(1 for rank, _ in kept if rank >= top_n)
+
+        RetrievalStatsService.record(
+            # batches amortize both stages, they are kept apart from single queries
+            mode=f"{settings['retrieval_mode']}_batch" if batch else settings["retrieval_mode"],
+            recall_ms=recall_ms,
+            recall_hits=recall_hits,
+            recall_timeouts=sum(1 for item in search_stats if item["timed_out"]),
+            rerank_ms=rerank_ms,
+            kept=kept_count,
+            promoted=promoted,
+            queries=len(messages),
+            update_rerank_cost=not batch,
+        )
+        logger.debug(
+            f"Retrieval of agent {agent_id}: {len(messages)} queries, {recall_hits} chunks"
+            f" in {recall_ms:.0f}ms, reranked in {rerank_ms:.0f}ms, {kept_count} kept"
+        )
+
+        return retrieved
+
+    @staticmethod
+    def _retrieval_settings(advanced_config: dict) -> dict:
+        settings = {
+            "retrieval_mode": syntellix_config.RETRIEVAL_MODE,
+            "recall_k": syntellix_config.RETRIEVAL_RECALL_K,
+            "num_candidates_factor": syntellix_config.RETRIEVAL_NUM_CANDIDATES_FACTOR,
+            "num_candidates_ratio": syntellix_config.RETRIEVAL_NUM_CANDIDATES_RATIO,
+            "max_num_candidates": syntellix_config.RETRIEVAL_MAX_NUM_CANDIDATES,
+            "recall_timeout_ms": syntellix_config.RETRIEVAL_RECALL_TIMEOUT_MS,
+            "rerank_budget_ms": syntellix_config.RETRIEVAL_RERANK_BUDGET_MS,
+            "num_candidates": None,
+        }
+        settings.update(
+            (name, advanced_config[name])
+            for name in settings
+            if advanced_config.get(name) is not None
         )
+        return settings
 
-        similarity_threshold = agent.advanced_config.get("similarity_threshold", 0.5)
-        filtered_nodes = [
-            node
-            for score, node in zip(rerank_nodes_scores, nodes)
-            if score >= similarity_threshold
-        ]
+    @staticmethod
+    def _recall_k(settings: dict, top_n: int) -> int:
+        """
+        Size of the first stage recall set, cut to the chunks the reranker
+        scores within its budget at its recent throughput.
+        """
+        recall_k = max(settings["recall_k"], top_n)
+        rerank_cost = RetrievalStatsService.rerank_cost()
+        if settings["rerank_budget_ms"] and rerank_cost:
+            recall_k = min(
+                recall_k, max(top_n, int(settings["rerank_budget_ms"] / rerank_cost))
+            )
+        return recall_k
+
+    @staticmethod
+    def _num_candidates(
+        tenant_id: int, knowledge_base_ids: List, recall_k: int, settings: dict
+    ) -> int:
+        """
+        kNN candidates of the first stage, growing with the chunks of the
+        searched knowledge bases so that recall holds as they grow.
+        """
+        index_size = RAGService._index_size(tenant_id, knowledge_base_ids)
+        num_candidates = max(
+            recall_k * settings["num_candidates_factor"],
+            int(index_size * settings["num_candidates_ratio"]),
+        )
+        return max(recall_k, min(num_candidates, settings["max_num_candidates"]))
 
-        return filtered_nodes, RAGService._format_context(filtered_nodes)
+    @staticmethod
+    def _index_size(tenant_id: int, knowledge_base_ids: List) -> int:
+        key = INDEX_SIZE_KEY.format(
+            tenant_id, ",".join(sorted(str(kb_id) for kb_id in knowledge_base_ids))
+        )
+        try:
+            cached = redis_client.get(key)
+            if cached is not None:
+                return int(cached)
+        except Exception as e:
+            logger.warning(f"Failed to load the index size: {str(e)}")
+        try:
+            size = VectorService(tenant_id).count(knowledge_base_ids)
+        except Exception as e:
+            logger.warning(f"Failed to count the chunks of tenant {tenant_id}: {str(e)}")
+            return 0
+        try:
+            redis_client.setex(key, INDEX_SIZE_TTL, size)
+        except Exception as e:
+            logger.warning(f"Failed to cache the index size: {str(e)}")
+        return size
 
     @staticmethod
     def _format_context(nodes: List) -> str:
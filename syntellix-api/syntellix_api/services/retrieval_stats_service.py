@@ -0,0 +1,107 @@
+import logging
+from typing import Optional
+
+from syntellix_api.extensions.ext_redis import redis_client
+
+logger = logging.getLogger(__name__)
+
+STATS_KEY = "retrieval:stats"
+STATS_FIELDS = (
+    "queries",
+    "recall_ms",
+    "recall_hits",
+    "recall_timeouts",
+    "rerank_ms",
+    "rerank_pairs",
+    "kept",
+    "promoted",
+)
+# moving average of the reranking cost, for the rerank budget
+RERANK_COST_FIELD = "rerank_ms_per_pair"
+# weight of the latest query in the moving average
+RERANK_COST_ALPHA = 0.2
+
+
+class RetrievalStatsService:
+    """
+    Totals of the retrieval stages by mode, batches apart, since the stats
+    were last reset: the latency and hits of the first stage search and the
+    latency and pairs of reranking. Without relevance labels, `promoted`, the
+    kept chunks the first stage ranked below `top_n`, measures what a wider
+    recall set adds.
+    """
+
+    @staticmethod
+    def record(
+        mode: str,
+        recall_ms: float,
+        recall_hits: int,
+        recall_timeouts: int,
+        rerank_ms: float,
+        kept: int,
+        promoted: int,
+        queries: int = 1,
+        update_rerank_cost: bool = True,
+    ) -> None:
+        values = (
+            queries,
+            recall_ms,
+            recall_hits,
+            recall_timeouts,
+            rerank_ms,
+            recall_hits,
+            kept,
+            promoted,
+        )
+        try:
+            pipe = redis_client.pipeline()
+            for field, value in zip(STATS_FIELDS, values):
+                if value:
+                    pipe.hincrby(STATS_KEY, f"{mode}:{field}", int(value))
+            pipe.execute()
+            if update_rerank_cost and recall_hits and rerank_ms:
+                RetrievalStatsService._update_rerank_cost(rerank_ms / recall_hits)
+        except Exception as e:
+            logger.warning(f"Failed to record retrieval stats: {str(e)}")
+
+    @staticmethod
+    def _update_rerank_cost(ms_per_pair: float) -> None:
+        current = redis_client.hget(STATS_KEY, RERANK_COST_FIELD)
+        if current is not None:
+            ms_per_pair = (
+                RERANK_COST_ALPHA * ms_per_pair
+                + (1 - RERANK_COST_ALPHA) * float(current)
+            )
+        redis_client.hset(STATS_KEY, RERANK_COST_FIELD, ms_per_pair)
+
+    @staticmethod
+    def rerank_cost() -> Optional[float]:
+        """
+        Milliseconds per query and chunk pair of recent rerankings, None
+        before the first one.
+        """
+        try:
+            value = redis_client.hget(STATS_KEY, RERANK_COST_FIELD)
+        except Exception as e:
+            logger.warning(f"Failed to load the rerank cost: {str(e)}")
+            return None
+        return float(value) if value is not None else None
+
+    @staticmethod
+    def get_stats() -> dict[str, dict]:
+        raw = redis_client.hgetall(STATS_KEY)
+        modes = {key.split(":", 1)[0] for key in raw if ":" in key}
+        stats = {}
+        for mode in sorted(modes):
+            totals = {
+                field: int(raw.get(f"{mode}:{field}", 0)) for field in STATS_FIELDS
+            }
+            queries = totals["queries"] or 1
+            totals["avg_recall_ms"] = round(totals["recall_ms"] / queries, 1)
+            totals["avg_rerank_ms"] = round(totals["rerank_ms"] / queries, 1)
+            stats[mode] = totals
+        return stats
+
+    @staticmethod
+    def reset_stats() -> None:
+        redis_client.delete(STATS_KEY)
@@ -0,0 +1,43 @@
+import logging
+
+from syntellix_api.extensions.ext_redis import redis_client
+
+logger = logging.getLogger(__name__)
+
+STATS_KEY = "vector_gc:stats"
+STATS_FIELDS = ("jobs", "deleted_docs", "reclaimed_bytes", "deleted_images")
+
+
+class VectorGCService:
+    """
+    Totals of the chunks and images purged by the vector GC tasks, since the
+    stats were last reset. Reclaimed bytes are exact for dropped knowledge
+    base indices and estimated from the average chunk size otherwise.
+    """
+
+    @staticmethod
+    def record(
+        jobs: int = 0,
+        deleted_docs: int = 0,
+        reclaimed_bytes: int = 0,
+        deleted_images: int = 0,
+    ) -> None:
+        try:
+            pipe = redis_client.pipeline()
+            for field, value in zip(
+                STATS_FIELDS, (jobs, deleted_docs, reclaimed_bytes, deleted_images)
+            ):
+                if value:
+                    pipe.hincrby(STATS_KEY, field, int(value))
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to record vector GC stats: {str(e)}")
+
+    @staticmethod
+    def get_stats() -> dict[str, int]:
+        raw = redis_client.hgetall(STATS_KEY)
+        return {field: int(raw.get(field, 0)) for field in STATS_FIELDS}
+
+    @staticmethod
+    def reset_stats() -> None:
+        redis_client.delete(STATS_KEY)
@@ -1 +1,6 @@
-from syntellix_api.tasks import chat_tasks, document_processing
+from syntellix_api.tasks import (
+    chat_tasks,
+    document_processing,
+    ingestion_scheduler,
+    vector_gc,
+)
@@ -1,5 +1,9 @@
+import hashlib
 import logging
+import threading
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from io import BytesIO
 
@@ -11,6 +15,7 @@ from syntellix_api.models.dataset_model import (
     Document,
     DocumentParserTypeEnum,
     DocumentParseStatusEnum,
+    UploadFile,
 )
 from syntellix_api.rag.app import (
     audio,
@@ -29,13 +34,28 @@ from syntellix_api.rag.app import (
     table,
 )
 from syntellix_api.rag.ext.contextual_rag import situate_context
+from syntellix_api.rag.nlp import rag_tokenizer
 from syntellix_api.rag.llm.embedding_model_local import EmbeddingModel
+from syntellix_api.rag.utils.memory_utils import peak_rss, reset_peak_rss
 from syntellix_api.rag.vector_database.vector_model import BaseNode
 from syntellix_api.rag.vector_database.vector_service import VectorService
+from syntellix_api.services.artifact_cache_service import ArtifactCacheService
+from syntellix_api.services.document_progress_service import ProgressReporter
+from syntellix_api.services.errors.document import DocumentCancelledError
 from syntellix_api.services.file_service import FileService
+from syntellix_api.services.ingestion_pipeline_service import (
+    DOCUMENT_STAGE,
+    IngestionPipeline,
+)
+from syntellix_api.services.ingestion_scheduler_service import IngestionScheduler
+from syntellix_api.tasks.vector_gc import delete_document_vectors
 
 logger = logging.getLogger(__name__)
 
+# loaded once per worker process, see get_embedding_model
+_embedding_model = None
+_embedding_model_lock = threading.Lock()
+
 FACTORY = {
     DocumentParserTypeEnum.NAIVE.value: naive,
     DocumentParserTypeEnum.PAPER.value: paper,
@@ -54,126 +74,369 @@ FACTORY = {
 }
 
 
+def add_tokens(nodes, chunks, contexts):
+    """
+    Keep the tokens the parsers computed for every chunk and tokenize the
+    contextualized content the same way, for pre-tokenized indices.
+    """
+    missing = [i for i, chunk in enumerate(chunks) if not chunk.get("content_ltks")]
+    computed = dict(
+        zip(
+            missing,
+            rag_tokenizer.tokenize_batch(
+                [chunks[i]["content_with_weight"] for i in missing], fine_grained=True
+            ),
+        )
+    )
+    context_tks = rag_tokenizer.tokenize_batch(contexts)
+    for i, (node, chunk) in enumerate(zip(nodes, chunks)):
+        ltks, sm_ltks = computed.get(
+            i, (chunk.get("content_ltks"), chunk.get("content_sm_ltks"))
+        )
+        node.tokens = {
+            "content_ltks": ltks,
+            "content_sm_ltks": sm_ltks or ltks,
+            "contextualized_ltks": context_tks[i],
+        }
+
+
+def get_embedding_model() -> EmbeddingModel:
+    """
+    The embedding model of the worker process, loaded by its first document
+    and kept for the next ones.
+    """
+    global _embedding_model
+    if _embedding_model is None:
+        with _embedding_model_lock:
+            if _embedding_model is None:
+                _embedding_model = EmbeddingModel(
+                    model_name=syntellix_config.EMBEDDING_MODEL_NAME
+                )
+    return _embedding_model
+
+
+def parse_chunks(document, file_key, parser_type, parser_config, update_progress):
+    """
+    The chunks of a document, from the artifact cache or parsed, and the
+    artifact keys of its file.
+    """
+    file_binary = FileService.read_file_binary(file_key)
+
+    upload_file = UploadFile.query.get(document.upload_file_id)
+    file_hash = (upload_file.hash if upload_file else None) or hashlib.sha3_256(
+        file_binary
+    ).hexdigest()
+    artifact_keys = ArtifactCacheService.stage_keys(
+        file_hash, getattr(parser_type, "value", parser_type), parser_config
+    )
+
+    chunks = ArtifactCacheService.load("chunks", artifact_keys["chunks"])
+    if chunks is None:
+        reset_peak_rss()
+        chunks = FACTORY[parser_type].chunk(
+            document.name,
+            binary=file_binary,
+            from_page=0,
+            to_page=100000,
+            parser_config=parser_config,
+            callback=update_progress,
+        )
+        logger.info(
+            f"Document {document.id} parsed, peak RSS: {peak_rss() / 1024 / 1024:.1f} MB"
+        )
+        if chunks:
+            ArtifactCacheService.save("chunks", artifact_keys["chunks"], chunks)
+    return chunks, artifact_keys
+
+
+def contextualize_chunks(chunks, artifact_keys, update_progress):
+    """
+    The context of every chunk within the whole document, requested from the
+    LLM for several chunks at once.
+    """
+    contexts = ArtifactCacheService.load("contexts", artifact_keys["contexts"])
+    if contexts is not None:
+        return contexts
+
+    # Collect all text content first
+    all_text_content = "\n".join([chunk["content_with_weight"] for chunk in chunks])
+    total_chunks = len(chunks)
+    contexts = []
+    executor = ThreadPoolExecutor(
+        max_workers=syntellix_config.INDEXING_PIPELINE_CONTEXT_CONCURRENCY
+    )
+    try:
+        results = executor.map(
+            lambda chunk: situate_context(all_text_content, chunk["content_with_weight"]),
+            chunks,
+        )
+        for i, contextualized_content in enumerate(results, 1):
+            contexts.append(contextualized_content)
+            update_progress(0.3 + (i / total_chunks) * 0.3, f"上下文生成进度: {i}/{total_chunks}")
+    finally:
+        # a cancelled document does not wait for the requests not sent yet
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    ArtifactCacheService.save("contexts", artifact_keys["contexts"], contexts)
+    return contexts
+
+
+def embed_chunks(chunks, contexts, artifact_keys, update_progress):
+    """
+    The embeddings of the chunks with their contexts, computed in batches.
+    """
+    vectors = ArtifactCacheService.load("embeddings", artifact_keys["embeddings"])
+    if vectors is not None:
+        return vectors
+
+    embedding_model = get_embedding_model()
+    batch_size = syntellix_config.INDEXING_PIPELINE_EMBED_BATCH_SIZE
+    total_chunks = len(chunks)
+    vectors = []
+    for start in range(0, total_chunks, batch_size):
+        batch = range(start, min(start + batch_size, total_chunks))
+        vectors.extend(
+            embedding_model.encode(
+                [f"{chunks[i]['content_with_weight']}\n\n{contexts[i]}" for i in batch]
+            )
+        )
+        update_progress(
+            0.6 + (len(vectors) / total_chunks) * 0.3,
+            f"嵌入进度: {len(vectors)}/{total_chunks}",
+        )
+
+    ArtifactCacheService.save("embeddings", artifact_keys["embeddings"], vectors)
+    return vectors
+
+
+def index_chunks(
+    document, chunks, contexts, vectors, tenant_id, knowledge_base_id, update_progress
+):
+    """
+    Save the chunk images and add the chunks to the vector database.
+    """
+    nodes = []
+    for chunk, contextualized_content, vector in zip(chunks, contexts, vectors):
+        node = BaseNode(
+            content=chunk["content_with_weight"],
+            contextualized_content=contextualized_content,
+            embedding=vector,
+            metadata={
+                "file_name": document.name,
+                "document_id": document.id,
+                "knowledge_base_id": knowledge_base_id,
+                "image_id": "",
+                "created_at": datetime.now(),
+            },
+        )
+
+        if chunk.get("image"):
+            try:
+                output_buffer = BytesIO()
+                if isinstance(chunk["image"], bytes):
+                    output_buffer.write(chunk["image"])
+                else:
+                    chunk["image"].save(output_buffer, format="JPEG")
+                output_buffer.seek(0)
+
+                img_id = f"{knowledge_base_id}-{document.id}-{node.node_id}"
+                image_filename = f"images/{tenant_id}/{img_id}.jpg"
+                storage.save(image_filename, output_buffer.getvalue())
+
+                node.metadata["image_id"] = img_id
+                logger.info(f"Image saved: {image_filename}")
+            except Exception as e:
+                logger.error(traceback.format_exc())
+
+        nodes.append(node)
+
+    if syntellix_config.ELASTICSEARCH_TEXT_ANALYSIS == "pretokenized":
+        add_tokens(nodes, chunks, contexts)
+
+    update_progress.stage(0.9, "文件嵌入完成，开始保存嵌入数据")
+
+    vector_service = VectorService(tenant_id)
+    # Add nodes to vector database
+    vector_service.add_nodes(nodes)
+
+    update_progress.stage(
+        1.0,
+        "处理完成",
+        DocumentParseStatusEnum.COMPLETED,
+        chunk_num=len(chunks),
+        process_duation=(datetime.now() - document.process_begin_at).total_seconds(),
+    )
+
+
+def handle_failure(e, document_id, tenant_id, knowledge_base_id, update_progress):
+    db.session.rollback()
+    if isinstance(e, DocumentCancelledError):
+        logger.info(f"Document {document_id} cancelled")
+        if update_progress:
+            update_progress.stage(None, "已取消", DocumentParseStatusEnum.FAILED)
+        # chunks may have been indexed before the cancellation was noticed
+        delete_document_vectors.delay(tenant_id, knowledge_base_id, [document_id])
+        return
+    logger.error(f"Error processing document {document_id}: {str(e)}")
+    logger.error(traceback.format_exc())
+    if update_progress:
+        update_progress.stage(
+            -1, f"Processing failed: {str(e)}", DocumentParseStatusEnum.FAILED
+        )
+
+
+def end_processing(document_id):
+    try:
+        IngestionScheduler.finish(document_id)
+    except Exception as e:
+        logger.error(f"Failed to release the slot of document {document_id}: {str(e)}")
+    if syntellix_config.INDEXING_PIPELINE_ENABLED:
+        IngestionPipeline.clear(document_id)
+
+
 @shared_task
 def process_document(
     document_id, file_key, parser_type, parser_config, tenant_id, knowledge_base_id
 ):
+    """
+    Parse a document, then contextualize, embed and index its chunks in the
+    same task or, with the pipeline enabled, hand them to the next stage.
+    """
+    update_progress = None
+    handed_off = False
     try:
         document = Document.query.get(document_id)
         if not document:
             logger.error(f"Document not found: {document_id}")
             return
 
-        def update_progress(progress, message):
-            document.progress = int(progress * 100)
-            document.progress_msg = message
-            db.session.commit()
-            logger.info(
-                f"Document {document_id} progress: {document.progress}% - {message}"
-            )
+        started_at = time.time()
+        queue_wait = IngestionScheduler.start(document_id)
+        # per chunk progress goes to redis, the document row is written per stage
+        update_progress = ProgressReporter(document, queue_wait)
 
         # 更新状态为处理中
-        document.parse_status = DocumentParseStatusEnum.PROCESSING
-        document.process_begin_at = datetime.now()
-        db.session.commit()
-
-        parser = FACTORY[parser_type]
-        file_binary = FileService.read_file_binary(file_key)
-
-        chunks = parser.chunk(
-            document.name,
-            binary=file_binary,
-            from_page=0,
-            to_page=100000,
-            parser_config=parser_config,
-            callback=update_progress,
+        update_progress.stage(
+            0.0,
+            "开始处理" if queue_wait is None else f"开始处理，排队 {queue_wait:.0f} 秒",
+            DocumentParseStatusEnum.PROCESSING,
+            process_begin_at=datetime.now(),
         )
 
+        chunks, artifact_keys = parse_chunks(
+            document, file_key, parser_type, parser_config, update_progress
+        )
         if not chunks:
-            update_progress(1.0, "文件解析失败，未找到有效内容")
-            document.parse_status = DocumentParseStatusEnum.FAILED
-            db.session.commit()
+            update_progress.stage(
+                1.0, "文件解析失败，未找到有效内容", DocumentParseStatusEnum.FAILED
+            )
             return
 
-        update_progress(0.3, "文件解析完成，开始嵌入过程")
-
-        # Initialize the embedding model
-        embedding_model = EmbeddingModel(
-            model_name=syntellix_config.EMBEDDING_MODEL_NAME
-        )
-
-        nodes = []
-        total_chunks = len(chunks)
-        print(f"total_chunks: {total_chunks}")
-        
-        # Collect all text content first
-        all_text_content = "\n".join([chunk["content_with_weight"] for chunk in chunks])
-        
-        for i, chunk in enumerate(chunks, 1):
-            text = chunk["content_with_weight"]
-
-            # add contextualized_content with full document context
-            contextualized_content = situate_context(all_text_content, text)
-
-            # Calculate embedding for each text chunk individually
-            vector = embedding_model.encode([f"{text}\n\n{contextualized_content}"])[0]
-
-            node = BaseNode(
-                content=text,
-                contextualized_content=contextualized_content,
-                embedding=vector,
-                metadata={
-                    "file_name": document.name,
-                    "document_id": document_id,
-                    "knowledge_base_id": knowledge_base_id,
-                    "image_id": "",
-                    "created_at": datetime.now(),
-                },
+        update_progress.stage(0.3, "文件解析完成，开始嵌入过程")
+
+        if syntellix_config.INDEXING_PIPELINE_ENABLED:
+            IngestionPipeline.save(document_id, "chunks", chunks)
+            # the parsing workers take the next document while this one goes on
+            IngestionScheduler.release_slot(document_id)
+            contextualize_document.apply_async(
+                (document_id, tenant_id, knowledge_base_id, artifact_keys, time.time()),
+                queue=syntellix_config.INDEXING_PIPELINE_CONTEXT_QUEUE,
             )
+            handed_off = True
+            IngestionPipeline.record("parse", len(chunks), started_at, queue_wait)
+            return
+
+        contexts = contextualize_chunks(chunks, artifact_keys, update_progress)
+        vectors = embed_chunks(chunks, contexts, artifact_keys, update_progress)
+        index_chunks(
+            document, chunks, contexts, vectors, tenant_id, knowledge_base_id, update_progress
+        )
+        IngestionPipeline.record(DOCUMENT_STAGE, len(chunks), started_at)
+
+    except Exception as e:
+        handle_failure(e, document_id, tenant_id, knowledge_base_id, update_progress)
 
-            if chunk.get("image"):
-                try:
-                    output_buffer = BytesIO()
-                    if isinstance(chunk["image"], bytes):
-                        output_buffer.write(chunk["image"])
-                    else:
-                        chunk["image"].save(output_buffer, format="JPEG")
-                    output_buffer.seek(0)
+    finally:
+        if not handed_off:
+            end_processing(document_id)
 
-                    img_id = f"{knowledge_base_id}-{document_id}-{node.node_id}"
-                    image_filename = f"images/{tenant_id}/{img_id}.jpg"
-                    storage.save(image_filename, output_buffer.getvalue())
 
-                    node.metadata["image_id"] = img_id
-                    logger.info(f"Image saved: {image_filename}")
-                except Exception as e:
-                    logger.error(traceback.format_exc())
+@shared_task
+def contextualize_document(
+    document_id, tenant_id, knowledge_base_id, artifact_keys, handed_off_at
+):
+    """
+    The contextualization stage of a parsed document, then the embedding
+    stage.
+    """
+    update_progress = None
+    handed_off = False
+    try:
+        started_at = time.time()
+        document = Document.query.get(document_id)
+        if not document:
+            logger.error(f"Document not found: {document_id}")
+            return
+        IngestionScheduler.resume_lease(document_id)
+        update_progress = ProgressReporter(document)
+        update_progress(None, "开始生成上下文")
 
-            nodes.append(node)
+        chunks = IngestionPipeline.load(document_id, "chunks")
+        contexts = contextualize_chunks(chunks, artifact_keys, update_progress)
+        update_progress.flush()
 
-            # Update progress for embedding process
-            embedding_progress = 0.3 + (i / total_chunks) * 0.6
-            update_progress(embedding_progress, f"嵌入进度: {i}/{total_chunks}")
+        IngestionPipeline.save(document_id, "contexts", contexts)
+        IngestionScheduler.hand_off(document_id)
+        embed_document.apply_async(
+            (document_id, tenant_id, knowledge_base_id, artifact_keys, time.time()),
+            queue=syntellix_config.INDEXING_PIPELINE_EMBED_QUEUE,
+        )
+        handed_off = True
+        IngestionPipeline.record(
+            "contextualize", len(chunks), started_at, started_at - handed_off_at
+        )
 
-        update_progress(0.9, "文件嵌入完成，开始保存嵌入数据")
+    except Exception as e:
+        handle_failure(e, document_id, tenant_id, knowledge_base_id, update_progress)
 
-        vector_service = VectorService(tenant_id)
-        # Add nodes to vector database
-        vector_service.add_nodes(nodes)
+    finally:
+        if not handed_off:
+            end_processing(document_id)
 
-        update_progress(1.0, "处理完成")
-        document.parse_status = DocumentParseStatusEnum.COMPLETED
-        document.chunk_num = total_chunks
-        document.process_duration = (
-            datetime.now() - document.process_begin_at
-        ).total_seconds()
-        db.session.commit()
+
+@shared_task
+def embed_document(
+    document_id, tenant_id, knowledge_base_id, artifact_keys, handed_off_at
+):
+    """
+    The embedding and indexing stage of a contextualized document, its last
+    stage.
+    """
+    update_progress = None
+    try:
+        started_at = time.time()
+        document = Document.query.get(document_id)
+        if not document:
+            logger.error(f"Document not found: {document_id}")
+            return
+        IngestionScheduler.resume_lease(document_id)
+        update_progress = ProgressReporter(document)
+
+        chunks = IngestionPipeline.load(document_id, "chunks")
+        contexts = IngestionPipeline.load(document_id, "contexts")
+        vectors = embed_chunks(chunks, contexts, artifact_keys, update_progress)
+        index_chunks(
+            document, chunks, contexts, vectors, tenant_id, knowledge_base_id, update_progress
+        )
+        IngestionPipeline.record(
+            "embed", len(chunks), started_at, started_at - handed_off_at
+        )
+        IngestionPipeline.record(
+            DOCUMENT_STAGE, len(chunks), document.process_begin_at.timestamp()
+        )
 
     except Exception as e:
-        import traceback
-        logger.error(f"Error processing document {document_id}: {str(e)}")
-        logger.error(traceback.format_exc())
-        document.parse_status = DocumentParseStatusEnum.FAILED
-        document.progress_msg = f"Processing failed: {str(e)}"
-        document.progress = 0
-        db.session.commit()
+        handle_failure(e, document_id, tenant_id, knowledge_base_id, update_progress)
+
+    finally:
+        end_processing(document_id)
@@ -0,0 +1,20 @@
+import logging
+
+from celery import shared_task
+from syntellix_api.services.ingestion_scheduler_service import IngestionScheduler
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def dispatch_ingestion():
+    """
+    Give back the slots of lost documents and dispatch the queued documents
+    the free slots allow, in case no finishing document did.
+    """
+    expired = IngestionScheduler.expire_leases()
+    dispatched = IngestionScheduler.dispatch()
+    if expired or dispatched:
+        logger.info(
+            f"Ingestion dispatch: {len(expired)} expired leases, {dispatched} documents dispatched"
+        )
@@ -0,0 +1,170 @@
+import logging
+from typing import Optional
+
+from celery import shared_task
+from syntellix_api.configs import syntellix_config
+from syntellix_api.extensions.ext_storage import storage
+from syntellix_api.models.account_model import Tenant
+from syntellix_api.models.dataset_model import (
+    Document,
+    DocumentStatusEnum,
+    KnowledgeBase,
+)
+from syntellix_api.rag.vector_database.vector_service import VectorService
+from syntellix_api.services.vector_gc_service import VectorGCService
+
+logger = logging.getLogger(__name__)
+
+# documents per delete job of the orphans found by a reconciliation
+RECONCILE_BATCH_SIZE = 500
+
+
+def _delete_images(
+    tenant_id: int,
+    vector_service: VectorService,
+    knowledge_base_id: int,
+    document_ids: Optional[list] = None,
+    before: Optional[str] = None,
+) -> int:
+    # the images go first, their ids are only known from the chunks
+    deleted = 0
+    for image_id in vector_service.iter_image_ids(
+        str(knowledge_base_id), document_ids, before
+    ):
+        try:
+            storage.delete(f"images/{tenant_id}/{image_id}.jpg")
+            deleted += 1
+        except Exception as e:
+            logger.warning(f"Failed to delete image {image_id}: {str(e)}")
+    return deleted
+
+
+def _collect(
+    tenant_id: int,
+    knowledge_base_id: int,
+    document_ids: Optional[list] = None,
+    before: Optional[str] = None,
+) -> None:
+    vector_service = VectorService(tenant_id)
+    deleted_images = _delete_images(
+        tenant_id, vector_service, knowledge_base_id, document_ids, before
+    )
+    bytes_per_doc = vector_service.bytes_per_doc(str(knowledge_base_id))
+    job = vector_service.delete_async(
+        str(knowledge_base_id),
+        document_ids,
+        before,
+        requests_per_second=syntellix_config.ELASTICSEARCH_GC_REQUESTS_PER_SECOND,
+    )
+    VectorGCService.record(jobs=1, deleted_images=deleted_images)
+    if "task" in job:
+        wait_vector_gc_job.apply_async(
+            (tenant_id, job["task"], bytes_per_doc),
+            countdown=syntellix_config.INDEXING_VECTOR_GC_POLL_INTERVAL,
+        )
+    else:
+        VectorGCService.record(
+            deleted_docs=job["deleted"], reclaimed_bytes=job["bytes"]
+        )
+        logger.info(
+            f"Dropped index of knowledge base {knowledge_base_id}: "
+            f"{job['deleted']} chunks, {job['bytes']} bytes, {deleted_images} images"
+        )
+
+
+@shared_task
+def delete_knowledge_base_vectors(tenant_id, knowledge_base_id):
+    """
+    Purge the chunks and images of a deleted knowledge base.
+    """
+    _collect(tenant_id, knowledge_base_id)
+
+
+@shared_task
+def delete_document_vectors(tenant_id, knowledge_base_id, document_ids, before=None):
+    """
+    Purge the chunks and images of removed documents. With `before`, an ISO
+    timestamp, only chunks indexed before it go, so that a re-processed
+    document keeps its new chunks.
+    """
+    _collect(tenant_id, knowledge_base_id, [str(i) for i in document_ids], before)
+
+
+@shared_task(bind=True, max_retries=None)
+def wait_vector_gc_job(self, tenant_id, task_id, bytes_per_doc):
+    completed, deleted = VectorService(tenant_id).gc_task_status(task_id)
+    if not completed:
+        raise self.retry(countdown=syntellix_config.INDEXING_VECTOR_GC_POLL_INTERVAL)
+    reclaimed_bytes = int(deleted * bytes_per_doc)
+    VectorGCService.record(deleted_docs=deleted, reclaimed_bytes=reclaimed_bytes)
+    logger.info(
+        f"Delete job {task_id} of tenant {tenant_id} done: "
+        f"{deleted} chunks, ~{reclaimed_bytes} bytes"
+    )
+
+
+@shared_task
+def reconcile_vectors(tenant_id=None):
+    """
+    Compare the documents with chunks in the index of each tenant to the
+    documents in the database, and purge the chunks of documents or knowledge
+    bases that no longer exist.
+    """
+    tenant_ids = (
+        [tenant_id]
+        if tenant_id is not None
+        else [tenant.id for tenant in Tenant.query.order_by(Tenant.id).all()]
+    )
+    for tenant_id in tenant_ids:
+        try:
+            _reconcile_tenant(tenant_id)
+        except Exception as e:
+            logger.error(
+                f"Failed to reconcile vectors of tenant {tenant_id}: {str(e)}",
+                exc_info=True,
+            )
+    logger.info(f"Vector GC stats: {VectorGCService.get_stats()}")
+
+
+def _reconcile_tenant(tenant_id: int) -> None:
+    # chunks are read first: a document is in the database before it has
+    # chunks, so one being ingested meanwhile is never taken for an orphan
+    indexed = list(VectorService(tenant_id).iter_document_ids())
+    knowledge_base_ids = {
+        str(kb_id)
+        for (kb_id,) in KnowledgeBase.query.with_entities(KnowledgeBase.id)
+        .filter(KnowledgeBase.tenant_id == tenant_id)
+        .all()
+    }
+    live_documents = {
+        str(doc_id)
+        for (doc_id,) in Document.query.with_entities(Document.id)
+        .filter(
+            Document.tenant_id == tenant_id,
+            Document.status != DocumentStatusEnum.DELETED.value,
+        )
+        .all()
+    }
+
+    orphans: dict[str, list] = {}
+    deleted_knowledge_bases = set()
+    for knowledge_base_id, document_id in indexed:
+        if knowledge_base_id not in knowledge_base_ids:
+            deleted_knowledge_bases.add(knowledge_base_id)
+        elif document_id not in live_documents:
+            orphans.setdefault(knowledge_base_id, []).append(document_id)
+
+    for knowledge_base_id in deleted_knowledge_bases:
+        delete_knowledge_base_vectors.delay(tenant_id, knowledge_base_id)
+    for knowledge_base_id, document_ids in orphans.items():
+        for i in range(0, len(document_ids), RECONCILE_BATCH_SIZE):
+            delete_document_vectors.delay(
+                tenant_id,
+                knowledge_base_id,
+                document_ids[i : i + RECONCILE_BATCH_SIZE],
+            )
+    if deleted_knowledge_bases or orphans:
+        logger.info(
+            f"Tenant {tenant_id}: purging {len(deleted_knowledge_bases)} deleted knowledge bases"
+            f" and {sum(len(ids) for ids in orphans.values())} orphan documents"
+        )